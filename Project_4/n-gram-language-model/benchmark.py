@@ -0,0 +1,307 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Benchmark
+This program measures the language identification pipeline end to end and writes the results as JSON, so runs of
+different versions can be compared: training time, model load time, per-line latency percentiles, throughput, peak
+memory, accuracy and the confusion matrix on test sets made by repeating LangId.test 1, 100 and 10,000 times.
+
+The scaled test sets are written to files and scored by streaming them in batches, so memory use does not grow with the
+scale. Latency is measured on single lines with LanguageScorer.top_k (as a request to the language ID server would
+be), and throughput on batches with compute_log_prob_batch, or with a smoothing engine of smoothing.py (--smoothing).
+
+Training and each scale run in a fresh process of their own, so the peak memory recorded for each (the peak resident
+set size of that process and of its training workers) is its own rather than the peak of the whole run.
+"""
+
+from part1 import train_languages, find_training_files
+from part2 import LanguageScorer, compute_log_prob_batch, MODEL_FILE
+from ngram_model import write_model, load_model
+from smoothing import select_smoothing, SMOOTHING_ENGINES, DEFAULT_SMOOTHING
+from tokenizer import set_default_tokenizer, TOKENIZERS, DEFAULT_TOKENIZER
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import multiprocessing
+import numpy as np
+import subprocess
+import argparse
+import platform
+import resource
+import tempfile
+import json
+import time
+import sys
+import os
+
+# number of lines scored together when measuring throughput
+BATCH_SIZE = 1000
+# number of single lines timed for the latency percentiles
+LATENCY_SAMPLES = 1000
+
+
+def peak_rss_bytes() -> int:
+    """
+    Returns the peak resident set size of this process so far, or of the largest of its finished child processes (such
+    as training workers) if that is larger, in bytes.
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_in_new_process(function, *args):
+    """
+    Calls a function in a new Python process (started fresh, not forked from this one), so the peak memory it measures
+    is only its own.
+    :param function: A module-level function of this module.
+    :param args: The arguments of the function.
+    :return: The result of the function
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def write_scaled_test_set(test_file: str, solution_file: str, scale: int, directory: str) -> tuple[str, str]:
+    """
+    Writes a test file and solution file made of scale copies of a test set, numbering the lines continuously.
+    :param test_file: The file of test lines.
+    :param solution_file: The file of '<line number> <language>' answers.
+    :param scale: The number of copies.
+    :param directory: The directory to write the files to.
+    :return: The paths of the scaled test file and solution file
+    """
+    with open(test_file, 'r', encoding='utf8') as file:
+        lines = [line if line.endswith('\n') else line + '\n' for line in file]
+    with open(solution_file, 'r', encoding='utf8') as file:
+        answers = [line.split()[1] for line in file if line.strip()]
+
+    test_path = os.path.join(directory, os.path.basename(test_file) + '.x' + str(scale))
+    solution_path = os.path.join(directory, os.path.basename(solution_file) + '.x' + str(scale))
+    with open(test_path, 'w', encoding='utf8') as test_out, open(solution_path, 'w', encoding='utf8') as solution_out:
+        number = 1
+        for _ in range(scale):
+            test_out.writelines(lines)
+            for answer in answers:
+                solution_out.write(str(number) + ' ' + answer + '\n')
+                number += 1
+    return test_path, solution_path
+
+
+def confusion_matrix(actual: list[str], predicted: list[str], languages: list[str],
+                     matrix: dict[str, dict[str, int]] = None) -> dict[str, dict[str, int]]:
+    """
+    Counts how often each language was predicted for the lines of each actual language.
+    :param actual: The actual language of each line.
+    :param predicted: The predicted language of each line.
+    :param languages: The languages of the model.
+    :param matrix: A confusion matrix to add the counts to (default: a new one).
+    :return: A dictionary keyed by actual language of dictionaries of counts keyed by predicted language
+    """
+    if matrix is None:
+        matrix = {language: {other: 0 for other in languages} for language in languages}
+    for actual_language, predicted_language in zip(actual, predicted):
+        matrix.setdefault(actual_language, {other: 0 for other in languages})
+        matrix[actual_language][predicted_language] += 1
+    return matrix
+
+
+def evaluate(model, test_path: str, solution_path: str, batch_size: int = BATCH_SIZE, smoothing=None) -> dict:
+    """
+    Streams a test file in batches, identifying the language of every line, and measures throughput and accuracy.
+    :param model: The model holding the counts of each language.
+    :param test_path: The file of test lines.
+    :param solution_path: The file of '<line number> <language>' answers, one per test line.
+    :param batch_size: The number of lines scored together.
+    :param smoothing: A smoothing engine of the model to score with (default: compute_log_prob_batch)
+    :return: A dictionary of the number of lines, the time taken, lines per second, accuracy and the confusion matrix
+    """
+    languages = list(model.languages)
+    vocab_size = sum(len(model.unigrams(language)) for language in languages)
+    matrix = confusion_matrix([], [], languages)
+    total = 0
+    correct = 0
+    seconds = 0
+
+    with open(test_path, 'r', encoding='utf8') as test_file, open(solution_path, 'r', encoding='utf8') as solution_file:
+        while True:
+            lines = list(islice(test_file, batch_size))
+            if not lines:
+                break
+            answers = [line.split()[1] for line in islice(solution_file, len(lines))]
+
+            # only scoring is timed, not reading the files
+            start_time = time.perf_counter()
+            if smoothing is not None:
+                log_probs = smoothing.score_batch(lines)
+            else:
+                log_probs = compute_log_prob_batch(lines, model, vocab_size)
+            predicted = [languages[column] for column in log_probs.argmax(axis=1)]
+            seconds += time.perf_counter() - start_time
+
+            confusion_matrix(answers, predicted, languages, matrix)
+            correct += sum(answer == prediction for answer, prediction in zip(answers, predicted))
+            total += len(lines)
+
+    return {'lines': total,
+            'seconds': seconds,
+            'lines_per_second': total / seconds if seconds > 0 else 0,
+            'accuracy': correct / total if total else 0,
+            'confusion_matrix': matrix}
+
+
+def measure_latency(scorer: LanguageScorer, lines: list[str], samples: int = LATENCY_SAMPLES) -> dict[str, float]:
+    """
+    Times the identification of single lines.
+    :param scorer: The scorer of the model.
+    :param lines: The lines to time (cycled through if fewer than samples).
+    :param samples: The number of lines to time.
+    :return: A dictionary of the mean, 50th, 90th, 99th percentile and largest latency in milliseconds
+    """
+    latencies = np.empty(samples)
+    for i in range(samples):
+        line = lines[i % len(lines)]
+        start_time = time.perf_counter()
+        scorer.top_k(line)
+        latencies[i] = time.perf_counter() - start_time
+    latencies *= 1000
+    return {'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p90_ms': float(np.percentile(latencies, 90)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max())}
+
+
+def code_version() -> str:
+    """
+    Returns the git commit of the code being benchmarked, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def train_model(model_path: str, workers: int, tokenizer: str) -> dict:
+    """
+    Trains a model from the LangId training files and writes it; run in a process of its own by run_benchmark.
+    :param model_path: The path of the model file to write.
+    :param workers: The number of training worker processes.
+    :param tokenizer: The tokenizer to train with.
+    :return: A dictionary of the training time, the size of the model file and the peak memory of training
+    """
+    start_time = time.perf_counter()
+    models, _ = train_languages(find_training_files(), workers, tokenizer=tokenizer)
+    write_model(model_path, models)
+    return {'seconds': time.perf_counter() - start_time,
+            'model_bytes': os.path.getsize(model_path),
+            'peak_rss_bytes': peak_rss_bytes()}
+
+
+def evaluate_scale(model_path: str, test_path: str, solution_path: str, tokenizer: str, smoothing: str) -> dict:
+    """
+    Loads a model and evaluates it on a test set; run in a process of its own for each scale by run_benchmark.
+    :param model_path: The path of the model file.
+    :param test_path: The file of test lines.
+    :param solution_path: The file of '<line number> <language>' answers, one per test line.
+    :param tokenizer: The tokenizer the model was trained with.
+    :param smoothing: The name of the smoothing engine to score with.
+    :return: The results of evaluate and the peak memory of loading the model and scoring the test set
+    """
+    set_default_tokenizer(tokenizer)
+    model = load_model(model_path)
+    engine = select_smoothing(smoothing, model)
+    result = {**evaluate(model, test_path, solution_path, smoothing=engine), 'peak_rss_bytes': peak_rss_bytes()}
+    del engine
+    model.close()
+    return result
+
+
+def run_benchmark(scales: list[int], directory: str, workers: int = 1, tokenizer: str = None,
+                  latency_samples: int = LATENCY_SAMPLES, smoothing: str = DEFAULT_SMOOTHING) -> dict:
+    """
+    Trains a model from the LangId training files, then measures it on test sets of several scales.
+    :param scales: The numbers of copies of LangId.test to score.
+    :param directory: The directory to write the model and the scaled test sets to.
+    :param workers: The number of training worker processes.
+    :param tokenizer: The tokenizer to train and score with ('nltk' or 'fast'; default: the selected tokenizer).
+    :param latency_samples: The number of single lines to time.
+    :param smoothing: The name of the smoothing engine to score with (see smoothing.py).
+    :return: A dictionary of the results, ready to be written as JSON
+    """
+    if tokenizer is not None:
+        set_default_tokenizer(tokenizer)
+    # name the tokenizer explicitly so the new processes use the same one
+    tokenizer = tokenizer or DEFAULT_TOKENIZER
+    results = {'version': code_version(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'tokenizer': tokenizer,
+               'smoothing': smoothing,
+               'workers': workers}
+
+    # training
+    model_path = os.path.join(directory, MODEL_FILE)
+    results['training'] = run_in_new_process(train_model, model_path, workers, tokenizer)
+
+    # loading (mapping the model file and building the scorer's and smoothing engine's tables)
+    start_time = time.perf_counter()
+    model = load_model(model_path)
+    engine = select_smoothing(smoothing, model)
+    scorer = LanguageScorer(model, smoothing=engine)
+    results['load'] = {'seconds': time.perf_counter() - start_time}
+
+    # single line latency
+    with open('LangId.test', 'r', encoding='utf8') as file:
+        test_lines = file.readlines()
+    results['latency'] = measure_latency(scorer, test_lines, latency_samples)
+
+    # throughput, accuracy and memory at each scale
+    results['scales'] = []
+    for scale in scales:
+        test_path, solution_path = write_scaled_test_set('LangId.test', 'LangId.sol', scale, directory)
+        result = {'scale': scale,
+                  **run_in_new_process(evaluate_scale, model_path, test_path, solution_path, tokenizer, smoothing)}
+        results['scales'].append(result)
+        os.remove(test_path)
+        os.remove(solution_path)
+        print('scale {scale}: {lines} lines, {lines_per_second:.0f} lines/s, accuracy {accuracy:.4f}'.format(**result),
+              file=sys.stderr)
+
+    # the scorer's arrays point into the model file, so they are released before it is closed
+    del scorer, engine
+    model.close()
+    return results
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark language identification and write the results as JSON.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100, 10000],
+                        help='numbers of copies of LangId.test to score (default: 1 100 10000)')
+    parser.add_argument('--workers', type=int, default=1, help='number of training worker processes')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=DEFAULT_TOKENIZER,
+                        help='tokenizer to train and score with (default: ' + DEFAULT_TOKENIZER + ')')
+    parser.add_argument('--latency-samples', type=int, default=LATENCY_SAMPLES, help='single lines to time')
+    parser.add_argument('--smoothing', choices=list(SMOOTHING_ENGINES), default=DEFAULT_SMOOTHING,
+                        help='smoothing of the bigram probabilities (default: ' + DEFAULT_SMOOTHING + ')')
+    parser.add_argument('--directory', default=None,
+                        help='directory for the model and scaled test sets (default: a temporary directory)')
+    parser.add_argument('--output', default=None, help='JSON file to write (default: standard output)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        work_directory = args.directory if args.directory is not None else temp_directory
+        os.makedirs(work_directory, exist_ok=True)
+        benchmark = run_benchmark(args.scales, work_directory, args.workers, args.tokenizer, args.latency_samples,
+                                  args.smoothing)
+
+    if args.output is None:
+        print(json.dumps(benchmark, indent=2))
+    else:
+        with open(args.output, 'w', encoding='utf8') as output_file:
+            json.dump(benchmark, output_file, indent=2)
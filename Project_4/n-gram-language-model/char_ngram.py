@@ -0,0 +1,258 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Character N-Grams
+This program identifies languages from character n-grams instead of word bigrams, so that very short lines (which
+have only one or two word bigrams) still give many features, and no word tokenization is needed. It trains from the
+same LangId.train.* files and compares its accuracy and throughput with the word bigram model on LangId.test.
+
+Every line is lowercased, its whitespace collapsed to single spaces and a space added at each end. Each character
+n-gram of orders MIN_ORDER through MAX_ORDER is hashed (with a polynomial rolling hash computed for all positions of
+all lines at once) into one of num_buckets buckets, and each language keeps one vector of bucket counts. A language's
+weight for a bucket is its add-one smoothed log probability, so the score of a line in every language is the product
+of the weight matrix (languages x buckets) with the line's bucket counts.
+"""
+
+from part1 import read_chunks, find_training_files, CHUNK_SIZE
+from part2 import LanguageScorer, compute_log_prob_batch, MODEL_FILE
+from ngram_model import load_model, model_tokenizer
+from tokenizer import set_default_tokenizer, TOKENIZERS
+import numpy as np
+import argparse
+import time
+
+# orders of the character n-grams counted
+MIN_ORDER = 1
+MAX_ORDER = 5
+# number of hash buckets in each language's count vector
+NUM_BUCKETS = 1 << 18
+# multiplier of the rolling hash and of the final bucket mixing (odd 64-bit constants)
+HASH_BASE = np.uint64(0x100000001B3)
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+# character model file written from the training files
+CHAR_MODEL_FILE = 'LangId.char.model'
+
+
+def normalize_line(line: str) -> str:
+    """
+    Lowercases a line, collapses its whitespace and pads it with a space at each end.
+    :param line: The line of text.
+    :return: The normalized line
+    """
+    return ' ' + ' '.join(line.lower().split()) + ' '
+
+
+def char_ngram_buckets(lines: list[str], num_buckets: int = NUM_BUCKETS, min_order: int = MIN_ORDER,
+                       max_order: int = MAX_ORDER):
+    """
+    Hashes the character n-grams of several lines into buckets, without n-grams crossing from one line into the next.
+    :param lines: The lines of text.
+    :param num_buckets: The number of hash buckets (a power of two).
+    :param min_order: The shortest n-gram length.
+    :param max_order: The longest n-gram length.
+    :return: The bucket of every n-gram of every line and the index of the line each n-gram belongs to
+    """
+    if num_buckets <= 0 or num_buckets & (num_buckets - 1):
+        raise ValueError('number of buckets must be a power of two, not ' + str(num_buckets))
+
+    lines = [normalize_line(line) for line in lines]
+    codes = np.frombuffer(''.join(lines).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    line_of_char = np.repeat(np.arange(len(lines)), [len(line) for line in lines])
+    shift = np.uint64(64 - int(num_buckets).bit_length() + 1)
+
+    buckets = []
+    line_index = []
+    # extend the hash of every position by one character per order
+    hashes = np.zeros(len(codes), dtype=np.uint64)
+    for order in range(1, max_order + 1):
+        count = len(codes) - order + 1
+        if count <= 0:
+            break
+        hashes = hashes[:count] * HASH_BASE + codes[order - 1:]
+        if order < min_order:
+            continue
+        # keep the n-grams that start and end in the same line
+        same_line = line_of_char[:count] == line_of_char[order - 1:]
+        # mix the order in so that n-grams of different lengths fall in different buckets
+        mixed = (hashes[same_line] ^ np.uint64(order)) * HASH_MIX
+        buckets.append((mixed >> shift).astype(np.int64))
+        line_index.append(line_of_char[:count][same_line])
+
+    if not buckets:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(buckets), np.concatenate(line_index)
+
+
+def count_char_ngrams(filepath: str, num_buckets: int = NUM_BUCKETS, chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+    """
+    Counts the hashed character n-grams of a training file, streaming it in chunks of lines.
+    :param filepath: The path to the training file.
+    :param num_buckets: The number of hash buckets (a power of two).
+    :param chunk_size: The number of characters of the file to hash at a time.
+    :return: An array of the count of each bucket
+    """
+    counts = np.zeros(num_buckets, dtype=np.int64)
+    with open(filepath, 'r', encoding='utf8') as file:
+        for chunk in read_chunks(file, chunk_size):
+            buckets, _ = char_ngram_buckets(chunk.splitlines(), num_buckets)
+            counts += np.bincount(buckets, minlength=num_buckets)
+    return counts
+
+
+class CharNGramModel:
+    """
+    Hashed character n-gram language identification: one smoothed log probability vector per language.
+    """
+
+    def __init__(self, counts: dict[str, np.ndarray]):
+        """
+        Builds the weight matrix of the languages from their bucket counts.
+        :param counts: The bucket counts of each language (from count_char_ngrams), all of the same length.
+        """
+        self.languages = list(counts)
+        self.counts = np.array([counts[language] for language in self.languages])
+        self.num_buckets = self.counts.shape[1]
+        # add-one smoothed log probability of each bucket in each language
+        totals = self.counts.sum(axis=1, keepdims=True)
+        self.weights = np.log2((self.counts + 1) / (totals + self.num_buckets))
+
+    def score_batch(self, lines: list[str]) -> np.ndarray:
+        """
+        Computes the log probability of several lines for every language.
+        :param lines: The lines of text.
+        :return: A (lines x languages) array of log probabilities, with languages in the order of self.languages
+        """
+        if not lines:
+            return np.zeros((0, len(self.languages)))
+        buckets, line_index = char_ngram_buckets(lines, self.num_buckets)
+        # group the n-grams by line; every line has at least the unigram of its padding space
+        order = np.argsort(line_index, kind='stable')
+        starts = np.searchsorted(line_index[order], np.arange(len(lines)))
+        # summing the weights of each line's n-grams is the dot product of the weights with the line's bucket counts
+        return np.add.reduceat(self.weights[:, buckets[order]], starts, axis=1).T
+
+    def score(self, text: str) -> dict[str, float]:
+        """
+        Computes the log probability of text in every language.
+        :param text: The text to score.
+        :return: A dictionary of log probabilities keyed by language
+        """
+        buckets, _ = char_ngram_buckets([text], self.num_buckets)
+        return dict(zip(self.languages, self.weights[:, buckets].sum(axis=1).tolist()))
+
+    def rank(self, text: str) -> list[tuple[str, float]]:
+        """
+        Ranks the languages by the log probability of the text; ties keep the order of the languages.
+        :param text: The text to score.
+        :return: A list of (language, log probability) pairs from most to least probable
+        """
+        return sorted(self.score(text).items(), key=lambda item: item[1], reverse=True)
+
+
+def train_char_model(training_files: dict[str, str], num_buckets: int = NUM_BUCKETS) -> CharNGramModel:
+    """
+    Trains a character n-gram model from training files.
+    :param training_files: A dictionary of training file paths keyed by language name.
+    :param num_buckets: The number of hash buckets (a power of two).
+    :return: The trained model
+    """
+    return CharNGramModel({language: count_char_ngrams(path, num_buckets) for language, path in training_files.items()})
+
+
+def write_char_model(filepath: str, model: CharNGramModel):
+    """
+    Writes the bucket counts of a character n-gram model to a file.
+    :param filepath: The path of the file to write.
+    :param model: The model to write.
+    """
+    with open(filepath, 'wb') as file:
+        np.savez(file, languages=np.array(model.languages), counts=model.counts)
+
+
+def load_char_model(filepath: str) -> CharNGramModel:
+    """
+    Reads a character n-gram model written by write_char_model.
+    :param filepath: The path of the model file.
+    :return: The model
+    """
+    with np.load(filepath) as data:
+        return CharNGramModel(dict(zip(data['languages'].tolist(), data['counts'])))
+
+
+def compare(char_model: CharNGramModel, word_model_filepath: str, lines: list[str], answers: list[str],
+            prefix_words: list[int], tokenizer: str = None) -> list[dict]:
+    """
+    Measures the accuracy and throughput of the character model and of the word bigram model of part 2 on test lines,
+    and their accuracy on prefixes of the lines of a few words (to imitate short inputs).
+    :param char_model: The character n-gram model.
+    :param word_model_filepath: The path of the word bigram model file.
+    :param lines: The test lines.
+    :param answers: The language of each test line.
+    :param prefix_words: The numbers of words to cut the lines to for the short input accuracy.
+    :param tokenizer: The tokenizer the word model was trained with (default: the one in the model's manifest; a
+    different one is an error).
+    :return: A list of the measurements of each method
+    """
+    # the word model is scored with the tokenizer it was trained with
+    set_default_tokenizer(model_tokenizer(word_model_filepath, tokenizer))
+    word_model = load_model(word_model_filepath)
+    scorer = LanguageScorer(word_model)
+    languages = list(word_model.languages)
+    results = []
+
+    def accuracy(log_probs: np.ndarray, method_languages: list[str]) -> float:
+        predicted = [method_languages[int(row.argmax())] for row in log_probs]
+        return sum(p == a for p, a in zip(predicted, answers)) / len(answers)
+
+    methods = [('word bigrams, per line', languages,
+                lambda batch: np.array([[scorer.score(line)[language] for language in languages] for line in batch])),
+               ('word bigrams, batch', languages,
+                lambda batch: compute_log_prob_batch(batch, word_model, scorer.vocab_size)),
+               ('char n-grams, per line', char_model.languages,
+                lambda batch: np.array([list(char_model.score(line).values()) for line in batch])),
+               ('char n-grams, batch', char_model.languages, char_model.score_batch)]
+
+    for method, method_languages, score_lines in methods:
+        start_time = time.perf_counter()
+        log_probs = score_lines(lines)
+        seconds = time.perf_counter() - start_time
+        result = {'method': method, 'accuracy': accuracy(log_probs, method_languages),
+                  'lines_per_second': len(lines) / seconds}
+        for words in prefix_words:
+            short_lines = [' '.join(line.split()[:words]) for line in lines]
+            result[str(words) + ' words'] = accuracy(score_lines(short_lines), method_languages)
+        results.append(result)
+
+    return results
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train a character n-gram model and compare it with the word model.')
+    parser.add_argument('--buckets', type=int, default=NUM_BUCKETS, help='hash buckets per language (a power of two)')
+    parser.add_argument('--output', default=CHAR_MODEL_FILE, help='character model file (default: ' + CHAR_MODEL_FILE + ')')
+    parser.add_argument('--model', default=MODEL_FILE, help='word model file to compare with (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=None,
+                        help='tokenizer the word model was trained with (default: the one in the model\'s manifest)')
+    args = parser.parse_args()
+
+    # train the character model and save it
+    start = time.perf_counter()
+    trained = train_char_model(find_training_files(), args.buckets)
+    print('Trained in {0:.2f} s'.format(time.perf_counter() - start))
+    print('Output file:', args.output)
+    write_char_model(args.output, trained)
+
+    with open('LangId.test', 'r', encoding='utf8') as test_file:
+        test_lines = test_file.readlines()
+    with open('LangId.sol', 'r', encoding='utf8') as solution_file:
+        test_answers = [line.split()[1] for line in solution_file if line.strip()]
+
+    # compare with the word model on full lines and on their first few words
+    prefixes = [1, 2, 3, 5]
+    print('method\t\t\t\taccuracy\tlines/s\t\t' + '\t'.join(str(n) + ' words' for n in prefixes))
+    for row in compare(load_char_model(args.output), args.model, test_lines, test_answers, prefixes, args.tokenizer):
+        print('{0:<24}\t{1:.4f}\t\t{2:.0f}\t\t'.format(row['method'], row['accuracy'], row['lines_per_second'])
+              + '\t'.join('{0:.4f}'.format(row[str(n) + ' words']) for n in prefixes))
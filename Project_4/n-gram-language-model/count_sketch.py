@@ -0,0 +1,367 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Count Sketch
+This program trains language models whose bigram counts are kept approximately in Count-Min sketches of a fixed size,
+so that training memory does not grow with the number of distinct bigrams, and reports how accuracy on LangId.test
+changes with the size of the sketches. Unigram counts are kept exactly.
+
+A Count-Min sketch is depth rows of width counters; a bigram is added to one counter in each row (chosen by hashing)
+and its count is estimated as the smallest of its counters. The estimate is never below the true count, and with
+conservative update (only raising the counters that are at the current estimate) it is usually much closer.
+Error bound: for a sketch holding N bigrams in total, an estimate exceeds the true count by more than e * N / width
+with probability at most exp(-depth).
+
+The counters are unsigned 32-bit integers and saturate at COUNTER_MAX (2**32 - 1) instead of overflowing, so a bigram
+seen more than about four billion times is estimated as COUNTER_MAX; the sketch's total is an exact Python integer.
+"""
+
+from part1 import read_chunks, tokenize_text, find_training_files, CHUNK_SIZE
+from part2 import compute_log_prob, compute_log_prob_batch
+from ngram_model import write_model, load_model, NGramModel
+from collections import Counter
+from array import array
+import numpy as np
+import tracemalloc
+import argparse
+import struct
+import zlib
+import math
+import time
+import os
+
+# default sketch shape
+SKETCH_WIDTH = 1 << 16
+SKETCH_DEPTH = 4
+# sketch file signature
+MAGIC = b'CMSKETCH'
+# magic, number of languages
+HEADER = struct.Struct('<8sI4x')
+# name length, width, depth, total count
+SKETCH_HEADER = struct.Struct('<IIIQ4x')
+# seed of the second hash used to pick the counter in each row
+SECOND_SEED = 0x9E3779B9
+# largest value of a counter (the table holds unsigned 32-bit integers)
+COUNTER_MAX = (1 << 32) - 1
+
+
+class CountMinSketch:
+    """
+    Approximate counts of bigrams in a fixed-size Count-Min sketch.
+    Supports the dictionary operations used by compute_log_prob ('in', [] and get), so a sketch can be scored in place
+    of a bigram dictionary, and estimate_batch for the bigram keys of compute_log_prob_batch.
+    """
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, conservative: bool = True):
+        """
+        Creates an empty sketch.
+        :param width: The number of counters in each row.
+        :param depth: The number of rows.
+        :param conservative: Whether to only raise the counters at the current estimate when adding (conservative update)
+        """
+        self.width = width
+        self.depth = depth
+        self.conservative = conservative
+        self.table = array('I', bytes(4 * width * depth))
+        self.total = 0
+
+    def cells(self, bigram: tuple[str, str]) -> list[int]:
+        """
+        Finds the counter of a bigram in each row by double hashing.
+        :param bigram: The bigram.
+        :return: The index of the bigram's counter in the table for each row
+        """
+        data = (bigram[0] + '\0' + bigram[1]).encode('utf8')
+        first_hash = zlib.crc32(data)
+        second_hash = zlib.crc32(data, SECOND_SEED) | 1
+        return [row * self.width + (first_hash + row * second_hash) % self.width for row in range(self.depth)]
+
+    def add(self, bigram: tuple[str, str], count: int = 1):
+        """
+        Adds occurrences of a bigram; counters that would pass COUNTER_MAX stay at COUNTER_MAX.
+        :param bigram: The bigram.
+        :param count: The number of occurrences to add.
+        """
+        cells = self.cells(bigram)
+        self.total += count
+        if self.conservative:
+            # raise every counter to at least the new estimate, leaving the larger ones alone
+            estimate = min(min(self.table[cell] for cell in cells) + count, COUNTER_MAX)
+            for cell in cells:
+                if self.table[cell] < estimate:
+                    self.table[cell] = estimate
+        else:
+            for cell in cells:
+                self.table[cell] = min(self.table[cell] + count, COUNTER_MAX)
+
+    def estimate(self, bigram: tuple[str, str]) -> int:
+        """
+        Estimates the count of a bigram (never less than its true count).
+        :param bigram: The bigram.
+        :return: The estimated count
+        """
+        return min(self.table[cell] for cell in self.cells(bigram))
+
+    def estimate_batch(self, keys: np.ndarray, model: NGramModel) -> np.ndarray:
+        """
+        Estimates the counts of many bigrams given as keys of a model's vocabulary (from bigram_batch of part2.py).
+        Each distinct bigram is hashed once, and the counters of all of them are read and compared with numpy.
+        Bigrams with a token outside the vocabulary were never seen in training and are given a count of 0 rather than
+        an estimate, which can only be an overestimate.
+        :param keys: The bigram keys (-1 for bigrams with a token not in the vocabulary).
+        :param model: The model whose vocabulary the keys refer to.
+        :return: An int64 array of the estimated count of each bigram
+        """
+        distinct, inverse = np.unique(keys, return_inverse=True)
+        known = distinct[distinct >= 0]
+        estimates = np.zeros(len(distinct), dtype=np.int64)
+        if len(known) == 0:
+            return estimates[inverse.reshape(-1)]
+
+        # hash each distinct bigram as cells does, looking up each token's text once
+        tokens = {}
+        first_hashes = np.empty(len(known), dtype=np.int64)
+        second_hashes = np.empty(len(known), dtype=np.int64)
+        for i, key in enumerate(known.tolist()):
+            first, second = key >> 32, key & 0xFFFFFFFF
+            for token_id in (first, second):
+                if token_id not in tokens:
+                    tokens[token_id] = model.token(token_id)
+            data = (tokens[first] + '\0' + tokens[second]).encode('utf8')
+            first_hashes[i] = zlib.crc32(data)
+            second_hashes[i] = zlib.crc32(data, SECOND_SEED) | 1
+
+        # the counter of each bigram in each row, and the smallest of them
+        rows = np.arange(self.depth, dtype=np.int64)
+        cells = rows * self.width + (first_hashes[:, None] + rows * second_hashes[:, None]) % self.width
+        table = np.frombuffer(self.table, dtype=np.uint32)
+        estimates[len(distinct) - len(known):] = table[cells].min(axis=1)
+        return estimates[inverse.reshape(-1)]
+
+    def __contains__(self, bigram: tuple[str, str]) -> bool:
+        return self.estimate(bigram) > 0
+
+    def __getitem__(self, bigram: tuple[str, str]) -> int:
+        return self.estimate(bigram)
+
+    def get(self, bigram: tuple[str, str], default: int = 0) -> int:
+        estimate = self.estimate(bigram)
+        return estimate if estimate > 0 else default
+
+    def error_bound(self) -> float:
+        """
+        Returns the overestimate that an estimate exceeds with probability at most failure_probability().
+        """
+        return math.e * self.total / self.width
+
+    def failure_probability(self) -> float:
+        """
+        Returns the probability that an estimate exceeds its true count by more than error_bound().
+        """
+        return math.exp(-self.depth)
+
+    def memory_bytes(self) -> int:
+        """
+        Returns the number of bytes used by the sketch's counters.
+        """
+        return len(self.table) * self.table.itemsize
+
+
+def count_unigrams_and_sketch(filepath: str, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH,
+                              chunk_size: int = CHUNK_SIZE):
+    """
+    Counts the unigrams of a training file exactly and its bigrams approximately, streaming the file in chunks.
+    :param filepath: The path to the training file.
+    :param width: The number of counters in each row of the sketch.
+    :param depth: The number of rows of the sketch.
+    :param chunk_size: The number of characters of the file to tokenize at a time.
+    :return: A dictionary of unigram counts and a CountMinSketch of bigram counts
+    """
+    unigram_count = Counter()
+    sketch = CountMinSketch(width, depth)
+
+    with open(filepath, 'r', encoding='utf8') as file:
+        previous = None
+        for chunk in read_chunks(file, chunk_size):
+            unigrams = tokenize_text(chunk)
+            unigram_count.update(unigrams)
+            for token in unigrams:
+                if previous is not None:
+                    sketch.add((previous, token))
+                previous = token
+
+    return dict(unigram_count), sketch
+
+
+def write_sketches(filepath: str, sketches: dict[str, CountMinSketch]):
+    """
+    Writes the bigram sketches of several languages to a file.
+    :param filepath: The path of the file to write.
+    :param sketches: The sketches keyed by language name.
+    """
+    temp_filepath = filepath + '.tmp'
+    with open(temp_filepath, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, len(sketches)))
+        for language, sketch in sketches.items():
+            name = language.encode('utf8')
+            file.write(SKETCH_HEADER.pack(len(name), sketch.width, sketch.depth, sketch.total))
+            file.write(name + b'\0' * (-len(name) % 8))
+            file.write(sketch.table.tobytes())
+    os.replace(temp_filepath, filepath)
+
+
+def load_sketches(filepath: str) -> dict[str, CountMinSketch]:
+    """
+    Reads the bigram sketches written by write_sketches.
+    :param filepath: The path of the sketch file.
+    :return: The sketches keyed by language name
+    """
+    sketches = {}
+    with open(filepath, 'rb') as file:
+        magic, num_languages = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(filepath + ' is not a sketch file')
+        for _ in range(num_languages):
+            name_length, width, depth, total = SKETCH_HEADER.unpack(file.read(SKETCH_HEADER.size))
+            language = file.read(name_length + (-name_length % 8))[:name_length].decode('utf8')
+            sketch = CountMinSketch(width, depth)
+            sketch.table = array('I')
+            sketch.table.frombytes(file.read(4 * width * depth))
+            sketch.total = total
+            sketches[language] = sketch
+    return sketches
+
+
+def load_approximate_models(model_filepath: str, sketch_filepath: str) -> dict:
+    """
+    Loads the exact unigram counts and approximate bigram counts of every language for compute_log_prob.
+    :param model_filepath: The model file holding the unigram counts.
+    :param sketch_filepath: The sketch file holding the bigram sketches.
+    :return: A dictionary of (unigram counts, bigram sketch) keyed by language
+    """
+    model = load_model(model_filepath)
+    sketches = load_sketches(sketch_filepath)
+    return {language: (model.unigrams(language), sketches[language]) for language in model.languages}
+
+
+def accuracy(models: dict, vocab_size: int, test_file: str = 'LangId.test', solution_file: str = 'LangId.sol') -> float:
+    """
+    Computes the accuracy of compute_log_prob with the given unigram and bigram counts on a test file.
+    :param models: A dictionary of (unigram counts, bigram counts) keyed by language.
+    :param vocab_size: The total number of unique words in all training dictionaries.
+    :param test_file: The file of lines to identify.
+    :param solution_file: The file of '<line number> <language>' answers.
+    :return: The fraction of lines identified correctly
+    """
+    with open(test_file, 'r', encoding='utf8') as file:
+        lines = file.readlines()
+    with open(solution_file, 'r', encoding='utf8') as file:
+        answers = [line.split()[1] for line in file if line.strip()]
+
+    correct = 0
+    for line, actual in zip(lines, answers):
+        scores = {language: compute_log_prob(line, unigrams, bigrams, vocab_size)
+                  for language, (unigrams, bigrams) in models.items()}
+        if max(scores, key=scores.get) == actual:
+            correct += 1
+    return correct / len(answers)
+
+
+def batch_accuracy(model: NGramModel, sketches: dict[str, CountMinSketch], vocab_size: int,
+                   test_file: str = 'LangId.test', solution_file: str = 'LangId.sol') -> float:
+    """
+    Computes the accuracy of compute_log_prob_batch with a model's unigram counts and bigram sketches on a test file.
+    :param model: The model holding the exact unigram counts.
+    :param sketches: The bigram sketches keyed by language.
+    :param vocab_size: The total number of unique words in all training dictionaries.
+    :param test_file: The file of lines to identify.
+    :param solution_file: The file of '<line number> <language>' answers.
+    :return: The fraction of lines identified correctly
+    """
+    with open(test_file, 'r', encoding='utf8') as file:
+        lines = file.readlines()
+    with open(solution_file, 'r', encoding='utf8') as file:
+        answers = [line.split()[1] for line in file if line.strip()]
+
+    log_probs = compute_log_prob_batch(lines[:len(answers)], model, vocab_size, sketches)
+    predictions = [model.languages[column] for column in log_probs.argmax(axis=1)]
+    return sum(predicted == actual for predicted, actual in zip(predictions, answers)) / len(answers)
+
+
+def report(widths: list[int], depths: list[int]):
+    """
+    Prints the memory and accuracy of sketches of several sizes next to those of exact bigram dictionaries.
+    :param widths: The sketch widths to try.
+    :param depths: The sketch depths to try.
+    """
+    # tokenize each training file once
+    tokens = {}
+    for language, path in find_training_files().items():
+        with open(path, 'r', encoding='utf8') as file:
+            tokens[language] = [token for chunk in read_chunks(file) for token in tokenize_text(chunk)]
+    unigrams = {language: dict(Counter(unigram_list)) for language, unigram_list in tokens.items()}
+    vocab_size = sum(len(unigram_dict) for unigram_dict in unigrams.values())
+
+    # exact bigram counts for reference, measuring the memory allocated for the dictionaries
+    tracemalloc.start()
+    exact = {language: (unigrams[language], dict(Counter(zip(unigram_list, unigram_list[1:]))))
+             for language, unigram_list in tokens.items()}
+    exact_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    exact_bigrams = sum(len(bigram_dict) for _, bigram_dict in exact.values())
+    print('bigrams\twidth\tdepth\tbytes\terror bound\taccuracy')
+    print('{0}\texact\t-\t{1}\t0\t{2:.4f}'.format(exact_bigrams, exact_memory, accuracy(exact, vocab_size)))
+
+    for depth in depths:
+        for width in widths:
+            models = {}
+            for language, unigram_list in tokens.items():
+                sketch = CountMinSketch(width, depth)
+                for bigram in zip(unigram_list, unigram_list[1:]):
+                    sketch.add(bigram)
+                models[language] = (unigrams[language], sketch)
+            memory = sum(sketch.memory_bytes() for _, sketch in models.values())
+            bound = max(sketch.error_bound() for _, sketch in models.values())
+            print('{0}\t{1}\t{2}\t{3}\t{4:.1f}\t{5:.4f}'.format(
+                exact_bigrams, width, depth, memory, bound, accuracy(models, vocab_size)))
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train approximate bigram models in Count-Min sketches.')
+    parser.add_argument('--width', type=int, default=SKETCH_WIDTH, help='counters per sketch row')
+    parser.add_argument('--depth', type=int, default=SKETCH_DEPTH, help='sketch rows')
+    parser.add_argument('--output', default='LangId.sketch.model',
+                        help='model file for the exact unigram counts (the sketches are written to <output>.cms)')
+    parser.add_argument('--report', action='store_true', help='print accuracy against memory for several sizes')
+    args = parser.parse_args()
+
+    if args.report:
+        report([1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18], [2, 4])
+    else:
+        # train each language with an exact unigram count and a bigram sketch
+        unigram_models = {}
+        bigram_sketches = {}
+        for name, training_file in find_training_files().items():
+            print('Input file:', training_file)
+            unigram_models[name], bigram_sketches[name] = count_unigrams_and_sketch(training_file, args.width,
+                                                                                    args.depth)
+            print('Error bound: {0:.1f} with probability {1:.3f}'.format(
+                bigram_sketches[name].error_bound(), 1 - bigram_sketches[name].failure_probability()))
+
+        print('Output files:', args.output, args.output + '.cms')
+        write_model(args.output, {name: (unigram_dict, {}) for name, unigram_dict in unigram_models.items()})
+        write_sketches(args.output + '.cms', bigram_sketches)
+
+        # score the test file with the approximate models, line by line and in one batch
+        approximate = load_approximate_models(args.output, args.output + '.cms')
+        total_vocab_size = sum(len(unigram_dict) for unigram_dict, _ in approximate.values())
+        start = time.perf_counter()
+        print('Total accuracy: ' + str(accuracy(approximate, total_vocab_size)))
+        print('Line by line: {0:.2f} s'.format(time.perf_counter() - start))
+        start = time.perf_counter()
+        print('Batch accuracy: ' + str(batch_accuracy(load_model(args.output), load_sketches(args.output + '.cms'),
+                                                      total_vocab_size)))
+        print('Batch: {0:.2f} s'.format(time.perf_counter() - start))
@@ -0,0 +1,360 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Language ID Server
+This program keeps the language model loaded and identifies the language of lines sent to it over a local socket or
+standard input, using the batch scoring of part 2. Requests that arrive close together are scored as one batch.
+
+Protocol (JSON lines): each request is a line holding a JSON object {"id": <any>, "text": <string>} (or just a JSON
+string), and each response is a line {"id": <id>, "language": <string>, "scores": {<language>: <log probability>}},
+or {"id": <id>, "error": <string>} for a request that could not be read. Responses on a connection are written in the
+order of its requests.
+"""
+
+from part2 import compute_log_prob_batch, LanguageScorer, MODEL_FILE
+from ngram_model import load_model, model_tokenizer, NGramModel
+from smoothing import select_smoothing, SMOOTHING_ENGINES, DEFAULT_SMOOTHING
+from count_sketch import load_sketches
+from tokenizer import set_default_tokenizer, TOKENIZERS
+from collections import deque
+import argparse
+import asyncio
+import json
+import stat
+import sys
+import os
+
+# largest number of lines scored together
+MAX_BATCH_SIZE = 256
+# longest time (in seconds) a request waits for others to join its batch
+MAX_LATENCY = 0.0005
+# longest request line (in bytes); a longer line is skipped and answered with an error
+MAX_REQUEST_SIZE = 1024 * 1024
+
+
+class MicroBatcher:
+    """
+    Collects lines from concurrent requests and scores them in batches.
+    """
+
+    def __init__(self, model: NGramModel, max_batch_size: int = MAX_BATCH_SIZE, max_latency: float = MAX_LATENCY,
+                 smoothing=None, sketches: dict = None):
+        """
+        Creates a batcher for the languages of a model.
+        :param model: The model holding the counts of each language.
+        :param max_batch_size: The largest number of lines scored together.
+        :param max_latency: The longest time (in seconds) to wait for more lines once a line is waiting.
+        :param smoothing: A smoothing engine of the model (see smoothing.py) to score with (default: Laplace smoothing)
+        :param sketches: Approximate bigram counts keyed by language (see count_sketch.py) to score with instead of the
+        model's bigram counts (default: the model's exact counts)
+        """
+        self.model = model
+        self.languages = model.languages
+        self.smoothing = smoothing
+        self.sketches = sketches
+        self.scorer = LanguageScorer(model, smoothing=smoothing, sketches=sketches)
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = asyncio.Queue()
+
+    def submit(self, text: str) -> asyncio.Future:
+        """
+        Queues a line for the next batch.
+        :param text: The line to identify.
+        :return: A future of a dictionary of the predicted language and the score of every language
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return future
+
+    async def run(self):
+        """
+        Scores batches of queued lines until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for a line, then take every line that is already waiting
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # under load (other lines were already waiting), give more requests up to the latency budget to join
+            # the batch; a lone line is scored at once
+            deadline = loop.time() + self.max_latency
+            while 1 < len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self.score(batch)
+
+    def score(self, batch: list[tuple[str, asyncio.Future]]):
+        """
+        Scores a batch of lines and delivers each result to its waiting request.
+        Scoring runs on the event loop; the batch size bounds how long it holds the loop.
+        A single line is scored by the LanguageScorer, which has less overhead than the vectorized batch scoring.
+        :param batch: The (line, future) pairs of the batch.
+        """
+        try:
+            if len(batch) == 1:
+                log_probs = [[self.scorer.score(batch[0][0])[language] for language in self.languages]]
+            elif self.smoothing is not None:
+                log_probs = self.smoothing.score_batch([text for text, _ in batch])
+            else:
+                log_probs = compute_log_prob_batch([text for text, _ in batch], self.model, self.scorer.vocab_size,
+                                                   self.sketches)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for row, (_, future) in zip(log_probs, batch):
+            if future.done():
+                continue
+            scores = {language: float(score) for language, score in zip(self.languages, row)}
+            future.set_result({'language': max(scores, key=scores.get), 'scores': scores})
+
+
+async def read_request(reader: asyncio.StreamReader) -> bytes:
+    """
+    Reads a request line; a line longer than the reader's limit is skipped.
+    :param reader: The stream to read from.
+    :return: The line (empty at the end of the stream)
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as error:
+        # the last line may not end with a newline
+        return error.partial
+    except asyncio.LimitOverrunError as error:
+        overrun = error
+    # discard the line up to its newline (or the end of the stream), so the next request is read whole
+    while True:
+        try:
+            await reader.readexactly(overrun.consumed)
+            await reader.readuntil(b'\n')
+            break
+        except asyncio.LimitOverrunError as error:
+            overrun = error
+        except asyncio.IncompleteReadError:
+            break
+    raise ValueError('request line longer than {0} bytes'.format(MAX_REQUEST_SIZE))
+
+
+def parse_request(line: bytes) -> tuple:
+    """
+    Reads the id and text of a request line.
+    :param line: The JSON line of the request.
+    :return: The id (None if not given) and text of the request
+    """
+    return request_fields(json.loads(line))
+
+
+def request_fields(request) -> tuple:
+    """
+    Reads the id and text of a decoded request.
+    :param request: The decoded JSON request.
+    :return: The id (None if not given) and text of the request
+    """
+    if isinstance(request, str):
+        return None, request
+    if not isinstance(request, dict) or not isinstance(request.get('text'), str):
+        raise ValueError('request must be a JSON string or an object with a "text" string')
+    return request.get('id'), request['text']
+
+
+async def answer(request_id, future: asyncio.Future) -> dict:
+    """
+    Waits for the result of a request.
+    :param request_id: The id of the request.
+    :param future: The future of the request's result.
+    :return: The response to the request
+    """
+    try:
+        response = await future
+    except Exception as error:
+        return {'id': request_id, 'error': str(error)}
+    return {'id': request_id, **response}
+
+
+async def serve_stream(batcher: MicroBatcher, read, write):
+    """
+    Answers the requests read from a stream, writing the responses in request order.
+    Requests are queued as soon as they are read so that pipelined requests are scored in the same batch.
+    :param batcher: The batcher that scores the lines.
+    :param read: A coroutine function that reads a request line (empty at the end of the stream), and raises
+    ValueError for a line too long to read.
+    :param write: A coroutine function that writes a response line.
+    """
+    pending = deque()
+    more = asyncio.Event()
+    done = False
+
+    async def write_responses():
+        # write each response once it and all responses before it are ready
+        while pending or not done:
+            if not pending:
+                more.clear()
+                await more.wait()
+                continue
+            request_id, future = pending.popleft()
+            if isinstance(future, dict):
+                response = future
+            else:
+                response = await answer(request_id, future)
+            await write((json.dumps(response) + '\n').encode('utf8'))
+
+    writer_task = asyncio.create_task(write_responses())
+    try:
+        while True:
+            # queue the request, or answer it with an error at once if it can't be read
+            request_id = None
+            try:
+                line = await read()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                # the id is taken first, so that an invalid request's error still carries it
+                if isinstance(request, dict):
+                    request_id = request.get('id')
+                request_id, text = request_fields(request)
+                pending.append((request_id, batcher.submit(text)))
+            except (ValueError, UnicodeDecodeError) as error:
+                pending.append((request_id, {'id': request_id, 'error': str(error)}))
+            more.set()
+    finally:
+        done = True
+        more.set()
+        await writer_task
+
+
+async def serve_connection(batcher: MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Answers the requests of one socket connection.
+    :param batcher: The batcher that scores the lines.
+    :param reader: The connection's reader.
+    :param writer: The connection's writer.
+    """
+    async def write(data: bytes):
+        writer.write(data)
+        await writer.drain()
+
+    try:
+        await serve_stream(batcher, lambda: read_request(reader), write)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_stdin(batcher: MicroBatcher):
+    """
+    Answers requests read from standard input on standard output until the input ends.
+    :param batcher: The batcher that scores the lines.
+    """
+    loop = asyncio.get_running_loop()
+    mode = os.fstat(sys.stdin.fileno()).st_mode
+    if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode):
+        reader = asyncio.StreamReader(limit=MAX_REQUEST_SIZE)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        def read():
+            return read_request(reader)
+    else:
+        # a regular file (python langid_server.py < requests) can't be watched by the event loop; read it in a thread
+        def read_line() -> bytes:
+            line = sys.stdin.buffer.readline(MAX_REQUEST_SIZE + 1)
+            if len(line) > MAX_REQUEST_SIZE and not line.endswith(b'\n'):
+                # skip the rest of the line
+                while line and not line.endswith(b'\n'):
+                    line = sys.stdin.buffer.readline(MAX_REQUEST_SIZE)
+                raise ValueError('request line longer than {0} bytes'.format(MAX_REQUEST_SIZE))
+            return line
+
+        async def read():
+            return await loop.run_in_executor(None, read_line)
+
+    async def write(data: bytes):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    await serve_stream(batcher, read, write)
+
+
+async def main(args):
+    """
+    Loads the model once and serves requests until interrupted (or until standard input ends).
+    :param args: The parsed command line arguments.
+    """
+    set_default_tokenizer(model_tokenizer(args.model, args.tokenizer))
+    model = load_model(args.model)
+    sketches = load_sketches(args.sketches) if args.sketches is not None else None
+    batcher = MicroBatcher(model, args.max_batch_size, args.max_latency, select_smoothing(args.smoothing, model),
+                           sketches)
+    batch_task = asyncio.create_task(batcher.run())
+    # the Unix socket this run created, removed again on shutdown
+    socket_path = None
+
+    try:
+        if args.socket is None and args.port is None:
+            await serve_stdin(batcher)
+            return
+
+        def handle(reader, writer):
+            return serve_connection(batcher, reader, writer)
+
+        if args.socket is not None:
+            # remove a socket left behind by a previous run, but never a file of another kind
+            if os.path.lexists(args.socket):
+                if not stat.S_ISSOCK(os.lstat(args.socket).st_mode):
+                    raise SystemExit('{0} exists and is not a socket; not replacing it'.format(args.socket))
+                os.remove(args.socket)
+            server = await asyncio.start_unix_server(handle, path=args.socket, limit=MAX_REQUEST_SIZE)
+            socket_path = args.socket
+            print('Listening on', args.socket, file=sys.stderr)
+        else:
+            server = await asyncio.start_server(handle, host='127.0.0.1', port=args.port, limit=MAX_REQUEST_SIZE)
+            print('Listening on 127.0.0.1 port', args.port, file=sys.stderr)
+
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        # closing the server leaves its socket file behind
+        if socket_path is not None and os.path.lexists(socket_path) and stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            os.remove(socket_path)
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve language identification of JSON lines.')
+    parser.add_argument('--model', default=MODEL_FILE, help='model file (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--socket', default=None, help='listen on this Unix socket path')
+    parser.add_argument('--port', type=int, default=None, help='listen on this localhost TCP port')
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE, help='largest number of lines per batch')
+    parser.add_argument('--max-latency', type=float, default=MAX_LATENCY,
+                        help='seconds a line waits for others to join its batch')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=None,
+                        help='tokenizer the model was trained with (default: the one in the model\'s manifest)')
+    parser.add_argument('--smoothing', choices=list(SMOOTHING_ENGINES), default=DEFAULT_SMOOTHING,
+                        help='smoothing of the bigram probabilities (default: ' + DEFAULT_SMOOTHING + ')')
+    parser.add_argument('--sketches', default=None,
+                        help='score with the bigram sketches of this file (written by count_sketch.py as <model>.cms) '
+                             'instead of the model\'s bigram counts')
+    arguments = parser.parse_args()
+    if arguments.sketches is not None and arguments.smoothing != DEFAULT_SMOOTHING:
+        parser.error('--sketches is scored with ' + DEFAULT_SMOOTHING + ' smoothing only')
+
+    try:
+        asyncio.run(main(arguments))
+    except KeyboardInterrupt:
+        pass
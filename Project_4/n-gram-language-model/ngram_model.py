@@ -0,0 +1,389 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Model File
+This module reads and writes the binary model file that stores the unigram and bigram counts of every language.
+
+All languages share one vocabulary table of the tokens sorted by their UTF-8 bytes; a token's id is its position in it.
+Each language stores an int32 count for every token id, its bigrams as sorted int64 keys (first id << 32 | second id)
+and an int32 count for every bigram key. The file is loaded with mmap and looked up in place by binary search, so
+loading a model does not read or build any dictionaries.
+
+File layout (little-endian, every section padded to 8 bytes):
+    header              magic, version, number of languages, vocabulary size
+    vocabulary offsets  int64[vocabulary size + 1], offsets of each token in the vocabulary text
+    vocabulary text     the UTF-8 bytes of every token, in id order
+    for each language:
+        language header     name length, number of unigram types, number of bigrams
+        name                UTF-8 bytes of the language name
+        unigram counts      int32[vocabulary size]
+        bigram keys         int64[number of bigrams], sorted
+        bigram counts       int32[number of bigrams]
+"""
+
+from tokenizer import tokenizer_name
+from collections.abc import Mapping
+from array import array
+import hashlib
+import bisect
+import json
+import struct
+import mmap
+import sys
+import os
+
+# file signature and format version
+MAGIC = b'NGRAMLM\0'
+VERSION = 1
+# magic, version, number of languages, vocabulary size, padding
+HEADER = struct.Struct('<8sIII4x')
+# name length, number of unigram types, number of bigrams
+LANGUAGE_HEADER = struct.Struct('<IIQ')
+# suffix of the manifest of the source files counted into a model file
+MANIFEST_SUFFIX = '.manifest.json'
+# manifest entry listing the prunings of a pruned model (see prune_model.py), next to the source file records
+PRUNED_KEY = 'pruned'
+
+
+def _padding(size: int) -> int:
+    """
+    Returns the number of bytes needed to pad a section of the given size to a multiple of 8 bytes.
+    """
+    return -size % 8
+
+
+def bigram_key(first_id: int, second_id: int) -> int:
+    """
+    Packs the token ids of a bigram into the int64 key stored in the model file.
+    :param first_id: The id of the first token of the bigram.
+    :param second_id: The id of the second token of the bigram.
+    :return: The bigram key
+    """
+    return (first_id << 32) | second_id
+
+
+def write_model(filepath: str, models: dict[str, tuple[dict, dict]]):
+    """
+    Writes the unigram and bigram counts of several languages to a model file.
+    The file is written next to its destination and then moved into place, so readers never see a partial file.
+    :param filepath: The path of the model file to write.
+    :param models: A dictionary of (unigram dictionary, bigram dictionary) keyed by language name.
+    """
+
+    # build the shared vocabulary, sorted by UTF-8 bytes so it can be binary searched without decoding
+    tokens = set()
+    for unigram_dict, bigram_dict in models.values():
+        tokens.update(unigram_dict)
+        for bigram in bigram_dict:
+            tokens.update(bigram)
+    vocab = sorted(token.encode('utf8') for token in tokens)
+    token_ids = {token.decode('utf8'): i for i, token in enumerate(vocab)}
+
+    # offsets of each token in the vocabulary text
+    offsets = array('q', [0])
+    for token in vocab:
+        offsets.append(offsets[-1] + len(token))
+    vocab_text = b''.join(vocab)
+
+    temp_filepath = filepath + '.tmp'
+    with open(temp_filepath, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(models), len(vocab)))
+        file.write(offsets.tobytes())
+        file.write(vocab_text + b'\0' * _padding(len(vocab_text)))
+
+        for language, (unigram_dict, bigram_dict) in models.items():
+            # unigram counts indexed by token id
+            unigram_counts = array('i', bytes(4 * len(vocab)))
+            for unigram, count in unigram_dict.items():
+                unigram_counts[token_ids[unigram]] = count
+
+            # bigram keys in sorted order with their counts
+            bigrams = sorted((bigram_key(token_ids[first], token_ids[second]), count)
+                             for (first, second), count in bigram_dict.items())
+            bigram_keys = array('q', [key for key, _ in bigrams])
+            bigram_counts = array('i', [count for _, count in bigrams])
+
+            name = language.encode('utf8')
+            file.write(LANGUAGE_HEADER.pack(len(name), len(unigram_dict), len(bigrams)))
+            file.write(name + b'\0' * _padding(len(name)))
+            file.write(unigram_counts.tobytes() + b'\0' * _padding(4 * len(vocab)))
+            file.write(bigram_keys.tobytes())
+            file.write(bigram_counts.tobytes() + b'\0' * _padding(4 * len(bigrams)))
+
+    os.replace(temp_filepath, filepath)
+
+
+class UnigramCounts(Mapping):
+    """
+    Read-only dictionary view of the unigram counts of one language in a model file, keyed by token.
+    """
+
+    def __init__(self, model, counts: memoryview, size: int):
+        self.model = model
+        self.count_array = counts
+        self.size = size
+
+    def __getitem__(self, unigram: str) -> int:
+        token_id = self.model.token_id(unigram)
+        if token_id < 0 or self.count_array[token_id] == 0:
+            raise KeyError(unigram)
+        return self.count_array[token_id]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        for token_id, count in enumerate(self.count_array):
+            if count:
+                yield self.model.token(token_id)
+
+
+class BigramCounts(Mapping):
+    """
+    Read-only dictionary view of the bigram counts of one language in a model file, keyed by (token, token) tuples.
+    """
+
+    def __init__(self, model, keys: memoryview, counts: memoryview):
+        self.model = model
+        self.key_array = keys
+        self.count_array = counts
+
+    def index(self, key: int) -> int:
+        """
+        Finds a bigram key by binary search.
+        :param key: The bigram key to find.
+        :return: The position of the key, or -1 if the bigram was not seen in training
+        """
+        i = bisect.bisect_left(self.key_array, key)
+        if i < len(self.key_array) and self.key_array[i] == key:
+            return i
+        return -1
+
+    def __getitem__(self, bigram: tuple[str, str]) -> int:
+        first_id = self.model.token_id(bigram[0])
+        second_id = self.model.token_id(bigram[1])
+        i = self.index(bigram_key(first_id, second_id)) if first_id >= 0 and second_id >= 0 else -1
+        if i < 0:
+            raise KeyError(bigram)
+        return self.count_array[i]
+
+    def __len__(self) -> int:
+        return len(self.key_array)
+
+    def __iter__(self):
+        for key in self.key_array:
+            yield self.model.token(key >> 32), self.model.token(key & 0xFFFFFFFF)
+
+
+class NGramModel:
+    """
+    The unigram and bigram counts of several languages, memory-mapped from a model file.
+    """
+
+    def __init__(self, filepath: str):
+        """
+        Opens a model file.
+        :param filepath: The path of the model file.
+        """
+        if sys.byteorder != 'little':
+            raise ValueError('model files can only be read on little-endian machines')
+
+        with open(filepath, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        # every section of the file mapped as an array, released when the model is closed
+        self.sections = []
+
+        # read the header
+        magic, version, num_languages, vocab_size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(filepath + ' is not a version {0} n-gram model file'.format(VERSION))
+        self.vocab_size = vocab_size
+        position = HEADER.size
+
+        # map the vocabulary table
+        self.offsets = self.section(position, vocab_size + 1, 'q')
+        position += 8 * (vocab_size + 1)
+        self.vocab_start = position
+        position += self.offsets[-1] + _padding(self.offsets[-1])
+
+        # map the counts of each language
+        self.languages = []
+        self.unigram_counts = {}
+        self.bigram_counts = {}
+        for _ in range(num_languages):
+            name_length, num_unigrams, num_bigrams = LANGUAGE_HEADER.unpack_from(self.data, position)
+            position += LANGUAGE_HEADER.size
+            language = bytes(self.view[position:position + name_length]).decode('utf8')
+            position += name_length + _padding(name_length)
+
+            unigram_counts = self.section(position, vocab_size, 'i')
+            position += 4 * vocab_size + _padding(4 * vocab_size)
+            bigram_keys = self.section(position, num_bigrams, 'q')
+            position += 8 * num_bigrams
+            bigram_counts = self.section(position, num_bigrams, 'i')
+            position += 4 * num_bigrams + _padding(4 * num_bigrams)
+
+            self.languages.append(language)
+            self.unigram_counts[language] = UnigramCounts(self, unigram_counts, num_unigrams)
+            self.bigram_counts[language] = BigramCounts(self, bigram_keys, bigram_counts)
+
+    def section(self, position: int, length: int, typecode: str) -> memoryview:
+        """
+        Maps a section of the file as an array without copying it.
+        :param position: The byte offset of the section.
+        :param length: The number of items in the section.
+        :param typecode: The struct type code of the items ('i' for int32, 'q' for int64).
+        :return: A memoryview of the section's items
+        """
+        size = struct.calcsize(typecode)
+        section = self.view[position:position + size * length].cast(typecode)
+        self.sections.append(section)
+        return section
+
+    def token(self, token_id: int) -> str:
+        """
+        Returns the token with the given id.
+        :param token_id: The id of the token.
+        :return: The token
+        """
+        start = self.vocab_start + self.offsets[token_id]
+        end = self.vocab_start + self.offsets[token_id + 1]
+        return bytes(self.view[start:end]).decode('utf8')
+
+    def token_id(self, token: str) -> int:
+        """
+        Finds the id of a token by binary search of the vocabulary.
+        :param token: The token to find.
+        :return: The id of the token, or -1 if the token is not in the vocabulary
+        """
+        target = token.encode('utf8')
+        low = 0
+        high = self.vocab_size
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.data[self.vocab_start + self.offsets[middle]:self.vocab_start + self.offsets[middle + 1]]
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def unigrams(self, language: str) -> UnigramCounts:
+        """
+        Returns the unigram counts of a language as a read-only dictionary.
+        :param language: The name of the language.
+        :return: The unigram counts keyed by token
+        """
+        return self.unigram_counts[language]
+
+    def bigrams(self, language: str) -> BigramCounts:
+        """
+        Returns the bigram counts of a language as a read-only dictionary.
+        :param language: The name of the language.
+        :return: The bigram counts keyed by (token, token) tuples
+        """
+        return self.bigram_counts[language]
+
+    def to_dicts(self) -> dict[str, tuple[dict, dict]]:
+        """
+        Copies the counts of every language out of the model file into dictionaries.
+        :return: A dictionary of (unigram dictionary, bigram dictionary) keyed by language name
+        """
+        # decode every token once rather than once per n-gram
+        tokens = [self.token(token_id) for token_id in range(self.vocab_size)]
+
+        models = {}
+        for language in self.languages:
+            unigram_counts = self.unigrams(language).count_array
+            bigrams = self.bigrams(language)
+            unigram_dict = {tokens[token_id]: count for token_id, count in enumerate(unigram_counts) if count}
+            bigram_dict = {(tokens[key >> 32], tokens[key & 0xFFFFFFFF]): count
+                           for key, count in zip(bigrams.key_array, bigrams.count_array)}
+            models[language] = (unigram_dict, bigram_dict)
+        return models
+
+    def close(self):
+        """
+        Unmaps the model file.
+        """
+        self.unigram_counts = {}
+        self.bigram_counts = {}
+        for section in self.sections:
+            section.release()
+        self.sections = []
+        self.view.release()
+        self.data.close()
+
+
+def load_model(filepath: str) -> NGramModel:
+    """
+    Opens a model file written by write_model.
+    :param filepath: The path of the model file.
+    :return: The memory-mapped model
+    """
+    return NGramModel(filepath)
+
+
+def file_hash(filepath: str) -> str:
+    """
+    Computes the SHA-256 hash of a file's contents, reading it in blocks.
+    :param filepath: The path of the file.
+    :return: The hexadecimal hash
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(model_filepath: str) -> dict:
+    """
+    Reads the manifest of the source files that have been counted into a model file.
+    :param model_filepath: The path of the model file.
+    :return: A dictionary of source file records keyed by content hash (empty if there is no manifest), and the list
+    of prunings under PRUNED_KEY if the model was pruned
+    """
+    manifest_filepath = model_filepath + MANIFEST_SUFFIX
+    if not os.path.exists(manifest_filepath):
+        return {}
+    with open(manifest_filepath, 'r', encoding='utf8') as file:
+        return json.load(file)
+
+
+def write_manifest(model_filepath: str, manifest: dict):
+    """
+    Writes the manifest of the source files that have been counted into a model file.
+    :param model_filepath: The path of the model file.
+    :param manifest: A dictionary of source file records keyed by content hash.
+    """
+    manifest_filepath = model_filepath + MANIFEST_SUFFIX
+    with open(manifest_filepath + '.tmp', 'w', encoding='utf8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(manifest_filepath + '.tmp', manifest_filepath)
+
+
+def model_tokenizer(model_filepath: str, tokenizer: str = None) -> str:
+    """
+    Finds the tokenizer a model file was trained with from its manifest, checking it against a requested tokenizer.
+    A model must be updated and scored with the tokenizer it was trained with, since other tokens are not in its counts.
+    :param model_filepath: The path of the model file.
+    :param tokenizer: The tokenizer requested ('nltk' or 'fast'; default: the one the model was trained with).
+    :return: The name of the tokenizer recorded in the manifest, or of the requested (or selected default) tokenizer if
+    the manifest records none
+    """
+    recorded = {record['tokenizer'] for record in load_manifest(model_filepath).values() if 'tokenizer' in record}
+    if not recorded:
+        return tokenizer_name(tokenizer)
+    if len(recorded) > 1:
+        raise ValueError(model_filepath + ' was trained with several tokenizers: ' + ', '.join(sorted(recorded)))
+    trained_with = recorded.pop()
+    if tokenizer is not None and tokenizer != trained_with:
+        raise ValueError(model_filepath + ' was trained with the ' + repr(trained_with) + ' tokenizer, not '
+                         + repr(tokenizer))
+    return trained_with
@@ -0,0 +1,337 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+N-Gram Trie
+This program builds language models of any n-gram order whose counts are stored in an array-backed trie, and measures
+the memory used per stored n-gram, the peak memory of training, the lookup throughput and the accuracy of language
+identification for each order.
+
+The trie stores every n-gram in reverse (the last token first), so that the n-grams that end at a token share prefixes,
+and walking the trie along a token and the tokens before it finds the counts of the unigram, bigram, trigram, ...
+ending at that token in one walk. Each level of the trie is three flat arrays: the token ids of the level's n-grams
+sorted within each parent, their counts, and (above the last level) where each n-gram's children start in the next level.
+
+Training never holds every n-gram in a dictionary: the n-grams of a chunk of RUN_CHUNK_SIZE characters are counted in a
+Counter, sorted into runs of arrays (one array per position of the n-grams), and merged with the runs of earlier chunks,
+so the trie's levels are built from arrays and the peak memory of training follows the chunk size, not the file size.
+"""
+
+from part1 import read_chunks, tokenize_text, find_training_files
+from collections import Counter, deque
+from array import array
+import argparse
+import bisect
+import tracemalloc
+import heapq
+import math
+import time
+
+# weight of each step of backing off to a shorter context (stupid backoff)
+BACKOFF_WEIGHT = 0.4
+# characters of a training file counted in a dictionary at a time; the counts are kept in sorted arrays in between
+RUN_CHUNK_SIZE = 1 << 16
+
+
+def make_run(items, n: int) -> tuple[list[array], array]:
+    """
+    Stores sorted n-gram counts as a run: one array of token ids per position of the n-grams, and an array of counts.
+    :param items: (n-gram, count) pairs sorted by n-gram, each n-gram a tuple of n token ids.
+    :param n: The n-gram order.
+    :return: The columns of token ids and the counts
+    """
+    columns = [array('i') for _ in range(n)]
+    counts = array('i')
+    for ngram, count in items:
+        for column, token_id in zip(columns, ngram):
+            column.append(token_id)
+        counts.append(count)
+    return columns, counts
+
+
+def merge_runs(first: tuple[list[array], array], second: tuple[list[array], array],
+               n: int) -> tuple[list[array], array]:
+    """
+    Merges two runs of n-gram counts, adding the counts of the n-grams in both.
+    :param first: A run (as from make_run).
+    :param second: Another run of the same order.
+    :param n: The n-gram order.
+    :return: The merged run
+    """
+    def merged_items():
+        # the n-grams of both runs in order, tuples made one at a time
+        items = heapq.merge(zip(zip(*first[0]), first[1]), zip(zip(*second[0]), second[1]))
+        ngram, total = next(items, (None, 0))
+        for next_ngram, count in items:
+            if next_ngram == ngram:
+                total += count
+            else:
+                yield ngram, total
+                ngram, total = next_ngram, count
+        if ngram is not None:
+            yield ngram, total
+
+    return make_run(merged_items(), n)
+
+
+def add_run(runs: list, run: tuple[list[array], array], n: int):
+    """
+    Adds a run to a stack of runs of one order, merging runs of similar size so that the stack stays logarithmic in
+    length and every count is merged a logarithmic number of times.
+    :param runs: The stack of runs, largest first.
+    :param run: The new run.
+    :param n: The n-gram order.
+    """
+    runs.append(run)
+    while len(runs) > 1 and 2 * len(runs[-1][1]) >= len(runs[-2][1]):
+        second = runs.pop()
+        runs.append(merge_runs(runs.pop(), second, n))
+
+
+def count_ngram_levels(filepath: str, order: int, vocab: dict[str, int],
+                       chunk_size: int = RUN_CHUNK_SIZE) -> list[tuple[list[array], array]]:
+    """
+    Counts the n-grams of orders 1 through order in a training file, streaming it like count_unigrams_and_bigrams.
+    Only the n-grams of one chunk are held in a dictionary; each chunk's counts are sorted into compact runs of arrays,
+    which are merged into one run per order, so the memory of training stays close to that of the finished trie.
+    :param filepath: The path to the training file.
+    :param order: The highest n-gram order to count.
+    :param vocab: A dictionary of token ids keyed by token; new tokens are added to it (share it between languages).
+    :param chunk_size: The number of characters of the file to tokenize at a time.
+    :return: One run per order (as from make_run) of the n-gram counts sorted by reversed n-gram (last token first)
+    """
+    runs = [[] for _ in range(order)]
+    # the most recent tokens, newest first, carried across chunks
+    history = deque(maxlen=order)
+
+    with open(filepath, 'r', encoding='utf8') as file:
+        for chunk in read_chunks(file, chunk_size):
+            counts = Counter()
+            for token in tokenize_text(chunk):
+                history.appendleft(vocab.setdefault(token, len(vocab)))
+                # count the n-gram of each order that ends at this token
+                ngram = ()
+                for token_id in history:
+                    ngram += (token_id,)
+                    counts[ngram] += 1
+
+            levels = [[] for _ in range(order)]
+            for ngram, count in counts.items():
+                levels[len(ngram) - 1].append((ngram, count))
+            del counts
+            for n, level in enumerate(levels):
+                level.sort()
+                add_run(runs[n], make_run(level, n + 1), n + 1)
+            del levels
+
+    # merge what is left of each stack, smallest runs first
+    merged = []
+    for n, level_runs in enumerate(runs):
+        run = level_runs.pop() if level_runs else make_run([], n + 1)
+        while level_runs:
+            run = merge_runs(level_runs.pop(), run, n + 1)
+        merged.append(run)
+    return merged
+
+
+class CountTrie:
+    """
+    N-gram counts of orders 1 through order stored as an array-backed trie of reversed n-grams.
+    """
+
+    def __init__(self, levels: list[tuple[list[array], array]], order: int):
+        """
+        Builds the trie from sorted n-gram counts.
+        :param levels: One run of counts per order, sorted by reversed n-gram (as from count_ngram_levels).
+        :param order: The highest n-gram order.
+        """
+        self.order = order
+        self.words = []
+        self.counts = []
+        self.children = []
+
+        # the n-grams of each order are sorted, so the children of an n-gram are contiguous in the next level
+        for n, (columns, counts) in enumerate(levels):
+            self.words.append(columns[n])
+            self.counts.append(counts)
+
+            # record where each n-gram's children start in the next level
+            if n + 1 < order:
+                child_prefixes = zip(*levels[n + 1][0][:n + 1])
+                prefix = next(child_prefixes, None)
+                starts = array('i')
+                child = 0
+                for ngram in zip(*columns):
+                    starts.append(child)
+                    while prefix == ngram:
+                        child += 1
+                        prefix = next(child_prefixes, None)
+                starts.append(child)
+                self.children.append(starts)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of n-grams stored.
+        """
+        return sum(len(words) for words in self.words)
+
+    def memory_bytes(self) -> int:
+        """
+        Returns the number of bytes used by the trie's arrays.
+        """
+        arrays = self.words + self.counts + self.children
+        return sum(len(a) * a.itemsize for a in arrays)
+
+    def walk(self, ids: list[int]) -> list[int]:
+        """
+        Walks the trie along a reversed n-gram, finding the count of each of its prefixes.
+        :param ids: Token ids, the last token of the n-gram first (e.g. [w3, w2, w1] for the trigram w1 w2 w3).
+        :return: The counts of ids[:1], ids[:2], ... up to the longest prefix stored in the trie
+        """
+        found = []
+        low = 0
+        high = len(self.words[0])
+        for n, token_id in enumerate(ids[:self.order]):
+            words = self.words[n]
+            i = bisect.bisect_left(words, token_id, low, high)
+            if i >= high or words[i] != token_id:
+                break
+            found.append(self.counts[n][i])
+            # move to the children of this n-gram
+            if n + 1 < self.order:
+                low = self.children[n][i]
+                high = self.children[n][i + 1]
+        return found
+
+
+class TrieLanguageModel:
+    """
+    An n-gram language model of any order scored with stupid backoff over a CountTrie.
+    """
+
+    def __init__(self, filepath: str, order: int, vocab: dict[str, int], chunk_size: int = RUN_CHUNK_SIZE):
+        """
+        Trains a model from a training file.
+        :param filepath: The path to the training file.
+        :param order: The n-gram order of the model.
+        :param vocab: A dictionary of token ids keyed by token, shared between the models being compared.
+        :param chunk_size: The number of characters of the file counted at a time.
+        """
+        self.order = order
+        self.vocab = vocab
+        self.trie = CountTrie(count_ngram_levels(filepath, order, vocab, chunk_size), order)
+        self.total = sum(self.trie.counts[0])
+
+    def log_prob(self, text: str, vocab_size: int) -> float:
+        """
+        Computes the log (base 2) score of text with stupid backoff: the relative frequency of each token after the
+        longest context seen in training, weighted by BACKOFF_WEIGHT for every order backed off, and a Laplace-smoothed
+        unigram probability when no context was seen.
+        :param text: The text to score.
+        :param vocab_size: The vocabulary size used to smooth unigram probabilities.
+        :return: The log score of the text
+        """
+        ids = [self.vocab.get(token, -1) for token in tokenize_text(text)]
+
+        score = 0
+        previous = []
+        for i in range(len(ids)):
+            # counts of the n-grams of every order ending at this token, in one walk
+            history = ids[max(i - self.order + 1, 0):i + 1][::-1]
+            found = self.trie.walk(history)
+
+            # back off from the longest possible n-gram to the longest one seen
+            longest = len(history)
+            n = len(found)
+            if n >= 2:
+                # previous holds the counts of the contexts ending at the previous token
+                probability = found[n - 1] / previous[n - 2]
+            else:
+                probability = ((found[0] if found else 0) + 1) / (self.total + vocab_size)
+                n = 1
+            score += math.log(probability, 2) + (longest - n) * math.log(BACKOFF_WEIGHT, 2)
+
+            previous = found
+        return score
+
+
+def evaluate(models: dict[str, TrieLanguageModel], test_file: str, solution_file: str, vocab_size: int) -> float:
+    """
+    Computes the accuracy of identifying the language of each line of a test file.
+    :param models: The language models keyed by language.
+    :param test_file: The file of lines to identify.
+    :param solution_file: The file of '<line number> <language>' answers.
+    :param vocab_size: The vocabulary size used to smooth unigram probabilities.
+    :return: The fraction of lines identified correctly
+    """
+    with open(test_file, 'r', encoding='utf8') as file:
+        lines = file.readlines()
+    with open(solution_file, 'r', encoding='utf8') as file:
+        answers = [line.split()[1] for line in file if line.strip()]
+
+    correct = 0
+    for line, actual in zip(lines, answers):
+        scores = {language: model.log_prob(line, vocab_size) for language, model in models.items()}
+        if max(scores, key=scores.get) == actual:
+            correct += 1
+    return correct / len(answers)
+
+
+def benchmark(order: int, training_files: dict[str, str], lookups: int = 200000,
+              chunk_size: int = RUN_CHUNK_SIZE) -> dict:
+    """
+    Trains trie models of an order and measures their memory, lookup throughput and accuracy on LangId.test.
+    :param order: The n-gram order.
+    :param training_files: A dictionary of training file paths keyed by language name.
+    :param lookups: The number of walks to time.
+    :param chunk_size: The number of characters of a training file counted at a time.
+    :return: A dictionary of the measurements
+    """
+    vocab = {}
+    start_time = time.perf_counter()
+    models = {language: TrieLanguageModel(path, order, vocab, chunk_size) for language, path in training_files.items()}
+    train_time = time.perf_counter() - start_time
+
+    # peak memory of training one model, traced in a second run since tracing slows training down
+    tracemalloc.start()
+    TrieLanguageModel(next(iter(training_files.values())), order, dict(vocab), chunk_size)
+    train_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    ngrams = sum(len(model.trie) for model in models.values())
+    memory = sum(model.trie.memory_bytes() for model in models.values())
+
+    # time full-order walks along the test text
+    with open('LangId.test', 'r', encoding='utf8') as file:
+        ids = [vocab.get(token, -1) for token in tokenize_text(file.read())]
+    queries = [ids[max(i - order + 1, 0):i + 1][::-1] for i in range(len(ids))]
+    trie = next(iter(models.values())).trie
+    start_time = time.perf_counter()
+    for i in range(lookups):
+        trie.walk(queries[i % len(queries)])
+    lookup_time = time.perf_counter() - start_time
+
+    return {'order': order,
+            'ngrams': ngrams,
+            'bytes_per_ngram': memory / ngrams,
+            'train_seconds': train_time,
+            'train_megabytes': train_memory / 1e6,
+            'walks_per_second': lookups / lookup_time,
+            'accuracy': evaluate(models, 'LangId.test', 'LangId.sol', len(vocab))}
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark n-gram trie language models of several orders.')
+    parser.add_argument('--orders', type=int, nargs='+', default=[2, 3, 4], help='n-gram orders to benchmark')
+    parser.add_argument('--lookups', type=int, default=200000, help='number of trie walks to time')
+    parser.add_argument('--chunk-size', type=int, default=RUN_CHUNK_SIZE,
+                        help='characters of a training file counted at a time (default: {0})'.format(RUN_CHUNK_SIZE))
+    args = parser.parse_args()
+
+    print('order\tn-grams\tbytes/n-gram\ttrain s\ttrain MB\twalks/s\taccuracy')
+    for n_order in args.orders:
+        result = benchmark(n_order, find_training_files(), args.lookups, args.chunk_size)
+        print('{order}\t{ngrams}\t{bytes_per_ngram:.1f}\t{train_seconds:.2f}\t{train_megabytes:.1f}\t\t'
+              '{walks_per_second:.0f}\t{accuracy:.4f}'.format(**result))
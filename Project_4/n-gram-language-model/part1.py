@@ -4,19 +4,109 @@ Jordan Frimpter
 Henry Kim
 
 Part 1
-This program reads in files and outputs pickled dictionaries that counts the unigrams and bigrams in them.
+This program reads in files and outputs a model file that stores the counts of the unigrams and bigrams in them.
 """
 
-from nltk import word_tokenize
-from nltk.util import ngrams
-import pickle
+from tokenizer import get_tokenizer, tokenizer_name, TOKENIZERS, DEFAULT_TOKENIZER
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from ngram_model import write_model, write_manifest, file_hash
+import argparse
+import time
+import glob
 import os
 
+# number of characters read from a training file before its text is tokenized and counted
+CHUNK_SIZE = 1 << 20
+# line endings after which a chunk may be cut (the tokenizer ends a sentence there regardless of chunking)
+SENTENCE_END = ('.', '?', '!')
+# prefix of training files; the rest of the filename is the language name
+TRAINING_PREFIX = 'LangId.train.'
+# model file written from the training files
+MODEL_FILE = 'LangId.model'
+# bounds on the size (in bytes) of the shards a training file is split into for parallel counting
+MIN_SHARD_SIZE = 1 << 16
+MAX_SHARD_SIZE = 1 << 26
 
-def count_unigrams_and_bigrams(filepath: str):
+
+def tokenize_text(text: str, tokenizer: str = None) -> list[str]:
+    """
+    Lowercases and tokenizes text into the unigrams used by the language model.
+    :param text: The text to tokenize.
+    :param tokenizer: The tokenizer to use ('nltk' or 'fast'; default: the tokenizer selected in tokenizer.py)
+    :return: A list of lowercase tokens with numbers replaced by 'NUM'
+    """
+
+    # Remove newline characters and lowercase the text
+    text = text.replace('\n', ' ')
+    text = text.lower()
+
+    # Get list of lowercase unigrams (tokenize)
+    unigrams = [t.lower() for t in get_tokenizer(tokenizer)(text)]
+    # Replace the numbers with NUM since numbers aren't likely to reveal which language text is
+    unigrams = ['NUM' if u.isdigit() else u for u in unigrams]
+
+    return unigrams
+
+
+def read_chunks(file, chunk_size: int = CHUNK_SIZE):
+    """
+    Reads an open text file (or any iterable of lines) in chunks of whole lines of roughly chunk_size characters.
+    A chunk is only cut after a line ending a sentence so that chunking does not change tokenization;
+    a chunk is cut anyway once it reaches twice the chunk size.
+    :param file: The open text file to read.
+    :param chunk_size: The number of characters to collect before a chunk may be cut.
+    :return: A generator of text chunks
+    """
+    buffer = []
+    size = 0
+    for line in file:
+        buffer.append(line)
+        size += len(line)
+
+        # cut the chunk once it is full and the line ends a sentence
+        if size >= chunk_size and (line.rstrip().endswith(SENTENCE_END) or size >= 2 * chunk_size):
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+
+    # yield the remainder of the file
+    if buffer:
+        yield ''.join(buffer)
+
+
+def update_counts(unigrams: list[str], unigram_count: Counter, bigram_count: Counter, previous: str = None):
+    """
+    Adds the unigrams and bigrams of a list of tokens to running counts.
+    :param unigrams: The tokens to count.
+    :param unigram_count: The running count of unigrams (updated in place).
+    :param bigram_count: The running count of bigrams (updated in place).
+    :param previous: The last token of the preceding text, used to count the bigram across the text boundary.
+    :return: The last token counted, to be passed as previous for the following text
+    """
+    # nothing to count
+    if not unigrams:
+        return previous
+
+    # Count the unigrams
+    unigram_count.update(unigrams)
+
+    # Count the bigram joining this text to the preceding text
+    if previous is not None:
+        bigram_count[(previous, unigrams[0])] += 1
+    # Count the bigrams
+    bigram_count.update(zip(unigrams, unigrams[1:]))
+
+    return unigrams[-1]
+
+
+def count_unigrams_and_bigrams(filepath: str, chunk_size: int = CHUNK_SIZE, tokenizer: str = None):
     """
     Counts the number of times each unigram and bigram in the specified file into a dictionary.
+    The file is read and counted in chunks so that memory use does not grow with the size of the file's text.
     :param filepath: The path to the training file to count unigrams and bigrams in.
+    :param chunk_size: The number of characters of the file to tokenize at a time.
+    :param tokenizer: The tokenizer to use ('nltk' or 'fast'; default: the tokenizer selected in tokenizer.py)
     :return: A dictionary of unigrams with their number of occurrences and a dictionary of bigrams with their number
     of occurrences.
     """
@@ -33,57 +123,224 @@ def count_unigrams_and_bigrams(filepath: str):
         r_dict = {}
         return r_dict
 
-    # Read file into text
+    unigram_count = Counter()
+    bigram_count = Counter()
+
+    # Stream the file through the tokenizer and counters
     with open(filepath, 'r', encoding='utf8') as file:
         # exit prematurely if file could not be read
         if not file.readable():
             print("File " + filepath + " was not found in 'count_unigrams_and_bigrams'.")
             r_dict = {}
             return r_dict
-        # read file if file is good
-        text = file.read()
+        # count the file a chunk at a time, carrying the last token over to the next chunk's first bigram
+        previous = None
+        for chunk in read_chunks(file, chunk_size):
+            previous = update_counts(tokenize_text(chunk, tokenizer), unigram_count, bigram_count, previous)
 
-    # Remove newline characters and lowercase the text
-    text = text.replace('\n', ' ')
-    text = text.lower()
+    # Return the dictionaries
+    return dict(unigram_count), dict(bigram_count)
 
-    # Get list of lowercase unigrams (tokenize)
-    unigrams = [t.lower() for t in word_tokenize(text)]
-    # Replace the numbers with NUM since numbers aren't likely to reveal which language text is
-    unigrams = ['NUM' if u.isdigit() else u for u in unigrams]
 
-    # Count the unigrams
-    unigram_dict = {u: unigrams.count(u) for u in set(unigrams)}
+def find_training_files(directory: str = '.') -> dict[str, str]:
+    """
+    Finds the training files in a directory, named as TRAINING_PREFIX followed by the language name.
+    :param directory: The directory to search.
+    :return: A dictionary of training file paths keyed by language name, sorted by language
+    """
+    files = {}
+    for path in sorted(glob.glob(os.path.join(directory, TRAINING_PREFIX + '*'))):
+        language = os.path.basename(path)[len(TRAINING_PREFIX):]
+        # skip files generated from the training files (such as pickles)
+        if '.' in language or not os.path.isfile(path):
+            continue
+        files[language] = path
+    return files
 
-    # Get list of bigrams
-    bigrams = list(ngrams(unigrams, 2))
-    # Count the bigrams
-    bigram_dict = {b: bigrams.count(b) for b in set(bigrams)}
 
-    # Return the dictionaries
-    return unigram_dict, bigram_dict
+def split_shards(filepath: str, shard_size: int) -> list[tuple[int, int]]:
+    """
+    Splits a file into byte ranges of roughly shard_size bytes.
+    Like read_chunks, shards are only cut after a line ending a sentence so sharding does not change tokenization.
+    :param filepath: The path to the file to split.
+    :param shard_size: The number of bytes to collect before a shard may be cut.
+    :return: A list of (start, end) byte offsets covering the file
+    """
+    shards = []
+    file_size = os.path.getsize(filepath)
+    sentence_end = tuple(end.encode('utf8') for end in SENTENCE_END)
+
+    with open(filepath, 'rb') as file:
+        start = 0
+        while start < file_size:
+            # skip ahead by a shard, then finish the line the shard size landed in
+            file.seek(start + shard_size)
+            line = file.readline()
+            # keep reading lines until one ends a sentence or the shard grows to twice its size
+            while line and not line.rstrip().endswith(sentence_end) and file.tell() - start < 2 * shard_size:
+                line = file.readline()
+            end = min(file.tell(), file_size)
+            shards.append((start, end))
+            start = end
+
+    return shards
+
+
+def count_shard(language: str, index: int, filepath: str, start: int, end: int, chunk_size: int = CHUNK_SIZE,
+                tokenizer: str = None) -> dict:
+    """
+    Counts the unigrams and bigrams in one shard of a training file; used as the task run by the training pool.
+    :param language: The language of the training file.
+    :param index: The position of the shard in the file.
+    :param filepath: The path to the training file.
+    :param start: The byte offset the shard starts at.
+    :param end: The byte offset the shard ends at.
+    :param chunk_size: The number of characters of the shard to tokenize at a time.
+    :param tokenizer: The tokenizer to use ('nltk' or 'fast'; default: the tokenizer selected in tokenizer.py)
+    :return: A dictionary of the shard's counts, its first and last tokens (for the bigrams across shards) and timing
+    """
+    start_time = time.perf_counter()
+
+    # read the shard's text
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf8')
+
+    # count the shard a chunk at a time
+    unigram_count = Counter()
+    bigram_count = Counter()
+    first = None
+    previous = None
+    for chunk in read_chunks(text.splitlines(keepends=True), chunk_size):
+        unigrams = tokenize_text(chunk, tokenizer)
+        if first is None and unigrams:
+            first = unigrams[0]
+        previous = update_counts(unigrams, unigram_count, bigram_count, previous)
+
+    return {'language': language,
+            'index': index,
+            'bytes': end - start,
+            'tokens': sum(unigram_count.values()),
+            'unigrams': unigram_count,
+            'bigrams': bigram_count,
+            'first': first,
+            'last': previous,
+            'seconds': time.perf_counter() - start_time}
+
+
+def merge_shards(shard_results: list[dict]) -> dict[str, tuple[dict, dict]]:
+    """
+    Merges the counts of shards into the counts of whole files.
+    Shards are merged in language and file order regardless of the order they finished in, so the result is the same
+    as counting each file in one piece.
+    :param shard_results: The results of count_shard.
+    :return: A dictionary of (unigram dictionary, bigram dictionary) keyed by language
+    """
+    models = {}
+    ordered = sorted(shard_results, key=lambda result: (result['language'], result['index']))
+
+    language = None
+    for result in ordered:
+        # start the counts of a new language
+        if result['language'] != language:
+            language = result['language']
+            unigram_count = Counter()
+            bigram_count = Counter()
+            previous = None
+            models[language] = (unigram_count, bigram_count)
+
+        unigram_count.update(result['unigrams'])
+        bigram_count.update(result['bigrams'])
+        # count the bigram spanning the previous shard and this one
+        if previous is not None and result['first'] is not None:
+            bigram_count[(previous, result['first'])] += 1
+        if result['last'] is not None:
+            previous = result['last']
+
+    return {language: (dict(unigrams), dict(bigrams)) for language, (unigrams, bigrams) in models.items()}
+
+
+def train_languages(training_files: dict[str, str], workers: int = 1, shard_size: int = None, tokenizer: str = None):
+    """
+    Counts the unigrams and bigrams of several training files, split into shards counted in a process pool.
+    :param training_files: A dictionary of training file paths keyed by language name.
+    :param workers: The number of worker processes (1 counts in this process).
+    :param shard_size: The number of bytes per shard; by default the files are split into about 4 shards per worker.
+    :param tokenizer: The tokenizer to use ('nltk' or 'fast'; default: the tokenizer selected in tokenizer.py)
+    :return: A dictionary of (unigram dictionary, bigram dictionary) keyed by language and the list of shard results
+    """
+    # pick a shard size that gives every worker several shards to balance load
+    if shard_size is None:
+        total_size = sum(os.path.getsize(path) for path in training_files.values())
+        shard_size = min(max(total_size // (4 * workers), MIN_SHARD_SIZE), MAX_SHARD_SIZE)
+
+    # name the tokenizer explicitly so worker processes use the same one
+    tokenizer = tokenizer_name(tokenizer)
+
+    # build the list of shard tasks
+    tasks = []
+    for language, path in training_files.items():
+        for index, (start, end) in enumerate(split_shards(path, shard_size)):
+            tasks.append((language, index, path, start, end, CHUNK_SIZE, tokenizer))
+
+    # count the shards
+    if workers <= 1:
+        shard_results = [count_shard(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(count_shard, *task) for task in tasks]
+            shard_results = [future.result() for future in futures]
+
+    return merge_shards(shard_results), shard_results
+
+
+def print_shard_report(shard_results: list[dict], wall_time: float):
+    """
+    Prints the time taken by each shard and the overall parallelism achieved.
+    :param shard_results: The results of count_shard.
+    :param wall_time: The total time taken to train, in seconds.
+    """
+    print('Shard timings:')
+    for result in sorted(shard_results, key=lambda r: (r['language'], r['index'])):
+        print('{0}\tshard {1}\t{2} bytes\t{3} tokens\t{4:.3f} s'.format(
+            result['language'], result['index'], result['bytes'], result['tokens'], result['seconds']))
+
+    shard_time = sum(result['seconds'] for result in shard_results)
+    print('Total shard time: {0:.3f} s'.format(shard_time))
+    print('Wall time: {0:.3f} s'.format(wall_time))
+    if wall_time > 0:
+        print('Effective parallelism: {0:.2f}x'.format(shard_time / wall_time))
 
 
 # Main execution
 if __name__ == '__main__':
-    # Files for language processing to pickle
-    training_data = ['LangId.train.English', 'LangId.train.French', 'LangId.train.Italian']
-
-    # Process each of the files
-    for filename in training_data:
-        print('Input file:', filename)
-        unigram_count, bigram_count = count_unigrams_and_bigrams(filename)
-
-        # Save the unigram dictionary as a pickle file
-        output_filename = filename + '.unigrams.pickle'
-        print('Output file:', output_filename)
-        # print(unigram_count)
-        with open(output_filename, 'wb') as output:
-            pickle.dump(unigram_count, output)
-
-        # Save the bigram dictionary as a pickle file
-        output_filename = filename + '.bigrams.pickle'
-        print('Output file:', output_filename)
-        # print(bigram_count)
-        with open(output_filename, 'wb') as output:
-            pickle.dump(bigram_count, output)
+    parser = argparse.ArgumentParser(description='Count the unigrams and bigrams of language training files.')
+    parser.add_argument('files', nargs='*',
+                        help='training files named ' + TRAINING_PREFIX + '<Language> (default: all in this directory)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--shard-size', type=int, default=None, help='bytes per shard (default: automatic)')
+    parser.add_argument('--output', default=MODEL_FILE, help='model file to write (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=DEFAULT_TOKENIZER,
+                        help='tokenizer to count with; score the model with the same tokenizer')
+    args = parser.parse_args()
+
+    # Files for language processing
+    if args.files:
+        training_data = {os.path.basename(path)[len(TRAINING_PREFIX):]: path for path in args.files}
+    else:
+        training_data = find_training_files()
+
+    # Count all of the files
+    print('Input files:', ', '.join(training_data.values()))
+    start_time = time.perf_counter()
+    models, shards = train_languages(training_data, max(args.workers, 1), args.shard_size, args.tokenizer)
+    print_shard_report(shards, time.perf_counter() - start_time)
+
+    # Save the counts of every language to the model file
+    print('Output file:', args.output)
+    write_model(args.output, models)
+
+    # Record the training files in the model's manifest so that update_model.py does not count them again
+    write_manifest(args.output, {file_hash(path): {'language': language, 'path': path,
+                                                   'tokenizer': args.tokenizer}
+                                 for language, path in training_data.items()})
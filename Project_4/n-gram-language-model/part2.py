@@ -8,11 +8,22 @@ This program uses unigram and bigram occurrences counted in part 1 to calculate
 one of the languages.
 """
 
-from nltk import word_tokenize
 from nltk.util import ngrams
-import pickle
+from ngram_model import load_model, model_tokenizer, NGramModel, bigram_key
+from part1 import tokenize_text
+from tokenizer import set_default_tokenizer, TOKENIZERS
+from functools import lru_cache
+import numpy as np
+import argparse
 import math
 
+# model file written by part 1
+MODEL_FILE = 'LangId.model'
+# number of token ids remembered by a LanguageScorer
+TOKEN_CACHE_SIZE = 1 << 16
+# number of bigrams scored between checks of the bounds in LanguageScorer.top_k
+BOUND_BLOCK_SIZE = 8
+
 
 def compute_log_prob(text: str, unigram_dict: dict[str, int], bigram_dict: dict[str, int], vocab_size: int):
     """
@@ -25,19 +36,13 @@ def compute_log_prob(text: str, unigram_dict: dict[str, int], bigram_dict: dict[
     :return: The probability of generating the text from the training data
     """
 
-    # Remove newline characters and lowercase the text
-    text = text.replace('\n', ' ')
-    text = text.lower()
-
-    # unigram generation
-    unigrams_test = [t.lower() for t in word_tokenize(text)]  # lowercase to consistency
-    # Replace the numbers with NUM since numbers aren't likely to reveal which language text is
-    unigrams_test = ['NUM' if u.isdigit() else u for u in unigrams_test]
+    # unigram generation (lowercased, with numbers replaced by NUM)
+    unigrams_test = tokenize_text(text)
 
     # bigram generation
     bigrams_test = list(ngrams(unigrams_test, 2))  # generate list of bigrams in test text
 
-    p_laplace = 1
+    p_laplace = 0  # log of probability 1
     # generate probabilities for all the following words
     for bigram in bigrams_test:
 
@@ -49,60 +54,335 @@ def compute_log_prob(text: str, unigram_dict: dict[str, int], bigram_dict: dict[
         unigram_occurrences = unigram_dict[unigram] if unigram in unigram_dict else 0
 
         # calculate log probability
-        p_laplace += math.log((bigram_occurrences + 1 / (unigram_occurrences + vocab_size)), 2)
+        p_laplace += math.log((bigram_occurrences + 1) / (unigram_occurrences + vocab_size), 2)
 
     return p_laplace
 
 
+def token_ids(lines: list[list[str]], model: NGramModel) -> np.ndarray:
+    """
+    Maps the tokens of several lines to their ids in the model's vocabulary, looking up each distinct token once.
+    :param lines: The tokens of each line.
+    :param model: The model whose vocabulary to use.
+    :return: An int64 array of the ids of every token of every line in order (-1 for tokens not in the vocabulary)
+    """
+    ids = {}
+    flat_ids = []
+    for tokens in lines:
+        for token in tokens:
+            if token not in ids:
+                ids[token] = model.token_id(token)
+            flat_ids.append(ids[token])
+    return np.array(flat_ids, dtype=np.int64)
+
+
+def bigram_batch(lines: list[str], model: NGramModel):
+    """
+    Tokenizes several lines of text and lists the bigrams of every line as arrays of token ids.
+    :param lines: The lines of text.
+    :param model: The model whose vocabulary to use.
+    :return: The ids of the first and second tokens of every bigram (-1 for tokens not in the vocabulary), the bigram
+    keys (-1 for bigrams with a token not in the vocabulary) and the index of the line each bigram belongs to
+    """
+    # tokenize every line and map its tokens to ids
+    tokenized = [tokenize_text(line) for line in lines]
+    ids = token_ids(tokenized, model)
+    lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.int64)
+
+    # pair each token with the next, dropping pairs that cross from one line into the next
+    ends = np.cumsum(lengths)
+    same_line = np.ones(max(len(ids) - 1, 0), dtype=bool)
+    same_line[ends[(lengths > 0) & (ends < len(ids))] - 1] = False
+    first = ids[:-1][same_line]
+    second = ids[1:][same_line]
+    line_index = np.repeat(np.arange(len(lines)), np.maximum(lengths - 1, 0))
+
+    # bigrams with a token outside the vocabulary can't have been seen in training
+    known = (first >= 0) & (second >= 0)
+    keys = np.where(known, (first << 32) | np.maximum(second, 0), -1)
+
+    return first, second, keys, line_index
+
+
+def find_bigrams(model: NGramModel, language: str, keys: np.ndarray):
+    """
+    Finds bigram keys in the sorted bigram keys of a language with a vectorized binary search.
+    :param model: The model holding the counts of each language.
+    :param language: The language to search.
+    :param keys: The bigram keys to find (-1 for bigrams that can't be found).
+    :return: The position of each key in the language's bigram arrays and whether it was found there
+    """
+    # map the language's keys without copying them out of the model file
+    bigram_keys = np.asarray(model.bigrams(language).key_array)
+    if len(bigram_keys) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    position = np.minimum(np.searchsorted(bigram_keys, keys), len(bigram_keys) - 1)
+    return position, (keys >= 0) & (bigram_keys[position] == keys)
+
+
+def score_bigram_batch(first: np.ndarray, keys: np.ndarray, line_index: np.ndarray, num_lines: int,
+                       model: NGramModel, vocab_size: int, sketches: dict = None) -> np.ndarray:
+    """
+    Computes the log probability of the bigrams of several lines (from bigram_batch) for every language of a model.
+    :param first: The id of the first token of every bigram (-1 for tokens not in the vocabulary).
+    :param keys: The key of every bigram (-1 for bigrams with a token not in the vocabulary).
+    :param line_index: The index of the line each bigram belongs to.
+    :param num_lines: The number of lines.
+    :param model: The model holding the counts of each language.
+    :param vocab_size: The total number of unique words in all training dictionaries
+    :param sketches: Approximate bigram counts keyed by language (CountMinSketch, see count_sketch.py) to look up
+    instead of the model's bigram counts (default: the model's exact counts)
+    :return: A (lines x languages) array of log probabilities, with languages in the order of model.languages
+    """
+    log_probs = np.empty((num_lines, len(model.languages)))
+    for column, language in enumerate(model.languages):
+        # get bigram counts from training
+        if sketches is not None:
+            bigram_occurrences = sketches[language].estimate_batch(keys, model)
+        else:
+            position, found = find_bigrams(model, language, keys)
+            bigram_occurrences = np.zeros(len(keys), dtype=np.int64)
+            bigram_occurrences[found] = np.asarray(model.bigrams(language).count_array)[position[found]]
+
+        # get unigram counts from training
+        unigram_counts = np.asarray(model.unigrams(language).count_array)
+        unigram_occurrences = np.where(first >= 0, unigram_counts[np.maximum(first, 0)], 0)
+
+        # calculate log probabilities and sum them per line, matching compute_log_prob
+        bigram_log_probs = np.log2((bigram_occurrences + 1) / (unigram_occurrences + vocab_size))
+        log_probs[:, column] = np.bincount(line_index, weights=bigram_log_probs, minlength=num_lines)
+
+    return log_probs
+
+
+def compute_log_prob_batch(lines: list[str], model: NGramModel, vocab_size: int, sketches: dict = None) -> np.ndarray:
+    """
+    Computes the log probability of several lines of text for every language of a model at once.
+    The lines are tokenized like compute_log_prob and their tokens mapped to ids; the counts of all bigrams of all lines
+    are then looked up per language with vectorized binary searches of the model's sorted bigram keys.
+    :param lines: The lines of text to calculate the probabilities of.
+    :param model: The model holding the counts of each language.
+    :param vocab_size: The total number of unique words in all training dictionaries
+    :param sketches: Approximate bigram counts keyed by language to look up instead of the model's (see
+    score_bigram_batch)
+    :return: A (lines x languages) array of log probabilities, with languages in the order of model.languages
+    """
+    first, _, keys, line_index = bigram_batch(lines, model)
+    return score_bigram_batch(first, keys, line_index, len(lines), model, vocab_size, sketches)
+
+
+class LanguageScorer:
+    """
+    Scores text against every language of a model, tokenizing the text once.
+    All languages of a model file share one vocabulary, so each line is tokenized and its bigrams mapped to ids once,
+    and then each language only looks up the counts of the shared bigram keys.
+    """
+
+    def __init__(self, model: NGramModel, vocab_size: int = None, smoothing=None, sketches: dict = None):
+        """
+        Creates a scorer for the languages of a model.
+        :param model: The model holding the counts of each language.
+        :param vocab_size: The vocabulary size used for Laplace smoothing (default: total unique words of all languages)
+        :param smoothing: A smoothing engine of the model (see smoothing.py) to score with instead of Laplace smoothing
+        (default: Laplace smoothing of the counts, as compute_log_prob)
+        :param sketches: Approximate bigram counts keyed by language (CountMinSketch, see count_sketch.py) to score with
+        Laplace smoothing instead of the model's bigram counts (default: the model's exact counts)
+        """
+        if smoothing is not None and sketches is not None:
+            raise ValueError('a scorer smooths either with a smoothing engine or the counts of sketches, not both')
+        self.model = model
+        self.languages = list(model.languages)
+        if vocab_size is None:
+            vocab_size = sum(len(model.unigrams(language)) for language in self.languages)
+        self.vocab_size = vocab_size
+        self.smoothing = smoothing
+        self.sketches = sketches
+        # remember the ids of recently seen tokens
+        self.token_id = lru_cache(maxsize=TOKEN_CACHE_SIZE)(model.token_id)
+
+        # unigram counts per language and token id (with a final entry for unknown tokens), and log2(c(v) + V), the
+        # denominator of every bigram starting with v
+        self.unigram_counts = np.zeros((len(self.languages), model.vocab_size + 1))
+        for row, language in enumerate(self.languages):
+            self.unigram_counts[row, :model.vocab_size] = np.asarray(model.unigrams(language).count_array)
+        self.log_denominator = np.log2(self.unigram_counts + self.vocab_size)
+        # sorted bigram keys and counts per language, mapped from the model file once
+        self.bigram_arrays = [(np.asarray(model.bigrams(language).key_array),
+                               np.asarray(model.bigrams(language).count_array)) for language in self.languages]
+
+    def bigram_ids(self, text: str) -> list[tuple[int, int]]:
+        """
+        Tokenizes text and maps each of its bigrams to the id of its first token and its bigram key.
+        :param text: The text to tokenize.
+        :return: A list of (first token id, bigram key) pairs; ids and keys are -1 for tokens not in the vocabulary
+        """
+        ids = [self.token_id(token) for token in tokenize_text(text)]
+        return [(first, bigram_key(first, second) if first >= 0 and second >= 0 else -1)
+                for first, second in zip(ids, ids[1:])]
+
+    def score_bigrams(self, bigrams: list[tuple[int, int]], language: str) -> float:
+        """
+        Computes the log probability of a list of bigrams (from bigram_ids) in one language, like compute_log_prob.
+        :param bigrams: The (first token id, bigram key) pairs of the text.
+        :param language: The language to score against.
+        :return: The log probability of the bigrams
+        """
+        unigram_counts = self.model.unigrams(language).count_array
+        bigram_dict = self.model.bigrams(language)
+
+        p_laplace = 0
+        for first, key in bigrams:
+            # get bigram and unigram counts from training
+            index = bigram_dict.index(key) if key >= 0 else -1
+            bigram_occurrences = bigram_dict.count_array[index] if index >= 0 else 0
+            unigram_occurrences = unigram_counts[first] if first >= 0 else 0
+
+            # calculate log probability
+            p_laplace += math.log((bigram_occurrences + 1) / (unigram_occurrences + self.vocab_size), 2)
+
+        return p_laplace
+
+    def score(self, text: str) -> dict[str, float]:
+        """
+        Computes the log probability of text in every language.
+        :param text: The text to score.
+        :return: A dictionary of log probabilities keyed by language
+        """
+        if self.smoothing is not None:
+            return self.smoothing.score(text)
+        if self.sketches is not None:
+            log_probs = compute_log_prob_batch([text], self.model, self.vocab_size, self.sketches)[0]
+            return {language: float(log_prob) for language, log_prob in zip(self.languages, log_probs)}
+        bigrams = self.bigram_ids(text)
+        return {language: self.score_bigrams(bigrams, language) for language in self.languages}
+
+    def rank(self, text: str) -> list[tuple[str, float]]:
+        """
+        Ranks the languages by the log probability of the text; ties keep the order of the model's languages.
+        :param text: The text to score.
+        :return: A list of (language, log probability) pairs from most to least probable
+        """
+        return sorted(self.score(text).items(), key=lambda item: item[1], reverse=True)
+
+    def top_k(self, text: str, k: int = 1, early_exit: bool = False,
+              block_size: int = BOUND_BLOCK_SIZE) -> list[tuple[str, float]]:
+        """
+        Finds the k most probable languages of text without fully scoring the languages that can't be among them.
+        A bigram (v, w) occurs at most min(c(v), c(w)) times, so it adds between -log2(c(v) + V) and
+        log2(min(c(v), c(w)) + 1) - log2(c(v) + V) to a language's score; both bounds need only the unigram counts, and
+        they are equal when either token is unknown to the language. A language is dropped once its best possible score
+        falls below the worst possible score of k other languages. This is checked before any bigram is scored and then
+        after every block of bigrams, scoring the bigrams with the widest bounds first. The bounds hold for Laplace
+        smoothing of exact counts only; a scorer with another smoothing engine or with sketches (whose estimates may
+        exceed the bound) ranks every language.
+        :param text: The text to score.
+        :param k: The number of languages to return.
+        :param early_exit: Whether to stop as soon as the k languages and their order are certain; their scores are then
+        lower bounds of their log probabilities rather than exact.
+        :param block_size: The number of bigrams scored between checks of the bounds.
+        :return: A list of up to k (language, log probability) pairs from most to least probable, ties in the order of
+        the model's languages, as rank(text)[:k] would give
+        """
+        if self.smoothing is not None or self.sketches is not None:
+            return self.rank(text)[:k]
+        bigrams = self.bigram_ids(text)
+        first = np.array([first for first, _ in bigrams], dtype=np.int64)
+        keys = np.array([key for _, key in bigrams], dtype=np.int64)
+        first[first < 0] = self.model.vocab_size
+        # bigrams with a token outside the vocabulary are unseen in every language
+        second = np.where(keys >= 0, keys & 0xFFFFFFFF, self.model.vocab_size)
+
+        # bounds of every bigram in every language, ordered from the widest to the narrowest
+        spread = np.log2(np.minimum(self.unigram_counts[:, first], self.unigram_counts[:, second]) + 1)
+        order = np.argsort(-spread.max(axis=0), kind='stable')
+        first = first[order]
+        keys = keys[order]
+        spread = spread[:, order]
+        lowest = -self.log_denominator[:, first]
+        # bounds of the bigrams after the first i, in column i
+        rest_low = np.zeros((len(self.languages), len(keys) + 1))
+        rest_low[:, :-1] = np.cumsum(lowest[:, ::-1], axis=1)[:, ::-1]
+        rest_high = np.zeros_like(rest_low)
+        rest_high[:, :-1] = np.cumsum((lowest + spread)[:, ::-1], axis=1)[:, ::-1]
+
+        scores = np.zeros(len(self.languages))
+        active = np.arange(len(self.languages))
+        done = 0
+        while True:
+            # drop the languages whose best case is below the worst case of k others (before any bigram is scored,
+            # this already drops languages that know few of the text's tokens)
+            low = scores[active] + rest_low[active, done]
+            high = scores[active] + rest_high[active, done]
+            if len(active) > k:
+                threshold = np.partition(low, len(low) - k)[len(low) - k]
+                keep = high >= threshold
+                active, low, high = active[keep], low[keep], high[keep]
+
+            # stop once the remaining languages are k or fewer and no remaining bigram can reorder them
+            if early_exit and len(active) <= k:
+                ranked = np.argsort(-low, kind='stable')
+                if np.all(low[ranked[:-1]] >= high[ranked[1:]]):
+                    return [(self.languages[active[i]], float(low[i])) for i in ranked]
+
+            if done == len(keys):
+                break
+
+            # score the next block exactly for the languages still in the running
+            block_keys = keys[done:done + block_size]
+            block_first = first[done:done + block_size]
+            done += len(block_keys)
+            for row in active:
+                bigram_keys, bigram_counts = self.bigram_arrays[row]
+                log_probs = -self.log_denominator[row, block_first]
+                if len(bigram_keys):
+                    position = np.minimum(bigram_keys.searchsorted(block_keys), len(bigram_keys) - 1)
+                    found = bigram_keys[position] == block_keys
+                    log_probs[found] += np.log2(bigram_counts[position[found]] + 1)
+                scores[row] += log_probs.sum()
+
+        ranked = active[np.argsort(-scores[active], kind='stable')][:k]
+        return [(self.languages[row], float(scores[row])) for row in ranked]
+
+
 # Main execution
 if __name__ == '__main__':
-    # Expects files to exist; failing for files being inaccessible is a suitable catastrophic failure given the scope.
+    # smoothing.py imports this module, so it is imported only when running as a program
+    from smoothing import select_smoothing, SMOOTHING_ENGINES, DEFAULT_SMOOTHING
 
-    # Get the dictionaries, the length of training data, and the vocab size from stored pickles
-    with open('LangId.train.English.unigrams.pickle', 'rb') as file:
-        english_unigrams = pickle.load(file)
-    with open('LangId.train.English.bigrams.pickle', 'rb') as file:
-        english_bigrams = pickle.load(file)
-
-    with open('LangId.train.French.unigrams.pickle', 'rb') as file:
-        french_unigrams = pickle.load(file)
-    with open('LangId.train.French.bigrams.pickle', 'rb') as file:
-        french_bigrams = pickle.load(file)
+    # Expects files to exist; failing for files being inaccessible is a suitable catastrophic failure given the scope.
+    parser = argparse.ArgumentParser(description='Identify the language of each line of LangId.test.')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=None,
+                        help='tokenizer the model was trained with (default: the one in the model\'s manifest)')
+    parser.add_argument('--smoothing', choices=list(SMOOTHING_ENGINES), default=DEFAULT_SMOOTHING,
+                        help='smoothing of the bigram probabilities (default: ' + DEFAULT_SMOOTHING + ')')
+    parser.add_argument('--model', default=MODEL_FILE, help='model file (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--sketches', default=None,
+                        help='score with the bigram sketches of this file (written by count_sketch.py as <model>.cms) '
+                             'instead of the model\'s bigram counts')
+    args = parser.parse_args()
+    if args.sketches is not None and args.smoothing != DEFAULT_SMOOTHING:
+        parser.error('--sketches is scored with ' + DEFAULT_SMOOTHING + ' smoothing only')
+    set_default_tokenizer(model_tokenizer(args.model, args.tokenizer))
 
-    with open('LangId.train.Italian.unigrams.pickle', 'rb') as file:
-        italian_unigrams = pickle.load(file)
-    with open('LangId.train.Italian.bigrams.pickle', 'rb') as file:
-        italian_bigrams = pickle.load(file)
+    # Map the unigram and bigram counts of each language from the model file
+    model = load_model(args.model)
+    if args.sketches is not None:
+        # count_sketch.py imports this module too
+        from count_sketch import load_sketches
+        scorer = LanguageScorer(model, sketches=load_sketches(args.sketches))
+    else:
+        scorer = LanguageScorer(model, smoothing=select_smoothing(args.smoothing, model))
 
     # Read in the test file
     with open('LangId.test', 'r', encoding='utf8') as file:
         lines = file.readlines()
 
-    # Calculate total vocab size of the three languages:
-    total_vocab_size = len(english_unigrams)
-    total_vocab_size += len(french_unigrams)
-    total_vocab_size += len(italian_unigrams)
-
     # Create a dictionary of predictions for each line
     i = 1  # start at 1 used to match indexes with the given file indexes
     predictions = {}
     for line in lines:
-        english_log_prog = compute_log_prob(line, english_unigrams, english_bigrams, total_vocab_size)
-        french_log_prog = compute_log_prob(line, french_unigrams, french_bigrams, total_vocab_size)
-        italian_log_prog = compute_log_prob(line, italian_unigrams, italian_bigrams, total_vocab_size)
-
-        # select greatest prediction as the prediction to save to the dictionary
-        max_log_prog = english_log_prog
-        predictions[i] = 'English'
-
-        if french_log_prog > max_log_prog:
-            max_log_prog = french_log_prog
-            predictions[i] = 'French'
-
-        if italian_log_prog > max_log_prog:
-            max_log_prog = italian_log_prog
-            predictions[i] = 'Italian'
-
+        # select the most probable language as the prediction to save to the dictionary
+        predictions[i] = scorer.top_k(line)[0][0]
         i += 1
 
     # Output predictions to a file
@@ -129,5 +409,5 @@ if __name__ == '__main__':
     if num_wrong == 0:
         print("[no predictions were misclassifications]")
 
-    # Output accuracy
-    print('Total accuracy: ' + str(1 - (num_wrong / i)))
+    # Output accuracy (i is one past the number of lines checked)
+    print('Total accuracy: ' + str(1 - (num_wrong / (i - 1))))
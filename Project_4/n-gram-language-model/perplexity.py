@@ -0,0 +1,236 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Perplexity
+This program measures how well each language model predicts held-out documents, as cross-entropy (bits per bigram)
+and perplexity, for every document and for the whole corpus. The documents are streamed from the input files and
+scored in batches by a pool of worker processes, so corpora larger than memory can be evaluated; progress and
+throughput are reported while it runs.
+
+A document's log probability in a language is the one computed by compute_log_prob (Laplace smoothed bigrams), or by
+a smoothing engine of smoothing.py (--smoothing); its cross-entropy is H = -log2 P / n for its n bigrams, and its
+perplexity is 2^H. The corpus cross-entropy is the total log probability of all documents divided by their total
+number of bigrams. Documents without any bigram are counted but not scored.
+"""
+
+from part2 import bigram_batch, score_bigram_batch, MODEL_FILE
+from ngram_model import load_model, model_tokenizer
+from smoothing import select_smoothing, SMOOTHING_ENGINES, DEFAULT_SMOOTHING
+from tokenizer import set_default_tokenizer, TOKENIZERS
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import numpy as np
+import argparse
+import time
+import sys
+import os
+
+# number of documents sent to a worker at a time
+BATCH_SIZE = 500
+# seconds between progress reports
+PROGRESS_INTERVAL = 5
+
+# the model of a worker process, opened once by load_worker_model
+_worker_model = None
+_worker_vocab_size = None
+_worker_smoothing = None
+
+
+def read_documents(filepaths: list[str], paragraphs: bool = False):
+    """
+    Streams the documents of several files: every non-empty line, or every paragraph separated by blank lines.
+    :param filepaths: The paths of the files to read.
+    :param paragraphs: Whether documents are paragraphs rather than lines.
+    :return: A generator of (file path, document number, text) tuples; documents are numbered from 1 in each file
+    """
+    for filepath in filepaths:
+        with open(filepath, 'r', encoding='utf8') as file:
+            number = 0
+            paragraph = []
+            for line in file:
+                if not paragraphs:
+                    if line.strip():
+                        number += 1
+                        yield filepath, number, line
+                elif line.strip():
+                    paragraph.append(line)
+                elif paragraph:
+                    number += 1
+                    yield filepath, number, ''.join(paragraph)
+                    paragraph = []
+            if paragraph:
+                number += 1
+                yield filepath, number, ''.join(paragraph)
+
+
+def batches(documents, batch_size: int = BATCH_SIZE):
+    """
+    Groups a stream of documents into lists.
+    :param documents: An iterable of documents.
+    :param batch_size: The number of documents per list.
+    :return: A generator of lists of up to batch_size documents
+    """
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_worker_model(model_filepath: str, vocab_size: int, tokenizer: str, smoothing: str = None):
+    """
+    Opens the model in a worker process, building the tables of its smoothing engine; used as the initializer of the
+    pool.
+    :param model_filepath: The path of the model file.
+    :param vocab_size: The vocabulary size used for smoothing.
+    :param tokenizer: The tokenizer the model was trained with.
+    :param smoothing: The name of the smoothing engine (default: Laplace smoothing, as compute_log_prob).
+    """
+    global _worker_model, _worker_vocab_size, _worker_smoothing
+    set_default_tokenizer(tokenizer)
+    _worker_model = load_model(model_filepath)
+    _worker_vocab_size = vocab_size
+    _worker_smoothing = select_smoothing(smoothing, _worker_model, vocab_size)
+
+
+def score_documents(texts: list[str]):
+    """
+    Computes the log probability of several documents in every language of the worker's model; the task run by the pool.
+    :param texts: The texts of the documents.
+    :return: A (documents x languages) array of log probabilities and the number of bigrams of each document
+    """
+    first, second, keys, line_index = bigram_batch(texts, _worker_model)
+    if _worker_smoothing is not None:
+        log_probs = _worker_smoothing.score_bigram_batch(first, second, keys, line_index, len(texts))
+    else:
+        log_probs = score_bigram_batch(first, keys, line_index, len(texts), _worker_model, _worker_vocab_size)
+    return log_probs, np.bincount(line_index, minlength=len(texts))
+
+
+def evaluate_corpus(filepaths: list[str], model_filepath: str = MODEL_FILE, workers: int = 1, paragraphs: bool = False,
+                    output=None, batch_size: int = BATCH_SIZE, progress_interval: float = PROGRESS_INTERVAL,
+                    tokenizer: str = None, smoothing: str = None) -> dict:
+    """
+    Computes the cross-entropy and perplexity of every document of a corpus, and of the corpus, in every language.
+    :param filepaths: The files of the corpus.
+    :param model_filepath: The path of the model file.
+    :param workers: The number of worker processes (1 scores in this process).
+    :param paragraphs: Whether documents are paragraphs separated by blank lines rather than lines.
+    :param output: An open text file to write a tab-separated row of scores per document to (default: none).
+    :param batch_size: The number of documents sent to a worker at a time.
+    :param progress_interval: Seconds between progress reports on standard error (0 for none).
+    :param tokenizer: The tokenizer the model was trained with ('nltk' or 'fast'; default: the one in its manifest).
+    :param smoothing: The name of the smoothing engine (see smoothing.py; default: Laplace smoothing).
+    :return: A dictionary of the corpus totals and, per language, the corpus cross-entropy and perplexity and the number
+    of documents the language predicts best
+    """
+    tokenizer = model_tokenizer(model_filepath, tokenizer)
+    model = load_model(model_filepath)
+    languages = list(model.languages)
+    vocab_size = sum(len(model.unigrams(language)) for language in languages)
+    model.close()
+
+    if output is not None:
+        output.write('\t'.join(['file', 'document', 'bigrams', 'best']
+                                + [language + ' ' + measure for measure in ('cross-entropy', 'perplexity')
+                                   for language in languages]) + '\n')
+
+    total_log_probs = np.zeros(len(languages))
+    best_counts = np.zeros(len(languages), dtype=np.int64)
+    totals = {'documents': 0, 'scored_documents': 0, 'bigrams': 0, 'characters': 0}
+    start_time = time.perf_counter()
+    last_report = start_time
+
+    def collect(batch, result):
+        nonlocal last_report
+        log_probs, bigram_counts = result
+        scored = bigram_counts > 0
+        total_log_probs[:] += log_probs[scored].sum(axis=0)
+        best_counts[:] += np.bincount(log_probs[scored].argmax(axis=1), minlength=len(languages))
+        totals['documents'] += len(batch)
+        totals['scored_documents'] += int(scored.sum())
+        totals['bigrams'] += int(bigram_counts.sum())
+        totals['characters'] += sum(len(text) for _, _, text in batch)
+
+        if output is not None:
+            for (filepath, number, _), row, count in zip(batch, log_probs, bigram_counts):
+                if count == 0:
+                    continue
+                cross_entropy = -row / count
+                output.write('\t'.join([filepath, str(number), str(count), languages[int(row.argmax())]]
+                                       + ['{0:.4f}'.format(h) for h in cross_entropy]
+                                       + ['{0:.2f}'.format(2 ** h) for h in cross_entropy]) + '\n')
+
+        # report progress every interval
+        now = time.perf_counter()
+        if progress_interval and now - last_report >= progress_interval:
+            last_report = now
+            print('{0} documents, {1:.1f} MB, {2:.0f} documents/s, {3:.2f} MB/s'.format(
+                totals['documents'], totals['characters'] / 1e6, totals['documents'] / (now - start_time),
+                totals['characters'] / 1e6 / (now - start_time)), file=sys.stderr)
+
+    documents = batches(read_documents(filepaths, paragraphs), batch_size)
+    if workers <= 1:
+        load_worker_model(model_filepath, vocab_size, tokenizer, smoothing)
+        for batch in documents:
+            collect(batch, score_documents([text for _, _, text in batch]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_worker_model,
+                                 initargs=(model_filepath, vocab_size, tokenizer, smoothing)) as pool:
+            # keep a few batches per worker in flight, so reading stays ahead of scoring without filling memory
+            pending = deque()
+            for batch in documents:
+                pending.append((batch, pool.submit(score_documents, [text for _, _, text in batch])))
+                if len(pending) >= 2 * workers:
+                    collect(pending[0][0], pending.popleft()[1].result())
+            while pending:
+                collect(pending[0][0], pending.popleft()[1].result())
+
+    seconds = time.perf_counter() - start_time
+    results = {**totals,
+               'seconds': seconds,
+               'documents_per_second': totals['documents'] / seconds if seconds > 0 else 0,
+               'languages': {}}
+    for column, language in enumerate(languages):
+        cross_entropy = -total_log_probs[column] / totals['bigrams'] if totals['bigrams'] else float('nan')
+        results['languages'][language] = {'cross_entropy': cross_entropy,
+                                          'perplexity': 2 ** cross_entropy,
+                                          'best_documents': int(best_counts[column])}
+    return results
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the cross-entropy and perplexity of held-out documents.')
+    parser.add_argument('files', nargs='+', help='files of held-out documents')
+    parser.add_argument('--model', default=MODEL_FILE, help='model file (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--paragraphs', action='store_true',
+                        help='documents are paragraphs separated by blank lines (default: every line is a document)')
+    parser.add_argument('--output', default=None, help='tab-separated file of the scores of every document')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='documents sent to a worker at a time')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=None,
+                        help='tokenizer the model was trained with (default: the one in the model\'s manifest)')
+    parser.add_argument('--smoothing', choices=list(SMOOTHING_ENGINES), default=DEFAULT_SMOOTHING,
+                        help='smoothing of the bigram probabilities (default: ' + DEFAULT_SMOOTHING + ')')
+    args = parser.parse_args()
+
+    output_file = open(args.output, 'w', encoding='utf8') if args.output is not None else None
+    try:
+        corpus = evaluate_corpus(args.files, args.model, max(args.workers, 1), args.paragraphs, output_file,
+                                 args.batch_size, tokenizer=args.tokenizer, smoothing=args.smoothing)
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    print('{documents} documents ({scored_documents} scored), {bigrams} bigrams in {seconds:.2f} s '
+          '({documents_per_second:.0f} documents/s)'.format(**corpus))
+    print('language\tcross-entropy\tperplexity\tbest for')
+    for name, scores in corpus['languages'].items():
+        print('{0}\t\t{1:.4f}\t\t{2:.1f}\t\t{3} documents'.format(
+            name, scores['cross_entropy'], scores['perplexity'], scores['best_documents']))
@@ -0,0 +1,203 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Prune Model
+This program removes bigrams that contribute little to classification from a model file and writes the pruned model to
+a separate file (LangId.pruned.model by default), and reports the size, load time, scoring throughput and accuracy on
+LangId.test of the model at several pruning levels. The pruned model's manifest lists the source files of the model and
+how it was pruned; update_model.py refuses to add counts to a pruned model, since its pruned bigrams are gone.
+
+Two criteria are available, and a bigram is removed if it fails either:
+    count threshold     bigrams seen fewer than min_count times are removed
+    relative entropy    (Stolcke pruning) bigrams whose removal changes the model's distribution by less than a
+                        threshold are removed. Removing the bigram (v, w) changes P(w | v) from (c(v, w) + 1) / (c(v) + V)
+                        to 1 / (c(v) + V) and no other probability, since the Laplace denominator only depends on the
+                        unigram count c(v), so the increase in relative entropy is
+                            P(v) P(w | v) log2(c(v, w) + 1)     with P(v) = c(v) / N
+Unigram counts are kept, so the vocabulary, the smoothing denominators and the score of every remaining bigram are
+unchanged; a removed bigram scores as if it had not been seen.
+"""
+
+from part2 import compute_log_prob_batch, MODEL_FILE
+from smoothing import select_smoothing, SMOOTHING_ENGINES, DEFAULT_SMOOTHING
+from ngram_model import load_model, write_model, load_manifest, write_manifest, PRUNED_KEY
+import argparse
+import math
+import time
+import os
+
+
+def pruned_filepath(model_filepath: str) -> str:
+    """
+    Names the pruned model of a model file: LangId.model is pruned to LangId.pruned.model.
+    :param model_filepath: The path of the model file.
+    :return: The path of the pruned model file
+    """
+    root, extension = os.path.splitext(model_filepath)
+    return root + '.pruned' + extension
+
+
+def relative_entropy(bigram_count: int, context_count: int, total: int, vocab_size: int) -> float:
+    """
+    Computes how much the model's relative entropy grows if a bigram is removed.
+    :param bigram_count: The count of the bigram (v, w).
+    :param context_count: The unigram count of v.
+    :param total: The total number of tokens of the language.
+    :param vocab_size: The vocabulary size used for Laplace smoothing.
+    :return: The increase in relative entropy (in bits)
+    """
+    probability = (bigram_count + 1) / (context_count + vocab_size)
+    return context_count / total * probability * math.log(bigram_count + 1, 2)
+
+
+def prune_counts(models: dict[str, tuple[dict, dict]], min_count: int = 1, entropy_threshold: float = 0,
+                 vocab_size: int = None) -> dict[str, tuple[dict, dict]]:
+    """
+    Removes the bigrams that fail the count threshold or the relative entropy threshold from the counts of every language.
+    :param models: A dictionary of (unigram dictionary, bigram dictionary) keyed by language.
+    :param min_count: The smallest bigram count kept.
+    :param entropy_threshold: The smallest increase in relative entropy (in bits) for which a bigram is kept.
+    :param vocab_size: The vocabulary size used for Laplace smoothing (default: total unique words of all languages)
+    :return: A dictionary of (unigram dictionary, pruned bigram dictionary) keyed by language
+    """
+    if vocab_size is None:
+        vocab_size = sum(len(unigram_dict) for unigram_dict, _ in models.values())
+
+    pruned = {}
+    for language, (unigram_dict, bigram_dict) in models.items():
+        total = sum(unigram_dict.values())
+        kept = {}
+        for bigram, count in bigram_dict.items():
+            if count < min_count:
+                continue
+            if entropy_threshold > 0 and \
+                    relative_entropy(count, unigram_dict[bigram[0]], total, vocab_size) < entropy_threshold:
+                continue
+            kept[bigram] = count
+        pruned[language] = (unigram_dict, kept)
+    return pruned
+
+
+def prune_model(model_filepath: str, output_filepath: str, min_count: int = 1, entropy_threshold: float = 0) -> dict:
+    """
+    Prunes the bigrams of a model file and writes the pruned model, with the model's manifest and a record of the
+    pruning added to it.
+    :param model_filepath: The path of the model file to prune.
+    :param output_filepath: The path of the pruned model file (may be the same as model_filepath, which then can no
+    longer be updated).
+    :param min_count: The smallest bigram count kept.
+    :param entropy_threshold: The smallest increase in relative entropy (in bits) for which a bigram is kept.
+    :return: A dictionary of the number of bigrams before and after pruning
+    """
+    model = load_model(model_filepath)
+    models = model.to_dicts()
+    model.close()
+
+    pruned = prune_counts(models, min_count, entropy_threshold)
+    write_model(output_filepath, pruned)
+    # the pruned model was counted from the same files; recording the pruning keeps update_model from adding to it
+    manifest = load_manifest(model_filepath)
+    manifest[PRUNED_KEY] = manifest.get(PRUNED_KEY, []) + [{'source': model_filepath,
+                                                            'min_count': min_count,
+                                                            'entropy_threshold': entropy_threshold,
+                                                            'pruned': time.strftime('%Y-%m-%dT%H:%M:%S')}]
+    write_manifest(output_filepath, manifest)
+
+    return {'bigrams': sum(len(bigram_dict) for _, bigram_dict in models.values()),
+            'kept': sum(len(bigram_dict) for _, bigram_dict in pruned.values())}
+
+
+def measure(model_filepath: str, lines: list[str], answers: list[str], repeat: int = 5) -> dict:
+    """
+    Measures the size of a model file, the time to load it, its scoring throughput, and its accuracy on test lines with
+    every smoothing engine (pruning removes the bigrams seen once, which some smoothing formulas are estimated from).
+    :param model_filepath: The path of the model file.
+    :param lines: The test lines.
+    :param answers: The language of each test line.
+    :param repeat: How many times to load and score to take the fastest time.
+    :return: A dictionary of the measurements, with the accuracy of each smoothing engine keyed by its name
+    """
+    load_seconds = math.inf
+    score_seconds = math.inf
+    for _ in range(repeat):
+        # load the model and read every count once, so the pages of the file are actually mapped
+        start_time = time.perf_counter()
+        model = load_model(model_filepath)
+        for language in model.languages:
+            sum(model.bigrams(language).count_array)
+        load_seconds = min(load_seconds, time.perf_counter() - start_time)
+
+        vocab_size = sum(len(model.unigrams(language)) for language in model.languages)
+        start_time = time.perf_counter()
+        log_probs = compute_log_prob_batch(lines, model, vocab_size)
+        score_seconds = min(score_seconds, time.perf_counter() - start_time)
+
+        predicted = {DEFAULT_SMOOTHING: [model.languages[int(row.argmax())] for row in log_probs]}
+        bigrams = sum(len(model.bigrams(language)) for language in model.languages)
+        model.close()
+
+    # the accuracy of the other engines, which build their tables from the counts
+    model = load_model(model_filepath)
+    for name in SMOOTHING_ENGINES:
+        engine = select_smoothing(name, model, vocab_size)
+        if engine is not None:
+            predicted[name] = [model.languages[int(row.argmax())] for row in engine.score_batch(lines)]
+            del engine
+    model.close()
+
+    return {'bytes': os.path.getsize(model_filepath),
+            'bigrams': bigrams,
+            'load_ms': load_seconds * 1000,
+            'lines_per_second': len(lines) / score_seconds,
+            'accuracy': {name: sum(p == a for p, a in zip(predictions, answers)) / len(answers)
+                         for name, predictions in predicted.items()}}
+
+
+def report(model_filepath: str, levels: list[tuple[int, float]], output_directory: str):
+    """
+    Prunes a model at several levels and prints the measurements of each pruned model.
+    :param model_filepath: The path of the model file to prune.
+    :param levels: The (min_count, entropy_threshold) pairs to prune with.
+    :param output_directory: The directory to write the pruned models to.
+    """
+    with open('LangId.test', 'r', encoding='utf8') as file:
+        lines = file.readlines()
+    with open('LangId.sol', 'r', encoding='utf8') as file:
+        answers = [line.split()[1] for line in file if line.strip()]
+
+    print('min count\tentropy\t\tbigrams\tbytes\t\tload ms\tlines/s\taccuracy (' + ', '.join(SMOOTHING_ENGINES) + ')')
+    for min_count, entropy_threshold in levels:
+        output_filepath = os.path.join(output_directory, 'LangId.pruned-{0}-{1:g}.model'.format(
+            min_count, entropy_threshold))
+        prune_model(model_filepath, output_filepath, min_count, entropy_threshold)
+        result = measure(output_filepath, lines, answers)
+        print('{0}\t\t{1:<8g}\t{bigrams}\t{bytes}\t\t{load_ms:.2f}\t{lines_per_second:.0f}\t{2}'.format(
+            min_count, entropy_threshold, '\t'.join('{0:.4f}'.format(result['accuracy'][name])
+                                                    for name in SMOOTHING_ENGINES), **result))
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove low-count and low-information bigrams from a model file.')
+    parser.add_argument('--model', default=MODEL_FILE, help='model file to prune (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--output', default=None,
+                        help='pruned model file (default: the model file name with .pruned before its extension)')
+    parser.add_argument('--min-count', type=int, default=2, help='smallest bigram count kept (default: 2)')
+    parser.add_argument('--entropy-threshold', type=float, default=0,
+                        help='smallest relative entropy increase (bits) for which a bigram is kept (default: 0)')
+    parser.add_argument('--report', default=None, metavar='DIRECTORY',
+                        help='instead of pruning once, write models pruned at several levels to DIRECTORY and compare them')
+    args = parser.parse_args()
+
+    if args.report is not None:
+        os.makedirs(args.report, exist_ok=True)
+        # keep an unpruned copy as the first level
+        report(args.model, [(1, 0), (2, 0), (3, 0), (5, 0), (1, 1e-7), (1, 1e-6), (1, 1e-5), (2, 1e-6)], args.report)
+    else:
+        output = args.output if args.output is not None else pruned_filepath(args.model)
+        before = os.path.getsize(args.model)
+        counts = prune_model(args.model, output, args.min_count, args.entropy_threshold)
+        print('Kept {kept} of {bigrams} bigrams'.format(**counts))
+        print('Output file: {0} ({1} bytes, was {2})'.format(output, os.path.getsize(output), before))
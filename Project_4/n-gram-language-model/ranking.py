@@ -0,0 +1,127 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Ranking
+This program measures how the time to identify a line grows with the number of languages in the model, for full
+ranking (LanguageScorer.rank), top-k ranking with pruning (LanguageScorer.top_k) and top-k ranking with early exit.
+
+The LangId corpora only have three languages, so models with more languages are made from copies of each training
+file ('English.0', 'English.1', ...), in one of two ways:
+    cipher  every copy but the first has its letters substituted by a fixed permutation, giving a language with the
+            statistics of a real one but a vocabulary of its own (like distinct real languages)
+    split   every copy is a different part of the file, giving languages that are nearly impossible to tell apart (like
+            dialects); this is the worst case for pruning
+"""
+
+from part1 import read_chunks, tokenize_text, update_counts, find_training_files
+from part2 import LanguageScorer
+from ngram_model import write_model, load_model
+from tokenizer import set_default_tokenizer, TOKENIZERS, DEFAULT_TOKENIZER
+from collections import Counter
+import argparse
+import tempfile
+import random
+import string
+import time
+import os
+
+
+def split_language_models(training_files: dict[str, str], parts: int) -> dict[str, tuple[dict, dict]]:
+    """
+    Counts each training file as several languages, one per contiguous part of its lines.
+    :param training_files: A dictionary of training file paths keyed by language name.
+    :param parts: The number of parts to split each file into.
+    :return: A dictionary of (unigram dictionary, bigram dictionary) keyed by '<language>.<part>'
+    """
+    models = {}
+    for language, path in training_files.items():
+        with open(path, 'r', encoding='utf8') as file:
+            lines = file.readlines()
+        size = -(-len(lines) // parts)
+        for part in range(parts):
+            unigram_count = Counter()
+            bigram_count = Counter()
+            previous = None
+            for chunk in read_chunks(lines[part * size:(part + 1) * size]):
+                previous = update_counts(tokenize_text(chunk), unigram_count, bigram_count, previous)
+            models[language + '.' + str(part)] = (dict(unigram_count), dict(bigram_count))
+    return models
+
+
+def cipher_language_models(training_files: dict[str, str], copies: int) -> dict[str, tuple[dict, dict]]:
+    """
+    Counts each training file as several languages: the file itself and copies with their letters substituted by
+    different fixed permutations, which have the statistics of a real language but a vocabulary of their own.
+    :param training_files: A dictionary of training file paths keyed by language name.
+    :param copies: The number of languages to make from each file (the first is the file unchanged).
+    :return: A dictionary of (unigram dictionary, bigram dictionary) keyed by '<language>.<copy>'
+    """
+    letters = string.ascii_lowercase
+    models = {}
+    for language, path in training_files.items():
+        with open(path, 'r', encoding='utf8') as file:
+            text = file.read().lower()
+        for copy in range(copies):
+            shuffled = list(letters)
+            if copy > 0:
+                random.Random(copy).shuffle(shuffled)
+            unigram_count = Counter()
+            bigram_count = Counter()
+            previous = None
+            for chunk in read_chunks(text.translate(str.maketrans(letters, ''.join(shuffled))).splitlines(True)):
+                previous = update_counts(tokenize_text(chunk), unigram_count, bigram_count, previous)
+            models[language + '.' + str(copy)] = (dict(unigram_count), dict(bigram_count))
+    return models
+
+
+def time_ranking(scorer: LanguageScorer, lines: list[str], k: int) -> dict:
+    """
+    Measures the average time per line of full ranking, top-k ranking and top-k ranking with early exit.
+    :param scorer: The scorer of the model.
+    :param lines: The lines to identify.
+    :param k: The number of languages to find.
+    :return: A dictionary of the microseconds per line of each method and how often the early exit top-k agreed with
+    the full ranking
+    """
+    methods = {'rank': lambda line: scorer.rank(line)[:k],
+               'top_k': lambda line: scorer.top_k(line, k),
+               'early_exit': lambda line: scorer.top_k(line, k, early_exit=True)}
+    results = {}
+    rankings = {}
+    for name, method in methods.items():
+        start_time = time.perf_counter()
+        rankings[name] = [[language for language, _ in method(line)] for line in lines]
+        results[name] = (time.perf_counter() - start_time) / len(lines) * 1e6
+    results['agreement'] = sum(a == b for a, b in zip(rankings['rank'], rankings['early_exit'])) / len(lines)
+    return results
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time language ranking as the number of languages grows.')
+    parser.add_argument('--copies', type=int, nargs='+', default=[1, 4, 10, 20, 33],
+                        help='numbers of languages to make from each training file')
+    parser.add_argument('--mode', choices=['cipher', 'split'], default='cipher',
+                        help='make the languages by substituting letters or by splitting the files')
+    parser.add_argument('-k', type=int, default=1, help='number of languages to find')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=DEFAULT_TOKENIZER,
+                        help='tokenizer to train and score with (default: ' + DEFAULT_TOKENIZER + ')')
+    args = parser.parse_args()
+    set_default_tokenizer(args.tokenizer)
+
+    with open('LangId.test', 'r', encoding='utf8') as test_file:
+        test_lines = test_file.readlines()
+
+    print('languages\trank us/line\ttop-k us/line\tearly exit us/line\tearly exit agreement')
+    with tempfile.TemporaryDirectory() as directory:
+        make_models = cipher_language_models if args.mode == 'cipher' else split_language_models
+        for num_copies in args.copies:
+            model_path = os.path.join(directory, 'ranking.model')
+            write_model(model_path, make_models(find_training_files(), num_copies))
+            model = load_model(model_path)
+            result = time_ranking(LanguageScorer(model), test_lines, args.k)
+            print('{0}\t\t{1:.0f}\t\t{2:.0f}\t\t{3:.0f}\t\t\t{4:.4f}'.format(
+                len(model.languages), result['rank'], result['top_k'], result['early_exit'], result['agreement']))
+            model.close()
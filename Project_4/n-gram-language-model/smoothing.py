@@ -0,0 +1,347 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Smoothing
+This program provides smoothing engines (Laplace, Witten-Bell and interpolated Kneser-Ney) that turn the counts of a
+model file into tables of log probabilities, and benchmarks their accuracy and throughput on LangId.test against the
+per-line scoring of part 2.
+
+Every engine computes three tables per language when it is created, so that scoring a bigram (v, w) is one lookup and
+at most one addition:
+    seen        the log probability of every bigram seen in training, in the order of the model's bigram keys
+    backoff     for every context v, the log weight given to the lower-order distribution (0 if v was never a context)
+    lower       for every word w, the log probability of w under the lower-order distribution
+A seen bigram scores seen[index]; an unseen bigram scores backoff[v] + lower[w]. Token id vocab_size stands for any
+token outside the model's vocabulary.
+"""
+
+from part2 import compute_log_prob, compute_log_prob_batch, bigram_batch, find_bigrams, MODEL_FILE
+from ngram_model import load_model, write_model, NGramModel
+from part1 import tokenize_text
+from abc import ABC, abstractmethod
+import numpy as np
+import argparse
+import tempfile
+import math
+import time
+import os
+
+
+class Smoothing(ABC):
+    """
+    Base class of the smoothing engines: builds the tables of each language and scores lines with them.
+    Subclasses implement build_tables.
+    """
+
+    # name used to choose the engine
+    name = ''
+
+    def __init__(self, model: NGramModel, vocab_size: int = None):
+        """
+        Builds the log probability tables of every language of a model.
+        :param model: The model holding the counts of each language.
+        :param vocab_size: The vocabulary size used to smooth (default: total unique words of all languages)
+        """
+        self.model = model
+        self.languages = list(model.languages)
+        if vocab_size is None:
+            vocab_size = sum(len(model.unigrams(language)) for language in self.languages)
+        self.vocab_size = vocab_size
+        self.tables = {language: self.build_tables(self.counts(language)) for language in self.languages}
+
+    def counts(self, language: str) -> dict:
+        """
+        Gathers the count arrays of a language that the smoothing formulas use.
+        :param language: The language.
+        :return: A dictionary of count arrays indexed by token id (with a final entry for unknown tokens)
+        """
+        model_size = self.model.vocab_size
+        bigram_keys = np.asarray(self.model.bigrams(language).key_array)
+        bigram_counts = np.asarray(self.model.bigrams(language).count_array).astype(np.float64)
+        first = bigram_keys >> 32
+        second = bigram_keys & 0xFFFFFFFF
+
+        unigram_counts = np.zeros(model_size + 1)
+        unigram_counts[:model_size] = np.asarray(self.model.unigrams(language).count_array)
+
+        return {'unigram': unigram_counts,
+                # number of times each token is followed by another token
+                'context': np.bincount(first, weights=bigram_counts, minlength=model_size + 1),
+                # number of distinct tokens following each token
+                'followers': np.bincount(first, minlength=model_size + 1).astype(np.float64),
+                # number of distinct tokens preceding each token
+                'preceders': np.bincount(second, minlength=model_size + 1).astype(np.float64),
+                'bigram': bigram_counts,
+                'first': first,
+                'second': second}
+
+    @abstractmethod
+    def build_tables(self, counts: dict):
+        """
+        Computes the seen, backoff and lower tables of a language.
+        :param counts: The count arrays of the language (from counts).
+        :return: The seen, backoff and lower arrays (log base 2)
+        """
+
+    def score_bigram_batch(self, first: np.ndarray, second: np.ndarray, keys: np.ndarray, line_index: np.ndarray,
+                           num_lines: int) -> np.ndarray:
+        """
+        Computes the log probability of the bigrams of several lines (from bigram_batch) for every language.
+        :param first: The id of the first token of every bigram (-1 for tokens not in the vocabulary).
+        :param second: The id of the second token of every bigram (-1 for tokens not in the vocabulary).
+        :param keys: The key of every bigram (-1 for bigrams with a token not in the vocabulary).
+        :param line_index: The index of the line each bigram belongs to.
+        :param num_lines: The number of lines.
+        :return: A (lines x languages) array of log probabilities, with languages in the order of self.languages
+        """
+        # tokens outside the vocabulary use the final entry of the tables
+        first = np.where(first >= 0, first, self.model.vocab_size)
+        second = np.where(second >= 0, second, self.model.vocab_size)
+
+        log_probs = np.empty((num_lines, len(self.languages)))
+        for column, language in enumerate(self.languages):
+            seen, backoff, lower = self.tables[language]
+            position, found = find_bigrams(self.model, language, keys)
+            bigram_log_probs = np.where(found, seen[position] if len(seen) else 0, backoff[first] + lower[second])
+            log_probs[:, column] = np.bincount(line_index, weights=bigram_log_probs, minlength=num_lines)
+        return log_probs
+
+    def score_batch(self, lines: list[str]) -> np.ndarray:
+        """
+        Computes the log probability of several lines for every language.
+        :param lines: The lines of text.
+        :return: A (lines x languages) array of log probabilities, with languages in the order of self.languages
+        """
+        first, second, keys, line_index = bigram_batch(lines, self.model)
+        return self.score_bigram_batch(first, second, keys, line_index, len(lines))
+
+    def score(self, text: str) -> dict[str, float]:
+        """
+        Computes the log probability of text in every language.
+        :param text: The text to score.
+        :return: A dictionary of log probabilities keyed by language
+        """
+        return dict(zip(self.languages, self.score_batch([text])[0]))
+
+
+class LaplaceSmoothing(Smoothing):
+    """
+    Add-one smoothing: P(w | v) = (c(v, w) + 1) / (c(v) + V), as in compute_log_prob.
+    """
+
+    name = 'laplace'
+
+    def build_tables(self, counts: dict):
+        log_denominator = np.log2(counts['unigram'] + self.vocab_size)
+        seen = np.log2(counts['bigram'] + 1) - log_denominator[counts['first']]
+        return seen, -log_denominator, np.zeros(len(log_denominator))
+
+
+class WittenBellSmoothing(Smoothing):
+    """
+    Witten-Bell smoothing: P(w | v) = (c(v, w) + T(v) P(w)) / (c(v) + T(v)), where T(v) is the number of distinct
+    tokens seen after v and P(w) is the add-one smoothed unigram probability.
+    """
+
+    name = 'witten-bell'
+
+    def build_tables(self, counts: dict):
+        context = counts['context']
+        followers = counts['followers']
+        lower = np.log2((counts['unigram'] + 1) / (counts['unigram'].sum() + self.vocab_size))
+
+        # contexts never followed by a token fall back to the unigram distribution entirely
+        seen_context = followers > 0
+        denominator = np.where(seen_context, context + followers, 1)
+        backoff = np.where(seen_context, np.log2(np.maximum(followers, 1) / denominator), 0)
+
+        first = counts['first']
+        seen = np.log2((counts['bigram'] + followers[first] * np.exp2(lower[counts['second']])) / denominator[first])
+        return seen, backoff, lower
+
+
+class KneserNeySmoothing(Smoothing):
+    """
+    Interpolated Kneser-Ney smoothing: P(w | v) = max(c(v, w) - D, 0) / c(v) + D N(v) / c(v) Pc(w), where N(v) is the
+    number of distinct tokens seen after v, Pc(w) is the add-one smoothed continuation probability (the share of
+    distinct bigram types ending in w) and the discount D = n1 / (n1 + 2 n2) from the number of bigrams seen once and twice.
+    A model without bigrams seen once or twice (such as one pruned with a min count of 2) uses D = 0.75 instead, since
+    the formula would give D = 0 (and no weight at all to unseen bigrams) or D = 1.
+    """
+
+    name = 'kneser-ney'
+
+    def build_tables(self, counts: dict):
+        bigram_counts = counts['bigram']
+        context = counts['context']
+        followers = counts['followers']
+
+        # discount from the count of counts
+        once = np.count_nonzero(bigram_counts == 1)
+        twice = np.count_nonzero(bigram_counts == 2)
+        discount = once / (once + 2 * twice) if once > 0 and twice > 0 else 0.75
+
+        lower = np.log2((counts['preceders'] + 1) / (len(bigram_counts) + self.vocab_size))
+
+        # contexts never followed by a token fall back to the continuation distribution entirely
+        seen_context = context > 0
+        denominator = np.where(seen_context, context, 1)
+        interpolation = np.where(seen_context, discount * followers / denominator, 1)
+        backoff = np.log2(interpolation)
+
+        first = counts['first']
+        seen = np.log2((bigram_counts - discount) / denominator[first]
+                       + interpolation[first] * np.exp2(lower[counts['second']]))
+        return seen, backoff, lower
+
+
+# smoothing engines by name
+SMOOTHING_ENGINES = {engine.name: engine for engine in (LaplaceSmoothing, WittenBellSmoothing, KneserNeySmoothing)}
+# smoothing of compute_log_prob and the scoring of part 2
+DEFAULT_SMOOTHING = LaplaceSmoothing.name
+
+
+def make_smoothing(name: str, model: NGramModel, vocab_size: int = None) -> Smoothing:
+    """
+    Creates a smoothing engine by name.
+    :param name: The name of the engine ('laplace', 'witten-bell' or 'kneser-ney').
+    :param model: The model holding the counts of each language.
+    :param vocab_size: The vocabulary size used to smooth (default: total unique words of all languages)
+    :return: The smoothing engine with its tables built
+    """
+    if name not in SMOOTHING_ENGINES:
+        raise ValueError('unknown smoothing engine ' + repr(name) + '; choose from ' + ', '.join(SMOOTHING_ENGINES))
+    return SMOOTHING_ENGINES[name](model, vocab_size)
+
+
+def select_smoothing(name: str, model: NGramModel, vocab_size: int = None):
+    """
+    Creates the smoothing engine chosen for scoring (the --smoothing option), or None for the default smoothing, which
+    the scoring of part 2 (LanguageScorer, compute_log_prob_batch) applies to the counts directly without tables.
+    :param name: The name of the engine (default: DEFAULT_SMOOTHING).
+    :param model: The model holding the counts of each language.
+    :param vocab_size: The vocabulary size used to smooth (default: total unique words of all languages)
+    :return: The smoothing engine, or None for the default smoothing
+    """
+    if name is None or name == DEFAULT_SMOOTHING:
+        return None
+    return make_smoothing(name, model, vocab_size)
+
+
+def legacy_log_prob(text: str, unigram_dict, bigram_dict, vocab_size: int) -> float:
+    """
+    The previous compute_log_prob, kept as the benchmark baseline: it summed log(c(v, w) + 1 / (c(v) + V)) from 1.
+    """
+    unigrams = tokenize_text(text)
+    p_laplace = 1
+    for bigram in zip(unigrams, unigrams[1:]):
+        bigram_occurrences = bigram_dict[bigram] if bigram in bigram_dict else 0
+        unigram_occurrences = unigram_dict[bigram[0]] if bigram[0] in unigram_dict else 0
+        p_laplace += math.log((bigram_occurrences + 1 / (unigram_occurrences + vocab_size)), 2)
+    return p_laplace
+
+
+def benchmark(model: NGramModel, lines: list[str], answers: list[str], repeat: int = 10) -> list[dict]:
+    """
+    Measures the accuracy, the average log probability per line of the correct language, and the throughput of the
+    per-line scoring of part 2 (previous and corrected formula) and of each smoothing engine.
+    :param model: The model holding the counts of each language.
+    :param lines: The test lines.
+    :param answers: The language of each test line.
+    :param repeat: How many copies of the test lines to score when timing the batch engines.
+    :return: A list of the measurements of each method
+    """
+    languages = model.languages
+    vocab_size = sum(len(model.unigrams(language)) for language in languages)
+    results = []
+
+    def measure(method: str, score_lines, timed_lines: list[str], build_seconds: float = 0):
+        start_time = time.perf_counter()
+        log_probs = score_lines(timed_lines)
+        seconds = time.perf_counter() - start_time
+        log_probs = log_probs[:len(lines)]
+        predicted = [languages[int(row.argmax())] for row in log_probs]
+        correct_column = [languages.index(answer) for answer in answers]
+        results.append({'method': method,
+                        'build_seconds': build_seconds,
+                        'accuracy': sum(p == a for p, a in zip(predicted, answers)) / len(answers),
+                        'log_prob_per_line': float(np.mean(log_probs[np.arange(len(lines)), correct_column])),
+                        'lines_per_second': len(timed_lines) / seconds})
+
+    def per_line(score_function):
+        return lambda batch: np.array([[score_function(line, model.unigrams(language), model.bigrams(language),
+                                                       vocab_size) for language in languages] for line in batch])
+
+    measure('legacy compute_log_prob', per_line(legacy_log_prob), lines)
+    measure('compute_log_prob', per_line(compute_log_prob), lines)
+    measure('compute_log_prob_batch', lambda batch: compute_log_prob_batch(batch, model, vocab_size), lines * repeat)
+    for name in SMOOTHING_ENGINES:
+        start_time = time.perf_counter()
+        engine = make_smoothing(name, model, vocab_size)
+        build_seconds = time.perf_counter() - start_time
+        measure(name + ' tables', engine.score_batch, lines * repeat, build_seconds)
+
+    return results
+
+
+def check_pruned(model: NGramModel, lines: list[str], answers: list[str], min_count: int = 2,
+                  min_accuracy: float = 0.9) -> list[str]:
+    """
+    Scores a copy of a model without its bigrams seen fewer than min_count times (as prune_model.py writes it) with
+    every smoothing engine, checking that every score is finite and every engine stays accurate. Pruning removes the
+    bigrams seen once, which the discount of Kneser-Ney smoothing is estimated from.
+    :param model: The model holding the counts of each language.
+    :param lines: The test lines.
+    :param answers: The language of each test line.
+    :param min_count: The smallest bigram count kept in the pruned copy.
+    :param min_accuracy: The lowest accuracy an engine may have on the pruned copy.
+    :return: A list of the problems found (empty if every engine passed)
+    """
+    pruned = {language: (unigram_dict, {bigram: count for bigram, count in bigram_dict.items() if count >= min_count})
+              for language, (unigram_dict, bigram_dict) in model.to_dicts().items()}
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        pruned_filepath = os.path.join(directory, 'pruned.model')
+        write_model(pruned_filepath, pruned)
+        pruned_model = load_model(pruned_filepath)
+        for name in SMOOTHING_ENGINES:
+            log_probs = make_smoothing(name, pruned_model).score_batch(lines)
+            predicted = [pruned_model.languages[int(row.argmax())] for row in log_probs]
+            accuracy = sum(p == a for p, a in zip(predicted, answers)) / len(answers)
+            infinite = int(np.count_nonzero(~np.isfinite(log_probs)))
+            print('{0:<12}	min count {1}	accuracy {2:.4f}	{3} scores not finite'.format(
+                name, min_count, accuracy, infinite))
+            if infinite:
+                problems.append('{0}: {1} scores are not finite'.format(name, infinite))
+            if accuracy < min_accuracy:
+                problems.append('{0}: accuracy {1:.4f} is below {2}'.format(name, accuracy, min_accuracy))
+        pruned_model.close()
+    return problems
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the smoothing engines on LangId.test.')
+    parser.add_argument('--model', default=MODEL_FILE, help='model file (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--repeat', type=int, default=10, help='copies of the test lines to time the batch engines on')
+    parser.add_argument('--check', action='store_true',
+                        help='instead of benchmarking, check every engine on a copy of the model pruned with min count 2')
+    args = parser.parse_args()
+
+    with open('LangId.test', 'r', encoding='utf8') as file:
+        test_lines = file.readlines()
+    with open('LangId.sol', 'r', encoding='utf8') as file:
+        test_answers = [line.split()[1] for line in file if line.strip()]
+
+    if args.check:
+        failures = check_pruned(load_model(args.model), test_lines, test_answers)
+        for failure in failures:
+            print('FAILED:', failure)
+        raise SystemExit(1 if failures else 0)
+
+    print('method\t\t\tbuild s\taccuracy\tlog2 P per line\tlines/s')
+    for result in benchmark(load_model(args.model), test_lines, test_answers, args.repeat):
+        print('{method:<24}\t{build_seconds:.3f}\t{accuracy:.4f}\t\t{log_prob_per_line:.2f}\t\t{lines_per_second:.0f}'
+              .format(**result))
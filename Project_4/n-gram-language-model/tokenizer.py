@@ -0,0 +1,298 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Tokenizer
+This program provides the tokenizers the language model can be trained and scored with, checks that the fast tokenizer
+splits the LangId files into the same tokens as nltk's word_tokenize, and measures the tokens per second of both.
+
+word_tokenize splits text into sentences with the Punkt sentence tokenizer and then runs about thirty regular
+expression substitutions over every sentence. Almost all of those rules only look inside a whitespace-separated word,
+and the LangId corpora repeat a small vocabulary of words, so the fast tokenizer splits text on whitespace and
+tokenizes each distinct word once with the same Treebank rules, remembering the result. The one rule that depends on
+the sentence is the final period: word_tokenize splits the period off the last word of a sentence only, so the fast
+tokenizer decides sentence ends itself with Punkt's first pass (a word ending in a period ends a sentence unless it is
+a known abbreviation, an ellipsis, or an initial or number followed by a lowercase word).
+
+Known divergences from word_tokenize:
+    Punkt's second pass (collocations, frequent sentence starters and orthographic context) is not applied, so a
+    period-final word Punkt keeps inside a sentence for one of those reasons has its period split off.
+    A period followed by a closing bracket or quote ends a sentence only when the bracket or quote is in the same word.
+"""
+
+from nltk import word_tokenize
+from nltk.tokenize import NLTKWordTokenizer
+from functools import lru_cache
+import argparse
+import nltk.data
+import time
+import re
+
+# tokenizer used by tokenize_text when none is given
+DEFAULT_TOKENIZER = 'nltk'
+# number of distinct words whose tokens the fast tokenizer remembers
+WORD_CACHE_SIZE = 1 << 18
+# a word whose final period (possibly followed by closing brackets or quotes) may end a sentence
+PERIOD_FINAL = re.compile(r'[^.]\.[\]\)}>"\'»”’]*$')
+# a number or an initial, which Punkt does not end a sentence at when the next word is lowercase
+NUMBER_OR_INITIAL = re.compile(r'^(-?[.,]?\d[\d,.-]*|[^\W\d])\.$')
+
+# alphanumeric words that the Treebank rules still split in two (cannot, gonna, ...)
+SPLIT_WORDS = {'cannot', 'gimme', 'gonna', 'gotta', 'lemme', 'wanna'}
+# texts the tokenizers must agree on besides the LangId files: abbreviations, initials, numbers, ellipses, quotes,
+# brackets, contractions and split words
+CHECK_TEXTS = [
+    'mr. smith went to washington. he arrived on jan. 5.',
+    'Dr. Who? Yes. St. Louis is in the U.S.A. today.',
+    'j. r. r. tolkien wrote it. it sold well.',
+    'e.g. this, i.e. that. etc. and so on.',
+    'the u.s. economy grew 3.5% in 1999... then it stalled.',
+    'prices rose by 1,000.50 dollars. wow!',
+    'she said "hello." then she left.',
+    'see (fig. 3.) for details. the end.',
+    'q: what\'s up? a: nothing... really.',
+    'we\'ll meet at 5 p.m. tomorrow; don\'t be late!',
+    'i cannot believe it\'s not butter, can you? gonna wanna gotta lemme gimme',
+    'il n\'y a pas de problème. c\'est la vie.',
+    'l\'italia è una repubblica democratica, fondata sul lavoro.',
+]
+
+# the Treebank rules used by word_tokenize once text is split into sentences
+_treebank = NLTKWordTokenizer()
+# Punkt's known abbreviations, loaded on first use
+_abbreviations = None
+
+
+def abbreviations() -> set[str]:
+    """
+    Returns the abbreviations (without their period) that Punkt does not end a sentence at.
+    """
+    global _abbreviations
+    if _abbreviations is None:
+        try:
+            # the English Punkt data word_tokenize splits sentences with
+            text = nltk.data.load('tokenizers/punkt_tab/english/abbrev_types.txt', format='text')
+            _abbreviations = {line.strip() for line in text.splitlines() if line.strip()}
+        except LookupError:
+            # nltk versions before punkt_tab use the pickled Punkt tokenizer, whose parameters hold the abbreviations
+            _abbreviations = set(nltk.data.load('tokenizers/punkt/english.pickle')._params.abbrev_types)
+    return _abbreviations
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def word_tokens(word: str, sentence_end: bool) -> tuple[str, ...]:
+    """
+    Tokenizes one whitespace-separated word with the Treebank rules of word_tokenize.
+    :param word: The word to tokenize.
+    :param sentence_end: Whether the word ends a sentence (only then is a final period split off).
+    :return: The tokens of the word
+    """
+    if sentence_end:
+        return tuple(_treebank.tokenize(word))
+    # a following word keeps the final period rule from matching
+    return tuple(_treebank.tokenize(word + ' x')[:-1])
+
+
+def ends_sentence(word: str, next_word: str) -> bool:
+    """
+    Decides whether a word ends a sentence, like the first pass of the Punkt sentence tokenizer.
+    :param word: The word.
+    :param next_word: The word after it, or None if it is the last word of the text.
+    :return: True if word_tokenize would split the text into sentences after the word
+    """
+    if next_word is None:
+        return True
+    if not PERIOD_FINAL.search(word):
+        return False
+
+    # the word up to its final period, as Punkt sees it
+    core = word.rstrip('])}>"\'»”’')
+    if core.endswith('..'):
+        return False
+    if core[:-1] in abbreviations() or core[:-1].split('-')[-1] in abbreviations():
+        return False
+    # Punkt sees a closing bracket or quote after the period as the next word, which is not lowercase
+    if core == word and NUMBER_OR_INITIAL.match(core) and next_word[0].islower():
+        return False
+    return True
+
+
+def fast_tokenize(text: str) -> list[str]:
+    """
+    Tokenizes text like word_tokenize by splitting it on whitespace and tokenizing each word with remembered results.
+    :param text: The text to tokenize.
+    :return: A list of tokens
+    """
+    words = text.split()
+    tokens = []
+    for i, word in enumerate(words):
+        # no Treebank rule splits a plain alphanumeric word, so most words need no lookup
+        if word.isalnum() and word.lower() not in SPLIT_WORDS:
+            tokens.append(word)
+            continue
+        next_word = words[i + 1] if i + 1 < len(words) else None
+        # only words ending in a period (or the last word) depend on where the sentence ends
+        sentence_end = next_word is None or ('.' in word and ends_sentence(word, next_word))
+        tokens.extend(word_tokens(word, sentence_end))
+    return tokens
+
+
+# tokenizers by name
+TOKENIZERS = {'nltk': word_tokenize, 'fast': fast_tokenize}
+
+
+def tokenizer_name(name: str = None) -> str:
+    """
+    Checks a tokenizer name, filling in the selected default.
+    :param name: The name of the tokenizer ('nltk' or 'fast'; default: DEFAULT_TOKENIZER).
+    :return: The name of the tokenizer
+    """
+    if name is None:
+        name = DEFAULT_TOKENIZER
+    if name not in TOKENIZERS:
+        raise ValueError('unknown tokenizer ' + repr(name) + '; choose from ' + ', '.join(TOKENIZERS))
+    return name
+
+
+def get_tokenizer(name: str = None):
+    """
+    Finds a tokenizer by name.
+    :param name: The name of the tokenizer ('nltk' or 'fast'; default: DEFAULT_TOKENIZER).
+    :return: The tokenizer function, taking text and returning a list of tokens
+    """
+    return TOKENIZERS[tokenizer_name(name)]
+
+
+def set_default_tokenizer(name: str):
+    """
+    Selects the tokenizer used by tokenize_text when none is given.
+    A model must be scored with the tokenizer it was trained with.
+    :param name: The name of the tokenizer ('nltk' or 'fast').
+    """
+    global DEFAULT_TOKENIZER
+    DEFAULT_TOKENIZER = tokenizer_name(name)
+
+
+def compare_tokenizers(filepath: str, max_examples: int = 5) -> dict:
+    """
+    Tokenizes a file line by line with word_tokenize and the fast tokenizer (as part 2 does) and as one text (as part 1
+    does), and records where the two disagree.
+    :param filepath: The path of the file to compare on.
+    :param max_examples: The largest number of differing lines to record.
+    :return: A dictionary of the number of lines and tokens, the number of differing lines and tokens, and examples
+    """
+    with open(filepath, 'r', encoding='utf8') as file:
+        text = file.read()
+    lines = [line.lower() for line in text.splitlines() if line.strip()]
+
+    differing_lines = 0
+    examples = []
+    for line in lines:
+        expected = word_tokenize(line)
+        actual = fast_tokenize(line)
+        if expected != actual:
+            differing_lines += 1
+            if len(examples) < max_examples:
+                examples.append((line.strip(), [t for t in expected if t not in actual],
+                                 [t for t in actual if t not in expected]))
+
+    # the whole file, joined as part 1 joins a chunk
+    text = text.replace('\n', ' ').lower()
+    expected = word_tokenize(text)
+    actual = fast_tokenize(text)
+    differing_tokens = sum(a != b for a, b in zip(expected, actual)) + abs(len(expected) - len(actual))
+
+    return {'file': filepath,
+            'lines': len(lines),
+            'differing_lines': differing_lines,
+            'tokens': len(expected),
+            'fast_tokens': len(actual),
+            'differing_tokens': differing_tokens,
+            'examples': examples}
+
+
+def check_tokenizers(filepaths: list[str], texts: list[str] = CHECK_TEXTS) -> list[str]:
+    """
+    Checks that the fast tokenizer splits files (line by line and as one text) and texts into exactly the tokens of
+    word_tokenize.
+    :param filepaths: The paths of the files to check on.
+    :param texts: Further texts to check on.
+    :return: A list of the disagreements found (empty if the tokenizers agree everywhere)
+    """
+    problems = []
+    for filepath in filepaths:
+        result = compare_tokenizers(filepath)
+        if result['differing_lines'] or result['differing_tokens']:
+            problems.append('{file}: {differing_lines} of {lines} lines and {differing_tokens} of {tokens} tokens '
+                            'differ'.format(**result))
+    for text in texts:
+        expected = word_tokenize(text)
+        actual = fast_tokenize(text)
+        if expected != actual:
+            problems.append('{0!r}: word_tokenize gives {1}, fast_tokenize gives {2}'.format(text, expected, actual))
+    return problems
+
+
+def benchmark(filepath: str, repeat: int = 3) -> dict[str, float]:
+    """
+    Measures the tokens per second of each tokenizer on a file, tokenized line by line.
+    The fast tokenizer's word cache is cleared first, so its time includes filling the cache.
+    :param filepath: The path of the file to tokenize.
+    :param repeat: How many times to tokenize the file.
+    :return: A dictionary of tokens per second keyed by tokenizer name
+    """
+    with open(filepath, 'r', encoding='utf8') as file:
+        lines = [line.lower() for line in file]
+
+    word_tokens.cache_clear()
+    rates = {}
+    for name, tokenize in TOKENIZERS.items():
+        start_time = time.perf_counter()
+        count = 0
+        for _ in range(repeat):
+            for line in lines:
+                count += len(tokenize(line))
+        rates[name] = count / (time.perf_counter() - start_time)
+    return rates
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the fast tokenizer with word_tokenize on the LangId files.')
+    parser.add_argument('files', nargs='*', default=['LangId.train.English', 'LangId.train.French',
+                                                     'LangId.train.Italian', 'LangId.test'],
+                        help='files to compare on (default: the LangId training and test files)')
+    parser.add_argument('--repeat', type=int, default=3, help='times to tokenize each file when timing')
+    parser.add_argument('--check', action='store_true',
+                        help='instead of comparing and timing, check that the tokenizers agree on the files and on '
+                             'CHECK_TEXTS, exiting with status 1 if they do not')
+    args = parser.parse_args()
+
+    if args.check:
+        failures = check_tokenizers(args.files)
+        for failure in failures:
+            print('FAILED:', failure)
+        if not failures:
+            print('Tokenizers agree on {0} files and {1} texts.'.format(len(args.files), len(CHECK_TEXTS)))
+        raise SystemExit(1 if failures else 0)
+
+    # equivalence check
+    equivalent = True
+    for path in args.files:
+        result = compare_tokenizers(path)
+        print('{file}: {differing_lines} of {lines} lines differ, {differing_tokens} of {tokens} tokens differ'
+              .format(**result))
+        for line, missing, extra in result['examples']:
+            print('\t' + line[:100])
+            print('\t\tword_tokenize only: ' + ' '.join(missing) + '\t\tfast only: ' + ' '.join(extra))
+        if result['differing_lines'] or result['differing_tokens']:
+            equivalent = False
+    print('Tokenizers are equivalent on these files.' if equivalent else 'Tokenizers differ (see above).')
+
+    # throughput
+    print('file\t\t\tnltk tokens/s\tfast tokens/s\tspeedup')
+    for path in args.files:
+        rates = benchmark(path, args.repeat)
+        print('{0:<20}\t{1:.0f}\t\t{2:.0f}\t\t{3:.1f}x'.format(path, rates['nltk'], rates['fast'],
+                                                              rates['fast'] / rates['nltk']))
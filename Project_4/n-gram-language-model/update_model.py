@@ -0,0 +1,161 @@
+"""
+N-Gram Language Model
+Jordan Frimpter
+Henry Kim
+
+Update Model
+This program adds the counts of new training text for a language into an existing model file without recounting the
+text the model was already trained on. The model's manifest records the content hash of every source file counted
+into it, so a file that has already been counted is skipped and running an update again changes nothing.
+
+The model file is not changed in place: its stored counts are read into dictionaries, the new counts are added, and the
+whole file is written again. An update therefore takes the time and memory of writing a trained model of the same size,
+however little text is added; only the counting of the text already in the model is saved.
+
+An interrupted update never counts a file twice. The new model is written next to the model file, and the new files are
+recorded in the manifest as pending, with the content hash of the new model, before it replaces the model file; once it
+has, the records are marked complete. A later run completes pending records if the model file has that hash, and drops
+them (the model was not replaced) otherwise.
+
+A pruned model (see prune_model.py) cannot be updated: the bigrams pruned from it are gone, so counts added to it would
+not be the counts of its files. The unpruned model is updated and then pruned again instead.
+"""
+
+from part1 import count_unigrams_and_bigrams, TRAINING_PREFIX, MODEL_FILE
+from ngram_model import load_model, write_model, load_manifest, write_manifest, file_hash, model_tokenizer, \
+    PRUNED_KEY
+from tokenizer import TOKENIZERS
+from collections import Counter
+import argparse
+import time
+import os
+
+# key of a manifest record whose file is counted into a new model that may not have replaced the model file yet
+PENDING_KEY = 'pending'
+# suffix of the new model file written by an update before it replaces the model file
+UPDATE_SUFFIX = '.update'
+
+
+def merge_counts(models: dict[str, tuple[dict, dict]], language: str, unigram_dict: dict, bigram_dict: dict):
+    """
+    Adds unigram and bigram counts into the counts of a language, adding the language if it is new.
+    :param models: A dictionary of (unigram dictionary, bigram dictionary) keyed by language (updated in place).
+    :param language: The language of the new counts.
+    :param unigram_dict: The unigram counts to add.
+    :param bigram_dict: The bigram counts to add.
+    """
+    unigram_count, bigram_count = models.get(language, ({}, {}))
+    unigram_count = Counter(unigram_count)
+    bigram_count = Counter(bigram_count)
+    unigram_count.update(unigram_dict)
+    bigram_count.update(bigram_dict)
+    models[language] = (dict(unigram_count), dict(bigram_count))
+
+
+def recover_pending(model_filepath: str, manifest: dict) -> dict:
+    """
+    Settles the pending records an interrupted update left in a model's manifest.
+    Records whose new model replaced the model file are marked complete, and the others are dropped.
+    :param model_filepath: The path of the model file.
+    :param manifest: The manifest of the model file (updated in place, and written if it changes).
+    :return: The manifest
+    """
+    pending = {digest for digest, record in manifest.items() if isinstance(record, dict) and PENDING_KEY in record}
+    if not pending:
+        return manifest
+    model_digest = file_hash(model_filepath) if os.path.exists(model_filepath) else None
+    for digest in pending:
+        if manifest[digest].pop(PENDING_KEY) != model_digest:
+            print('Interrupted update not applied:', manifest.pop(digest)['path'])
+    if os.path.exists(model_filepath + UPDATE_SUFFIX):
+        os.remove(model_filepath + UPDATE_SUFFIX)
+    write_manifest(model_filepath, manifest)
+    return manifest
+
+
+def update_model(model_filepath: str, language: str, filepaths: list[str], tokenizer: str = None) -> list[str]:
+    """
+    Counts new training files for a language and adds their counts into a model file.
+    Files whose contents are already in the model's manifest are skipped. A pruned model is refused (ValueError).
+    :param model_filepath: The path of the model file (created if it does not exist).
+    :param language: The language of the new training files.
+    :param filepaths: The paths of the new training files.
+    :param tokenizer: The tokenizer to count with (default: the one the model was trained with, as recorded in its
+    manifest; a different one is an error).
+    :return: The list of files that were counted into the model
+    """
+    manifest = recover_pending(model_filepath, load_manifest(model_filepath))
+    if PRUNED_KEY in manifest:
+        raise ValueError(model_filepath + ' is a pruned model; update the model it was pruned from ('
+                         + manifest[PRUNED_KEY][0]['source'] + ') and prune it again')
+    tokenizer = model_tokenizer(model_filepath, tokenizer)
+
+    # count the files that have not been counted before
+    new_counts = []
+    for filepath in filepaths:
+        digest = file_hash(filepath)
+        if digest in manifest:
+            print('Already ingested:', filepath, '(as ' + manifest[digest]['path'] + ')')
+            continue
+        if any(digest == new_digest for new_digest, _, _ in new_counts):
+            print('Duplicate file skipped:', filepath)
+            continue
+        print('Counting:', filepath)
+        new_counts.append((digest, filepath, count_unigrams_and_bigrams(filepath, tokenizer=tokenizer)))
+
+    if not new_counts:
+        print('Model is up to date.')
+        return []
+
+    # copy the stored counts out of the model file and add the new counts to them
+    models = {}
+    if os.path.exists(model_filepath):
+        model = load_model(model_filepath)
+        models = model.to_dicts()
+        model.close()
+    for _, _, (unigram_dict, bigram_dict) in new_counts:
+        merge_counts(models, language, unigram_dict, bigram_dict)
+
+    # write the new model beside the model file and record the new files as pending on it
+    write_model(model_filepath + UPDATE_SUFFIX, models)
+    model_digest = file_hash(model_filepath + UPDATE_SUFFIX)
+    for digest, filepath, _ in new_counts:
+        manifest[digest] = {'language': language, 'path': filepath, 'tokenizer': tokenizer,
+                            'ingested': time.strftime('%Y-%m-%dT%H:%M:%S'), PENDING_KEY: model_digest}
+    write_manifest(model_filepath, manifest)
+
+    # replace the model file, then mark the records complete
+    os.replace(model_filepath + UPDATE_SUFFIX, model_filepath)
+    for digest, _, _ in new_counts:
+        del manifest[digest][PENDING_KEY]
+    write_manifest(model_filepath, manifest)
+
+    return [filepath for _, filepath, _ in new_counts]
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Add new training text for a language to a model file.')
+    parser.add_argument('files', nargs='+', help='new training files')
+    parser.add_argument('--language', default=None,
+                        help='language of the files (default: the name after ' + TRAINING_PREFIX + ' in the filename)')
+    parser.add_argument('--model', default=MODEL_FILE, help='model file to update (default: ' + MODEL_FILE + ')')
+    parser.add_argument('--tokenizer', choices=list(TOKENIZERS), default=None,
+                        help='tokenizer the model was trained with (default: the one in the model\'s manifest)')
+    args = parser.parse_args()
+
+    # group the files by language
+    languages = {}
+    for path in args.files:
+        name = args.language
+        if name is None:
+            if not os.path.basename(path).startswith(TRAINING_PREFIX):
+                print('WARNING: no --language given and ' + path + ' is not named ' + TRAINING_PREFIX + '<Language>')
+                continue
+            name = os.path.basename(path)[len(TRAINING_PREFIX):]
+        languages.setdefault(name, []).append(path)
+
+    for name, paths in languages.items():
+        start_time = time.perf_counter()
+        added = update_model(args.model, name, paths, args.tokenizer)
+        print('{0}: added {1} file(s) in {2:.2f} s'.format(name, len(added), time.perf_counter() - start_time))
@@ -0,0 +1,317 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Crawl Engine
+This program downloads many webpages concurrently with asyncio. At most max_concurrency pages are downloaded at a time,
+and at most per_host of them from any one host, so a crawl keeps many hosts busy without hammering a single site.
+
+With a policy (such as RobotsPolicy of robots_policy.py), pages it disallows are skipped, and the requests to each
+host are spaced by the host's delay: a page waits for its host's next turn without holding one of the max_concurrency
+download slots, so the pages of other hosts keep downloading meanwhile. Given a cached function, pages that fetch
+answers without a request (such as from a fresh response cache) take no turn of their host and are not delayed.
+
+Downloading and parsing are ordinary blocking functions (such as fetch_html and extract_raw_text of web_crawler.py),
+so they are run in a pool of threads and the event loop itself never blocks. A page is handed to the handler as soon
+as it arrives, while other pages are still downloading.
+
+Run on its own, the program starts a local HTTP server whose pages answer after a delay (like a slow remote site) and
+reports the pages per second of crawling it one page at a time and concurrently.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+import threading
+import argparse
+import asyncio
+import queue
+import time
+
+# largest number of pages downloaded at a time
+MAX_CONCURRENCY = 16
+# largest number of pages downloaded at a time from one host
+PER_HOST_CONCURRENCY = 4
+
+
+def host_of(url: str) -> str:
+    """
+    Returns the host (and port) part of a URL, lowercased
+    :param url: string of url
+    :return: The host of the url
+    """
+    return urlsplit(url).netloc.lower()
+
+
+async def crawl_async(urls: list[str], fetch, handle=None, max_concurrency: int = MAX_CONCURRENCY,
+                      per_host: int = PER_HOST_CONCURRENCY, policy=None, on_result=None, cached=None) -> dict:
+    """
+    Downloads several URLs concurrently and hands each page to a handler; the coroutine run by crawl
+    :param urls: The URLs to download.
+    :param fetch: A blocking function downloading a URL and returning its page.
+    :param handle: A blocking function of (url, page) whose return value is the result of the url (default: the page).
+    :param max_concurrency: The largest number of pages downloaded at a time.
+    :param per_host: The largest number of pages downloaded at a time from one host.
+    :param policy: An object whose blocking check(url) method returns whether the url may be downloaded and the
+    seconds between requests to its host (default: every url is allowed, without delay).
+    :param on_result: A blocking function of (url, result) called as each page is handled, instead of keeping the
+    results (default: the results are returned).
+    :param cached: A blocking function of url returning whether fetch answers it without sending a request, so that it
+    needs no turn of its host (default: every url is requested).
+    :return: A dictionary of the results keyed by URL, the exceptions of the URLs that failed keyed by URL, the URLs
+    the policy disallowed, the number of pages handled, the time taken and the pages per second
+    """
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max_concurrency)
+    host_limits = {}
+    # event loop time (time.monotonic) of the next request each host may receive; a policy may keep them across crawls
+    host_turns = getattr(policy, 'host_turns', {})
+    results = {}
+    errors = {}
+    disallowed = []
+    handled = 0
+
+    async def visit(url: str, executor: ThreadPoolExecutor):
+        nonlocal handled
+        host = host_of(url)
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        try:
+            delay = 0
+            if policy is not None:
+                allowed, delay = await loop.run_in_executor(executor, policy.check, url)
+                if not allowed:
+                    disallowed.append(url)
+                    return
+            if cached is not None and await loop.run_in_executor(executor, cached, url):
+                # the host is not contacted, so its slots and turns are left to the pages that are
+                async with limit:
+                    page = await loop.run_in_executor(executor, fetch, url)
+            else:
+                # take the host's slot first, so waiting on a busy host does not hold a global slot
+                async with host_limit:
+                    if delay > 0:
+                        # book the host's next turn, then wait for it
+                        turn = max(loop.time(), host_turns.get(host, 0))
+                        host_turns[host] = turn + delay
+                        await asyncio.sleep(turn - loop.time())
+                    async with limit:
+                        page = await loop.run_in_executor(executor, fetch, url)
+            # the slots are released before parsing, so the next downloads start at once
+            result = page if handle is None else await loop.run_in_executor(executor, handle, url, page)
+            if on_result is None:
+                results[url] = result
+            else:
+                await loop.run_in_executor(executor, on_result, url, result)
+            handled += 1
+        except Exception as error:
+            errors[url] = error
+
+    start_time = time.perf_counter()
+    # one thread per download slot, plus as many for the handlers
+    with ThreadPoolExecutor(max_workers=2 * max_concurrency) as executor:
+        await asyncio.gather(*(visit(url, executor) for url in dict.fromkeys(urls)))
+    seconds = time.perf_counter() - start_time
+
+    return {'results': results,
+            'errors': errors,
+            'disallowed': disallowed,
+            'pages': handled,
+            'seconds': seconds,
+            'pages_per_second': handled / seconds if seconds > 0 else 0}
+
+
+def crawl(urls: list[str], fetch, handle=None, max_concurrency: int = MAX_CONCURRENCY,
+          per_host: int = PER_HOST_CONCURRENCY, policy=None, cached=None) -> dict:
+    """
+    Downloads several URLs concurrently and hands each page to a handler as it arrives
+    :param urls: The URLs to download (duplicates are downloaded once).
+    :param fetch: A blocking function downloading a URL and returning its page.
+    :param handle: A blocking function of (url, page) whose return value is the result of the url (default: the page).
+    :param max_concurrency: The largest number of pages downloaded at a time.
+    :param per_host: The largest number of pages downloaded at a time from one host.
+    :param policy: An object whose blocking check(url) method returns whether the url may be downloaded and the
+    seconds between requests to its host (default: every url is allowed, without delay).
+    :param cached: A blocking function of url returning whether fetch answers it without sending a request, so that it
+    needs no turn of its host (default: every url is requested).
+    :return: A dictionary of the results keyed by URL, the exceptions of the URLs that failed keyed by URL, the URLs
+    the policy disallowed, the number of pages handled, the time taken and the pages per second
+    """
+    # reject invalid parameters
+    if max_concurrency < 1 or per_host < 1:
+        print("WARNING: concurrency limits given to crawl must be at least 1")
+        return {'results': {}, 'errors': {}, 'disallowed': [], 'pages': 0, 'seconds': 0, 'pages_per_second': 0}
+    return asyncio.run(crawl_async(urls, fetch, handle, max_concurrency, per_host, policy, cached=cached))
+
+
+def iter_crawl(urls: list[str], fetch, handle=None, max_concurrency: int = MAX_CONCURRENCY,
+               per_host: int = PER_HOST_CONCURRENCY, policy=None, summary: dict = None, cached=None):
+    """
+    Downloads several URLs concurrently and yields each result as soon as its page is handled, while the rest keep
+    downloading; the event loop runs in a background thread, and downloading pauses when the caller falls behind
+    :param urls: The URLs to download (duplicates are downloaded once).
+    :param fetch: A blocking function downloading a URL and returning its page.
+    :param handle: A blocking function of (url, page) whose return value is the result of the url (default: the page).
+    :param max_concurrency: The largest number of pages downloaded at a time.
+    :param per_host: The largest number of pages downloaded at a time from one host.
+    :param policy: An object whose blocking check(url) method returns whether the url may be downloaded and the
+    seconds between requests to its host (default: every url is allowed, without delay).
+    :param summary: A dictionary to store the errors, disallowed URLs, pages, seconds and pages per second of the crawl
+    in once it is done (default: none).
+    :param cached: A blocking function of url returning whether fetch answers it without sending a request, so that it
+    needs no turn of its host (default: every url is requested).
+    :return: A generator of (url, result) pairs in the order the pages were handled
+    """
+    # a few results per download slot wait for the caller; a full queue blocks a worker thread, not the event loop
+    ready = queue.Queue(maxsize=2 * max_concurrency)
+    done = object()
+    # set if the caller stops early, after which results are dropped instead of waiting for it
+    stopped = threading.Event()
+
+    def deliver(url: str, result):
+        if not stopped.is_set():
+            ready.put((url, result))
+
+    def run():
+        try:
+            crawled = asyncio.run(crawl_async(urls, fetch, handle, max_concurrency, per_host, policy, deliver,
+                                                  cached))
+            if summary is not None:
+                summary.update(crawled)
+        finally:
+            if not stopped.is_set():
+                ready.put(done)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is done:
+                break
+            yield item
+        thread.join()
+    finally:
+        # release any thread waiting on the full queue
+        stopped.set()
+        while not ready.empty():
+            ready.get_nowait()
+
+
+class SlowPageHandler(BaseHTTPRequestHandler):
+    """
+    Serves generated pages of paragraphs, each after a delay, to stand in for a remote website. Pages under /flaky/
+    answer 503 (service unavailable) to their first request, a request with the entity tag of its page is answered
+    304 (not modified), and /robots.txt serves the robots rules (404 if there are none).
+    """
+    # keep connections open between requests, like a real web server
+    protocol_version = 'HTTP/1.1'
+    # the headers and body are sent separately, which Nagle's algorithm would delay on a kept connection
+    disable_nagle_algorithm = True
+    # seconds before each page is sent
+    delay = 0.05
+    # seconds before a new connection is served (standing in for the round trips of the TCP and TLS handshakes)
+    connect_delay = 0
+    # the /flaky/ paths requested so far
+    failed_paths = set()
+    # text of robots.txt, or None for no robots.txt
+    robots = None
+    # times the pages were requested (time.monotonic)
+    request_times = []
+
+    def setup(self):
+        time.sleep(self.connect_delay)
+        super().setup()
+
+    def do_GET(self):
+        if self.path == '/robots.txt':
+            body = (self.robots or '').encode('utf8')
+            self.send_response(200 if self.robots is not None else 404)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.request_times.append(time.monotonic())
+        time.sleep(self.delay)
+        if self.path.startswith('/flaky/') and self.path not in self.failed_paths:
+            self.failed_paths.add(self.path)
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        # page n links to pages 2n + 1 and 2n + 2, so the site is a binary tree
+        number = self.path.rsplit('/', 1)[-1]
+        number = int(number) if number.isdigit() else 0
+        # pages never change, so a client's copy with the same entity tag is still valid
+        etag = '"page-{0}"'.format(number)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = ('<html><head><title>Page {0}</title><script>var x = 1;</script></head><body>'
+                '<p>The Titanic sank in the North Atlantic Ocean in April 1912.</p>'
+                '<p>This is page {0} of the local test site.</p>'
+                '<a href="/page/{1}">next</a> <a href="/page/{2}">other</a></body></html>').format(
+            number, 2 * number + 1, 2 * number + 2).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', 'Mon, 15 Apr 1912 07:20:00 GMT')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep the benchmark output readable
+        pass
+
+
+def start_local_server(delay: float = SlowPageHandler.delay, connect_delay: float = 0,
+                       robots: str = None) -> (ThreadingHTTPServer, str):
+    """
+    Starts a local HTTP server of slow pages in a background thread
+    :param delay: The seconds before each page is sent.
+    :param connect_delay: The seconds before each new connection is served.
+    :param robots: The text of the server's robots.txt (default: none).
+    :return: The server (call shutdown to stop it; its RequestHandlerClass.request_times lists when pages were
+    requested) and its base URL
+    """
+    handler = type('DelayedPageHandler', (SlowPageHandler,),
+                   {'delay': delay, 'connect_delay': connect_delay, 'failed_paths': set(), 'robots': robots,
+                    'request_times': []})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{0}'.format(server.server_address[1])
+
+
+# Main execution
+if __name__ == '__main__':
+    from web_crawler import fetch_html, extract_raw_text
+    import web_crawler
+
+    # every concurrency level must download the pages, rather than read those of the first from the response cache
+    web_crawler.USE_CACHE = False
+
+    parser = argparse.ArgumentParser(description='Measure concurrent crawling against a local server of slow pages.')
+    parser.add_argument('--pages', type=int, default=200, help='number of pages to crawl (default: 200)')
+    parser.add_argument('--delay', type=float, default=SlowPageHandler.delay,
+                        help='seconds before the server sends each page (default: {0})'.format(SlowPageHandler.delay))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, MAX_CONCURRENCY],
+                        help='global concurrency limits to measure')
+    parser.add_argument('--per-host', type=int, default=None,
+                        help='per-host concurrency limit (default: the same as the global limit)')
+    args = parser.parse_args()
+
+    local_server, base_url = start_local_server(args.delay)
+    page_urls = [base_url + '/page/' + str(i) for i in range(args.pages)]
+    print('concurrency\tper host\tpages\terrors\tseconds\tpages/s')
+    for concurrency in args.concurrency:
+        host_concurrency = args.per_host if args.per_host is not None else concurrency
+        crawled = crawl(page_urls, fetch_html, lambda url, html: extract_raw_text(html), concurrency, host_concurrency)
+        print('{0}\t\t{1}\t\t{pages}\t{2}\t{seconds:.2f}\t{pages_per_second:.1f}'.format(
+            concurrency, host_concurrency, len(crawled['errors']), **crawled))
+    local_server.shutdown()
@@ -0,0 +1,227 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Fact Loader
+This program builds the facts and tags database of the crawler in bulk. The sentences that contain keywords are
+deduplicated in memory, each is given an integer id, and the facts and their tags are written with executemany in a
+single transaction, with the database in WAL (write-ahead log) mode, instead of one SELECT and one commit per tagged
+line.
+
+    facts           id (integer key), sentence (unique), source (the URL of the first page it was found on)
+    tags            fact_id (the fact's id), tag (a keyword the sentence contains); indexed by tag
+    facts_index     an FTS5 full-text index of facts.sentence, kept up to date by triggers (see fact_search.py)
+
+Run on its own, the program loads generated sentence files with the row by row loader that create_database used before
+and with the bulk loader, and prints the rows written per second by each.
+"""
+
+from keyword_matcher import get_matcher
+import argparse
+import sqlite3
+import time
+
+# database file built by the crawler
+DATABASE_FILE = 'database.db'
+
+
+def create_tables(connection: sqlite3.Connection):
+    """
+    Replaces the facts and tags tables of a database with empty ones
+    :param connection: The connection to the database
+    """
+    # Enable foreign keys for the tags table
+    connection.execute("PRAGMA foreign_keys = 1")
+    with connection:
+        # Delete old entries
+        connection.execute("DROP TABLE IF EXISTS facts_index")
+        connection.execute("DROP TABLE IF EXISTS tags")
+        connection.execute("DROP TABLE IF EXISTS facts")
+
+        # Initialize the tables; a tag refers to its sentence by the sentence's integer id
+        connection.execute("CREATE TABLE facts ("
+                           "id INTEGER PRIMARY KEY, "
+                           "sentence TEXT NOT NULL UNIQUE, "
+                           "source TEXT)")
+        connection.execute("CREATE TABLE tags ("
+                           "fact_id INTEGER NOT NULL, "
+                           "tag TEXT NOT NULL, "
+                           "PRIMARY KEY (fact_id, tag), "
+                           "FOREIGN KEY (fact_id) REFERENCES facts(id) ON DELETE CASCADE)")
+        connection.execute("CREATE INDEX tags_by_tag ON tags (tag)")
+    create_index(connection)
+
+
+def create_index(connection: sqlite3.Connection):
+    """
+    Creates the full-text index of the sentences of the facts table, if it does not exist, and the triggers that keep
+    it up to date; the sentences already in the table are indexed
+    :param connection: The connection to the database
+    """
+    with connection:
+        # the index stores only its terms and reads the sentences from the facts table (an external content table);
+        # the porter tokenizer matches the forms of a word ('sank' does not match 'sink', but 'ships' matches 'ship')
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS facts_index USING fts5("
+                           "sentence, content='facts', content_rowid='id', tokenize='porter unicode61')")
+        connection.execute("CREATE TRIGGER IF NOT EXISTS facts_index_insert AFTER INSERT ON facts BEGIN "
+                           "INSERT INTO facts_index (rowid, sentence) VALUES (new.id, new.sentence); END")
+        connection.execute("CREATE TRIGGER IF NOT EXISTS facts_index_delete AFTER DELETE ON facts BEGIN "
+                           "INSERT INTO facts_index (facts_index, rowid, sentence) "
+                           "VALUES ('delete', old.id, old.sentence); END")
+        connection.execute("CREATE TRIGGER IF NOT EXISTS facts_index_update AFTER UPDATE ON facts BEGIN "
+                           "INSERT INTO facts_index (facts_index, rowid, sentence) "
+                           "VALUES ('delete', old.id, old.sentence); "
+                           "INSERT INTO facts_index (rowid, sentence) VALUES (new.id, new.sentence); END")
+        connection.execute("INSERT INTO facts_index (facts_index) VALUES ('rebuild')")
+
+
+def open_database(db_name: str) -> sqlite3.Connection:
+    """
+    Opens a database in WAL mode with new, empty facts and tags tables
+    :param db_name: Name of the database file
+    :return: The connection to the database
+    """
+    connection = sqlite3.connect(db_name)
+    # readers are not blocked while the crawler writes, and a commit appends to the log instead of rewriting pages
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    create_tables(connection)
+    return connection
+
+
+def read_sentence_file(filename: str) -> (str, list[str]):
+    """
+    Reads a sentences file written by clean_text
+    :param filename: The name of the file
+    :return: A tuple (url, list of sentences)
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        # The first line is the URL
+        url = f.readline().strip()
+        sentences = [line.strip() for line in f if line.strip()]
+    return url, sentences
+
+
+def tag_sentences(documents, keyword_list: list[str]):
+    """
+    Finds the keywords of each sentence, all at once (see keyword_matcher.py)
+    :param documents: An iterable of (url, list of sentences) pairs
+    :param keyword_list: List of keywords that identify relevant sentences
+    :return: A generator of (url, list of (sentence, list of keywords)) pairs, keeping only sentences with keywords
+    """
+    matcher = get_matcher(tuple(keyword_list))
+    for url, sentences in documents:
+        tagged = []
+        for sentence in sentences:
+            keywords = matcher.find(sentence)
+            if keywords:
+                tagged.append((sentence, keywords))
+        yield url, tagged
+
+
+def insert_facts(connection: sqlite3.Connection, documents, ids: dict[str, int]) -> (int, int):
+    """
+    Writes tagged sentences to the facts and tags tables in one transaction; a sentence already written keeps its
+    first source and gains the new tags
+    :param connection: The connection to the database
+    :param documents: An iterable of (url, list of (sentence, list of keywords)) pairs
+    :param ids: The ids of the sentences already written, keyed by sentence; the new sentences are added to it
+    :return: A tuple of the number of facts and of tags written
+    """
+    facts = []
+    tags = set()
+    for url, tagged in documents:
+        for sentence, keywords in tagged:
+            fact_id = ids.get(sentence)
+            if fact_id is None:
+                fact_id = ids[sentence] = len(ids) + 1
+                facts.append((fact_id, sentence, url))
+            tags.update((fact_id, keyword) for keyword in keywords)
+
+    with connection:
+        connection.executemany("INSERT INTO facts VALUES (?, ?, ?)", facts)
+        # tags already written are skipped, and not counted
+        written = connection.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?)", sorted(tags)).rowcount
+    return len(facts), written
+
+
+def load_database(db_name: str, files: list[str], keyword_list: list[str]) -> dict[str, int]:
+    """
+    Creates an SQLite database of the sentences of sentence files that contain keywords, tagged with their keywords
+    :param db_name: Name of the database file
+    :param files: List of sentence files to search for relevant sentences
+    :param keyword_list: List of keywords that identify relevant sentences
+    :return: A dictionary of the number of facts and tags written
+    """
+    connection = open_database(db_name)
+    documents = tag_sentences((read_sentence_file(filename) for filename in files), keyword_list)
+    facts, tags = insert_facts(connection, documents, {})
+    connection.close()
+    return {'facts': facts, 'tags': tags}
+
+
+# Main execution
+if __name__ == '__main__':
+    import tempfile
+    import random
+    import os
+
+    parser = argparse.ArgumentParser(description='Compare the row by row and bulk loaders on generated sentence files.')
+    parser.add_argument('--files', type=int, default=200, help='number of sentence files (default: 200)')
+    parser.add_argument('--sentences', type=int, default=50, help='sentences per file (default: 50)')
+    args = parser.parse_args()
+
+    keywords = ['titanic', 'ship', 'maritime', 'salvage', 'wreck', 'bodies', 'dead', 'iceberg', 'sea', 'steel']
+    words = keywords + ['the', 'ocean', 'crew', 'passenger', 'night', 'captain', 'lifeboat', 'north', 'atlantic']
+
+    def load_row_by_row(db_name: str, files: list[str], keyword_list: list[str]) -> dict[str, int]:
+        # the loader create_database used before: text keys, and one SELECT and one commit per tagged line
+        connection = sqlite3.connect(db_name)
+        cursor = connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS tags")
+        cursor.execute("DROP TABLE IF EXISTS facts")
+        cursor.execute("CREATE TABLE facts (sentence TEXT NOT NULL, source TEXT, PRIMARY KEY (sentence))")
+        cursor.execute("CREATE TABLE tags (sentence TEXT NOT NULL, tag TEXT NOT NULL, "
+                       "FOREIGN KEY (sentence) REFERENCES facts(sentence) ON DELETE CASCADE)")
+        connection.commit()
+        counts = {'facts': 0, 'tags': 0}
+        for filename in files:
+            with open(filename, 'r', encoding='utf-8') as f:
+                url = f.readline()
+                lines = f.readlines()
+            for line in lines:
+                for keyword in keyword_list:
+                    if keyword.lower() in line.lower():
+                        if not cursor.execute("SELECT * FROM facts WHERE sentence=?", (line,)).fetchall():
+                            cursor.execute("INSERT INTO facts VALUES (?, ?)", (line, url,))
+                            connection.commit()
+                            counts['facts'] += 1
+                        cursor.execute("INSERT INTO tags VALUES (?, ?)", (line, keyword))
+                        connection.commit()
+                        counts['tags'] += 1
+        connection.close()
+        return counts
+
+    with tempfile.TemporaryDirectory() as directory:
+        # sentence files as clean_text writes them; some sentences appear on several pages
+        random.seed(0)
+        shared = [' '.join(random.choices(words, k=12)) + '.' for _ in range(args.sentences)]
+        file_list = []
+        for i in range(args.files):
+            filename = os.path.join(directory, 'sentences_' + str(i) + '.txt')
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write('https://example.com/page/' + str(i) + '\n')
+                for j in range(args.sentences):
+                    sentence = random.choice(shared) if j % 5 == 0 else \
+                        ' '.join(random.choices(words, k=12)) + ' ' + str(i * args.sentences + j) + '.'
+                    f.write(sentence + '\n')
+            file_list.append(filename)
+
+        print('loader\t\tfacts\ttags\tseconds\trows/s')
+        for name, loader in [('row by row', load_row_by_row), ('bulk', load_database)]:
+            start = time.perf_counter()
+            counts = loader(os.path.join(directory, name.replace(' ', '_') + '.db'), file_list, keywords)
+            seconds = time.perf_counter() - start
+            print('{0:<12}\t{facts}\t{tags}\t{1:.2f}\t{2:.0f}'.format(
+                name, seconds, (counts['facts'] + counts['tags']) / seconds, **counts))
@@ -0,0 +1,133 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Fact Search
+This program answers free-text questions from the facts database built by the crawler. The database keeps an FTS5
+full-text index of the sentences (facts_index, see fact_loader.py), so a query looks up its words in the index instead
+of scanning every sentence with LIKE, and the sentences found are ranked by BM25: sentences with more of the query's
+words, rarer words, and fewer other words come first.
+
+A query is free text: its words are searched as they are written (any FTS5 operators or quotes in it are ignored), and
+a sentence matches if it contains any of them. Each result has the sentence, the URL it came from, and its tags.
+
+    python fact_search.py titanic iceberg           searches database.db
+    python fact_search.py --benchmark 200000        compares the index with LIKE on generated sentences
+"""
+
+from fact_loader import DATABASE_FILE, create_index
+import argparse
+import sqlite3
+import json
+import time
+import re
+
+# number of results returned by a search
+SEARCH_LIMIT = 10
+
+
+def fts_query(text: str) -> str:
+    """
+    Turns free text into an FTS5 query that matches any of its words
+    :param text: The free text.
+    :return: The query, or an empty string if the text has no words
+    """
+    # every word is quoted, so characters such as - " * ( ) and words such as AND, OR, NOT and NEAR are searched
+    # for rather than read as operators
+    return ' OR '.join('"' + word + '"' for word in re.findall(r'\w+', text))
+
+
+def search_facts(connection: sqlite3.Connection, text: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+    """
+    Finds the facts that best match a free-text query
+    :param connection: The connection to the facts database
+    :param text: The free-text query
+    :param limit: The largest number of facts returned
+    :return: A list of dictionaries of the sentence, source url, tags and BM25 score of each fact found, best first
+    (lower scores are better)
+    """
+    query = fts_query(text)
+    if not query:
+        print("WARNING: no words to search for in query given to search_facts")
+        return []
+
+    rows = connection.execute("SELECT facts.sentence, facts.source, "
+                              "(SELECT json_group_array(tag) FROM tags WHERE tags.fact_id = facts.id), "
+                              "bm25(facts_index) AS score "
+                              "FROM facts_index JOIN facts ON facts.id = facts_index.rowid "
+                              "WHERE facts_index MATCH ? "
+                              "ORDER BY score LIMIT ?", (query, limit)).fetchall()
+    return [{'sentence': sentence, 'source': source, 'tags': json.loads(tags), 'score': score}
+            for sentence, source, tags, score in rows]
+
+
+def open_index(db_name: str) -> sqlite3.Connection:
+    """
+    Opens a facts database for searching, indexing its sentences first if it was built before it had an index
+    :param db_name: Name of the database file
+    :return: The connection to the database
+    """
+    connection = sqlite3.connect(db_name)
+    if connection.execute("SELECT 1 FROM sqlite_master WHERE name='facts_index'").fetchone() is None:
+        create_index(connection)
+    return connection
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search the facts database built by the crawler.')
+    parser.add_argument('query', nargs='*', help='words to search for')
+    parser.add_argument('--database', default=DATABASE_FILE,
+                        help='facts database file (default: {0})'.format(DATABASE_FILE))
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT,
+                        help='number of results (default: {0})'.format(SEARCH_LIMIT))
+    parser.add_argument('--benchmark', type=int, default=0, metavar='SENTENCES',
+                        help='compare the index with LIKE scans on a database of generated sentences')
+    args = parser.parse_args()
+
+    if args.benchmark > 0:
+        from fact_loader import open_database, insert_facts
+        import tempfile
+        import random
+        import os
+
+        random.seed(0)
+        words = ['titanic', 'ship', 'maritime', 'salvage', 'wreck', 'bodies', 'dead', 'iceberg', 'sea', 'steel',
+                 'the', 'ocean', 'crew', 'passenger', 'night', 'captain', 'lifeboat', 'north', 'atlantic', 'deck',
+                 'hull', 'engine', 'voyage', 'harbor', 'rescue', 'survivor', 'telegraph', 'cabin', 'funnel', 'anchor']
+        # rarer words, so that some queries match few sentences
+        words += ['word' + str(i) for i in range(5000)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            connection = open_database(os.path.join(directory, 'search.db'))
+            start = time.perf_counter()
+            documents = [('https://example.com/page/' + str(i // 50),
+                          [(' '.join(random.choices(words, k=15)) + ' ' + str(i) + '.', ['generated'])])
+                         for i in range(args.benchmark)]
+            insert_facts(connection, documents, {})
+            print('Indexed {0} sentences in {1:.2f} s'.format(args.benchmark, time.perf_counter() - start))
+
+            print('query\t\t\tLIKE (ms)\tindex (ms)\tmatches')
+            for query in ['iceberg', 'captain lifeboat', 'word42', 'word42 word4242']:
+                words_of_query = query.split()
+                start = time.perf_counter()
+                like = connection.execute("SELECT sentence, source FROM facts WHERE " +
+                                          ' OR '.join(['sentence LIKE ?'] * len(words_of_query)),
+                                          ['%' + word + '%' for word in words_of_query]).fetchall()
+                like_ms = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+                found = search_facts(connection, query, args.limit)
+                index_ms = (time.perf_counter() - start) * 1000
+                matches = connection.execute("SELECT count(*) FROM facts_index WHERE facts_index MATCH ?",
+                                             (fts_query(query),)).fetchone()[0]
+                print('{0:<20}\t{1:.1f}\t\t{2:.1f}\t\t{3}'.format(query, like_ms, index_ms, matches))
+            connection.close()
+    elif not args.query:
+        parser.print_help()
+    else:
+        connection = open_index(args.database)
+        for rank, fact in enumerate(search_facts(connection, ' '.join(args.query), args.limit)):
+            print('{0}. {sentence}\n   {source}\n   tags: {1}  (score {score:.2f})'.format(
+                rank + 1, ', '.join(fact['tags']), **fact))
+        connection.close()
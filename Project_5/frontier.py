@@ -0,0 +1,266 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Frontier
+This program keeps the URLs a crawl has still to visit. The crawl is breadth first: every page of one depth (links
+away from the starting page) is visited before any page of the next, up to a maximum depth and a maximum number of
+pages, and within a depth the URLs with the highest relevance score (such as the number of keywords they contain) go
+first.
+
+Links are resolved against the page they were found on and normalized (see normalize_url), so every spelling of a page
+is visited once. The URLs already seen are kept in a SeenSet: a Bloom filter of fixed size in memory answers 'never
+seen' for nearly every new URL without touching the exact store, an SQLite table on disk that settles the rare
+'maybe seen'. Memory use therefore stays bounded however many URLs a crawl discovers.
+
+Run on its own, the program measures the memory and time of deduplicating many URLs with a SeenSet and with a Python
+set, and the false positive rate of the Bloom filter.
+"""
+
+from http_client import normalize_url
+from urllib.parse import urljoin
+import argparse
+import hashlib
+import sqlite3
+import heapq
+import math
+import time
+
+# largest number of links between the starting page and a crawled page
+MAX_DEPTH = 1
+# largest number of pages crawled
+MAX_PAGES = 200
+# number of URLs the Bloom filter is sized for, and its false positive rate at that size
+BLOOM_CAPACITY = 1000000
+BLOOM_ERROR_RATE = 0.01
+# number of new URLs kept in memory before they are written to the exact store together
+FLUSH_SIZE = 10000
+# schemes of the links that are followed
+CRAWLED_SCHEMES = ('http', 'https')
+
+
+def resolve_link(base_url: str, href: str):
+    """
+    Resolves a link against the URL of the page it was found on and normalizes it
+    :param base_url: The URL of the page the link is on.
+    :param href: The href of the link (absolute or relative).
+    :return: The normalized absolute URL, or None if the link is not an http(s) link
+    """
+    if not isinstance(href, str) or not href.strip():
+        return None
+    url = urljoin(base_url, href.strip())
+    if url.split(':', 1)[0].lower() not in CRAWLED_SCHEMES:
+        return None
+    return normalize_url(url)
+
+
+class BloomFilter:
+    """
+    A set of strings that may answer 'present' for a string never added (at about the false positive rate it was
+    sized for), but never 'absent' for one that was, in a fixed number of bits.
+    """
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE):
+        """
+        Creates an empty filter.
+        :param capacity: The number of strings the filter is sized for.
+        :param error_rate: The false positive rate when capacity strings have been added.
+        """
+        # optimal number of bits and of hash functions
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def positions(self, item: str) -> list[int]:
+        """
+        Returns the bits of a string, from two 64-bit hashes combined (double hashing).
+        :param item: The string.
+        :return: The indexes of the string's bits
+        """
+        digest = hashlib.blake2b(item.encode('utf8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str):
+        """
+        Adds a string to the filter.
+        :param item: The string.
+        """
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class SeenSet:
+    """
+    The URLs seen by a crawl: a Bloom filter in memory in front of an exact store on disk.
+    """
+
+    def __init__(self, filepath: str = '', capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE):
+        """
+        Creates an empty set.
+        :param filepath: The SQLite file of the exact store (default: a temporary file deleted when the set is closed).
+        :param capacity: The number of URLs the Bloom filter is sized for.
+        :param error_rate: The false positive rate of the Bloom filter at capacity.
+        """
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.connection = sqlite3.connect(filepath)
+        # the store only lives for one crawl, so it does not need to survive a crash
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA journal_mode = MEMORY")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen (url TEXT NOT NULL, PRIMARY KEY (url))")
+        # new URLs not yet written to the store
+        self.pending = set()
+        # number of URLs added, and of 'maybe seen' answers of the Bloom filter that were not
+        self.stats = {'urls': 0, 'false_positives': 0}
+
+    def add(self, url: str) -> bool:
+        """
+        Adds a URL to the set.
+        :param url: The URL (already normalized).
+        :return: True if the URL had not been seen before
+        """
+        # the Bloom filter never forgets, so a URL it has not seen is new without asking the exact store
+        if url in self.bloom:
+            if url in self.pending or \
+                    self.connection.execute("SELECT 1 FROM seen WHERE url=?", (url,)).fetchone() is not None:
+                return False
+            self.stats['false_positives'] += 1
+        self.bloom.add(url)
+        self.pending.add(url)
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+        self.stats['urls'] += 1
+        return True
+
+    def flush(self):
+        """
+        Writes the new URLs held in memory to the exact store in one transaction.
+        """
+        with self.connection:
+            self.connection.executemany("INSERT INTO seen VALUES (?)", ((url,) for url in self.pending))
+        self.pending.clear()
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.bloom and (url in self.pending or self.connection.execute(
+            "SELECT 1 FROM seen WHERE url=?", (url,)).fetchone() is not None)
+
+    def __len__(self) -> int:
+        return self.stats['urls']
+
+    def close(self):
+        """
+        Closes the exact store.
+        """
+        self.connection.close()
+
+
+class Frontier:
+    """
+    The URLs a breadth-first crawl has still to visit, ordered by depth and then by relevance.
+    """
+
+    def __init__(self, max_depth: int = MAX_DEPTH, max_pages: int = MAX_PAGES, score=None, accept=None,
+                 seen: SeenSet = None):
+        """
+        Creates an empty frontier.
+        :param max_depth: The largest number of links between the starting page and a visited page.
+        :param max_pages: The largest number of pages handed out.
+        :param score: A function of a URL returning its relevance; higher scores are visited first (default: none).
+        :param accept: A function of a URL returning whether it may be visited (default: every URL).
+        :param seen: The set of URLs seen (default: a new SeenSet).
+        """
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.score = score
+        self.accept = accept
+        self.seen = seen if seen is not None else SeenSet()
+        # heap of (depth, -score, order added, url)
+        self.queue = []
+        self.added = 0
+        self.handed_out = 0
+
+    def add(self, url: str, depth: int = 0) -> bool:
+        """
+        Adds a URL found at a depth, unless it is too deep, rejected, or already seen; starting URLs (depth 0) are
+        never rejected.
+        :param url: The URL (normalized here).
+        :param depth: The number of links between the starting page and the URL.
+        :return: True if the URL was added
+        """
+        if depth > self.max_depth or not isinstance(url, str):
+            return False
+        url = normalize_url(url)
+        if depth > 0 and self.accept is not None and not self.accept(url):
+            return False
+        if not self.seen.add(url):
+            return False
+        score = self.score(url) if self.score is not None else 0
+        heapq.heappush(self.queue, (depth, -score, self.added, url))
+        self.added += 1
+        return True
+
+    def next_level(self) -> list[tuple[str, int]]:
+        """
+        Takes the waiting URLs of the shallowest depth, most relevant first, within the page limit.
+        :return: A list of (url, depth) pairs, empty when the crawl is done
+        """
+        level = []
+        if not self.queue:
+            return level
+        depth = self.queue[0][0]
+        while self.queue and self.queue[0][0] == depth and self.handed_out < self.max_pages:
+            level.append((heapq.heappop(self.queue)[3], depth))
+            self.handed_out += 1
+        return level
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def close(self):
+        """
+        Closes the set of URLs seen.
+        """
+        self.seen.close()
+
+
+# Main execution
+if __name__ == '__main__':
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description='Measure URL deduplication with a SeenSet and with a Python set.')
+    parser.add_argument('--urls', type=int, default=200000, help='number of distinct URLs (default: 200000)')
+    parser.add_argument('--repeats', type=int, default=2, help='times each URL is added (default: 2)')
+    args = parser.parse_args()
+
+    def generate_urls():
+        # the URLs are made as they are added, as a crawl finds them on pages, so a store keeps only what it holds
+        for _ in range(args.repeats):
+            for i in range(args.urls):
+                yield 'https://en.wikipedia.org/wiki/Article_{0}?section={1}'.format(i, i % 7)
+
+    def fill(name: str):
+        store = set() if name == 'set' else SeenSet(capacity=args.urls)
+        for url in generate_urls():
+            store.add(url)
+        return store
+
+    print('store\t\tdistinct\tseconds\tMB\tfalse positives')
+    for name in ['set', 'SeenSet']:
+        start = time.perf_counter()
+        filled = fill(name)
+        seconds = time.perf_counter() - start
+        false_positives = 0 if name == 'set' else filled.stats['false_positives']
+        distinct = len(filled)
+        del filled
+        # memory is traced in a second run, since tracing slows the first down
+        tracemalloc.start()
+        filled = fill(name)
+        memory = tracemalloc.get_traced_memory()[0] / 1e6
+        tracemalloc.stop()
+        del filled
+        print('{0:<8}\t{1}\t\t{2:.2f}\t{3:.1f}\t{4}'.format(name, distinct, seconds, memory, false_positives))
@@ -0,0 +1,196 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+HTTP Client
+This program is the HTTP layer of the crawler: every page and robots.txt file is requested through one shared
+requests Session, which keeps connections to each host open (keep-alive) and reuses them for later requests instead of
+opening a new TCP (and TLS) connection per request.
+
+Every request has a connect timeout and a read timeout, and requests answered with 429 (too many requests) or a 5xx
+error, or that fail to connect, are retried with exponential backoff (honouring a Retry-After header). A request that
+still fails raises RequestError, which names the URL and the cause.
+
+Run on its own, the program compares fetching pages of a local test server with a new connection per request and with
+the shared session.
+"""
+
+from crawl_engine import crawl, start_local_server, MAX_CONCURRENCY, PER_HOST_CONCURRENCY
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit, urlunsplit
+import requests
+import threading
+import argparse
+import time
+import re
+
+# user agent sent with every request
+USER_AGENT = 'NLP-Portfolio-Web-Crawler/1.0'
+# seconds to wait for a connection and for each read of the response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# number of retries of a failed request, and the base of the backoff (the waits are 0.5 s, 1 s, 2 s, ...)
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# statuses that are retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# number of hosts whose connections are kept, and connections kept per host
+POOL_CONNECTIONS = MAX_CONCURRENCY
+POOL_MAXSIZE = PER_HOST_CONCURRENCY
+
+# ports that are left out of normalized URLs
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# a percent escape in a URL, whose hexadecimal digits may be upper or lower case
+PERCENT_ESCAPE = re.compile('%[0-9a-fA-F]{2}')
+
+# the session shared by the crawler, made by get_session
+_session = None
+_session_lock = threading.Lock()
+
+
+class RequestError(Exception):
+    """
+    A request that failed after its retries, with the URL and the cause of the failure.
+    """
+
+    def __init__(self, url: str, cause):
+        super().__init__('Request error for {0}: {1}'.format(url, cause))
+        self.url = url
+        self.cause = cause
+
+
+def normalize_url(url: str) -> str:
+    """
+    Puts a URL in a canonical form, so that different spellings of a page have one key: the scheme and host are
+    lowercased, a default port and the fragment are removed, percent escapes are uppercased, and an empty path
+    becomes '/'
+    :param url: string of url
+    :return: The normalized url
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    # an IPv6 address keeps its brackets
+    if ':' in host:
+        host = '[' + host + ']'
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host += ':' + str(port)
+    path = PERCENT_ESCAPE.sub(lambda match: match.group(0).upper(), parts.path) or '/'
+    query = PERCENT_ESCAPE.sub(lambda match: match.group(0).upper(), parts.query)
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def create_session(pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE,
+                   retries: int = RETRIES, backoff_factor: float = BACKOFF_FACTOR) -> requests.Session:
+    """
+    Creates a session that pools connections and retries failed requests
+    :param pool_connections: The number of hosts whose connections are kept.
+    :param pool_maxsize: The number of connections kept per host (the crawl engine's per-host concurrency).
+    :param retries: The number of retries of a request that fails to connect or is answered with a retried status.
+    :param backoff_factor: The wait before the first retry, doubled for each later retry.
+    :return: The session
+    """
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(['GET', 'HEAD']),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the session shared by the crawler, creating it on first use
+    :return: The shared session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def fetch(url: str, session: requests.Session = None, timeout: (float, float) = (CONNECT_TIMEOUT, READ_TIMEOUT),
+          headers: dict[str, str] = None) -> requests.Response:
+    """
+    Requests a URL with timeouts and retries
+    :param url: The URL to request.
+    :param session: The session to request with (default: the shared session).
+    :param timeout: The connect timeout and read timeout in seconds.
+    :param headers: Extra request headers.
+    :return: The response, whose status is below 400
+    """
+    if session is None:
+        session = get_session()
+    try:
+        response = session.get(url, timeout=timeout, headers=headers)
+        response.raise_for_status()
+    except requests.RequestException as error:
+        raise RequestError(url, error) from error
+    return response
+
+
+def response_text(response: requests.Response) -> str:
+    """
+    Decodes the body of a response with its declared charset, or as UTF-8 if it has none
+    :param response: The response.
+    :return: The text of the body
+    """
+    # requests assumes ISO-8859-1 for text without a charset, but web pages without one are nearly always UTF-8
+    if 'charset' not in response.headers.get('Content-Type', '').lower():
+        return response.content.decode('utf8', errors='replace')
+    return response.text
+
+
+def fetch_text(url: str, session: requests.Session = None,
+               timeout: (float, float) = (CONNECT_TIMEOUT, READ_TIMEOUT)) -> str:
+    """
+    Requests a URL with timeouts and retries and returns its body as text
+    :param url: The URL to request.
+    :param session: The session to request with (default: the shared session).
+    :param timeout: The connect timeout and read timeout in seconds.
+    :return: The text of the body
+    """
+    return response_text(fetch(url, session, timeout))
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare new connections per request with a pooled session.')
+    parser.add_argument('--pages', type=int, default=500, help='number of pages to fetch (default: 500)')
+    parser.add_argument('--delay', type=float, default=0, help='seconds before the server sends each page')
+    parser.add_argument('--connect-delay', type=float, default=0.03,
+                        help='seconds before the server serves a new connection, standing in for the handshakes (default: 0.03)')
+    parser.add_argument('--concurrency', type=int, default=PER_HOST_CONCURRENCY,
+                        help='pages fetched at a time (default: {0})'.format(PER_HOST_CONCURRENCY))
+    args = parser.parse_args()
+
+    local_server, base_url = start_local_server(args.delay, args.connect_delay)
+    page_urls = [base_url + '/page/' + str(i) for i in range(args.pages)]
+
+    # a new connection for every request, as requests.get and urlopen do
+    def fetch_unpooled(url: str) -> str:
+        return requests.get(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)).text
+
+    methods = [('new connection per request', fetch_unpooled),
+               ('pooled session', fetch_text)]
+    print('method\t\t\t\tconcurrency\tseconds\tpages/s')
+    for concurrency in sorted({1, args.concurrency}):
+        for method, fetch_page in methods:
+            crawled = crawl(page_urls, fetch_page, max_concurrency=concurrency, per_host=concurrency)
+            print('{0:<28}\t{1}\t\t{seconds:.2f}\t{pages_per_second:.0f}'.format(method, concurrency, **crawled))
+
+    # a page that fails with 503 before it succeeds is retried
+    start = time.perf_counter()
+    flaky_text = fetch_text(base_url + '/flaky/1')
+    print('flaky page fetched after a 503 in {0:.2f} s'.format(time.perf_counter() - start))
+    local_server.shutdown()
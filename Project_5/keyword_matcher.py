@@ -0,0 +1,212 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Keyword Matcher
+This program finds every keyword of a list in a text in one pass over the text, however many keywords there are,
+instead of one search (and one lowercased copy of the text) per keyword.
+
+The keywords are compiled once into an Aho-Corasick automaton: a trie of the lowercased keywords, where each node also
+has a failure link to the node of its longest proper suffix that is in the trie, and the keywords ending at the node or
+at any node its failure links reach. Reading the text a character at a time moves through the trie, following failure
+links on a mismatch, and reports the keywords of each node reached; each move that follows failure links is remembered,
+so reading a character is one dictionary lookup. Matching is case-insensitive and finds keywords anywhere in the text,
+as the 'keyword in text.lower()' tests it replaces did.
+
+Lists of at most SMALL_LIST_SIZE keywords, such as the crawler's own, are searched for one keyword at a time in the
+lowercased text instead, since Python's substring search of a few keywords is faster than a Python loop over the text.
+
+The crawler uses a matcher to tag sentences with their keywords (fact_loader.py) and to score and filter URLs
+(contains_keywords and make_frontier of web_crawler.py).
+
+Run on its own, the program tags generated sentences with keyword lists of growing size, with a matcher and with one
+search per keyword, and prints the sentences tagged per second by each and the time to compile each matcher.
+"""
+
+from collections import deque
+import functools
+import argparse
+import time
+
+# largest keyword list searched for one keyword at a time instead of with the automaton
+SMALL_LIST_SIZE = 128
+
+
+class KeywordMatcher:
+    """
+    A list of keywords compiled into an Aho-Corasick automaton, which finds all the keywords in a text in one pass.
+    """
+
+    def __init__(self, keywords: list[str]):
+        """
+        Compiles a list of keywords.
+        :param keywords: The keywords (matched case-insensitively).
+        """
+        self.keywords = list(keywords)
+        for keyword in self.keywords:
+            if not isinstance(keyword, str):
+                raise TypeError('keyword {0!r} is not a string'.format(keyword))
+        # the trie: the children of each node by character, its failure link, and the keywords (by position in the
+        # list) that end there
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for index, keyword in enumerate(self.keywords):
+            node = 0
+            for character in keyword.lower():
+                child = self.goto[node].get(character)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][character] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                node = child
+            self.outputs[node].append(index)
+
+        # failure links, breadth first so that the links of shallower nodes are known first
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, child in self.goto[node].items():
+                queue.append(child)
+                link = self.fail[node]
+                while link and character not in self.goto[link]:
+                    link = self.fail[link]
+                self.fail[child] = self.goto[link].get(character, 0) if node else 0
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+        self.outputs = [tuple(output) for output in self.outputs]
+        # the moves of each node by character, starting with its children; next_node adds the moves that follow
+        # failure links as the texts read need them
+        self.moves = [dict(children) for children in self.goto]
+        # short lists are searched for one keyword at a time, as the substring search of a few keywords is faster than
+        # reading the text through the automaton
+        self.lowered = [keyword.lower() for keyword in self.keywords] if len(self.keywords) <= SMALL_LIST_SIZE else None
+
+    def next_node(self, node: int, character: str) -> int:
+        """
+        Moves through the automaton on a character, following failure links on a mismatch; the move is remembered, so
+        the links are followed once for each node and character met.
+        :param node: The node reached so far.
+        :param character: The next character of the text (lowercased).
+        :return: The node reached
+        """
+        link = node
+        while link and character not in self.goto[link]:
+            link = self.fail[link]
+        child = self.goto[link].get(character, 0)
+        self.moves[node][character] = child
+        return child
+
+    def indexes(self, text: str) -> set[int]:
+        """
+        Reads a text through the automaton.
+        :param text: The text.
+        :return: The positions in the keyword list of the keywords found
+        """
+        found = set()
+        if not text:
+            return found
+        if self.lowered is not None:
+            lowered = text.lower()
+            return {index for index, keyword in enumerate(self.lowered) if keyword in lowered}
+        moves, outputs = self.moves, self.outputs
+        # an empty keyword is in every text that is not empty
+        found.update(outputs[0])
+        node = 0
+        for character in text.lower():
+            child = moves[node].get(character)
+            node = child if child is not None else self.next_node(node, character)
+            if outputs[node]:
+                found.update(outputs[node])
+        return found
+
+    def find(self, text: str) -> list[str]:
+        """
+        Returns the keywords in a text.
+        :param text: The text.
+        :return: The keywords found, once each, in the order of the keyword list
+        """
+        return [self.keywords[index] for index in sorted(self.indexes(text))]
+
+    def contains(self, text: str) -> bool:
+        """
+        Returns whether a text contains any keyword, stopping at the first one found.
+        :param text: The text.
+        :return: True if a keyword was found
+        """
+        if not text:
+            return False
+        if self.lowered is not None:
+            lowered = text.lower()
+            return any(keyword in lowered for keyword in self.lowered)
+        moves, outputs = self.moves, self.outputs
+        if outputs[0]:
+            return True
+        node = 0
+        for character in text.lower():
+            child = moves[node].get(character)
+            node = child if child is not None else self.next_node(node, character)
+            if outputs[node]:
+                return True
+        return False
+
+    def count(self, text: str) -> int:
+        """
+        Returns the number of different keywords in a text.
+        :param text: The text.
+        :return: The number of keywords found
+        """
+        return len(self.indexes(text))
+
+
+@functools.lru_cache(maxsize=64)
+def get_matcher(keywords: tuple[str, ...]) -> KeywordMatcher:
+    """
+    Returns the matcher of a tuple of keywords, compiled on first use and then kept
+    :param keywords: The keywords.
+    :return: The matcher
+    """
+    return KeywordMatcher(list(keywords))
+
+
+# Main execution
+if __name__ == '__main__':
+    import random
+    import string
+
+    parser = argparse.ArgumentParser(description='Compare keyword tagging with a matcher and with one search per '
+                                                 'keyword.')
+    parser.add_argument('--sentences', type=int, default=2000, help='number of sentences tagged (default: 2000)')
+    parser.add_argument('--keywords', type=int, nargs='+', default=[10, 100, 1000, 5000],
+                        help='sizes of the keyword lists (default: 10 100 1000 5000)')
+    args = parser.parse_args()
+
+    random.seed(0)
+    vocabulary = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 10))) for _ in range(20000)]
+    titanic = ['titanic', 'ship', 'maritime', 'salvage', 'wreck', 'bodies', 'dead', 'iceberg', 'sea', 'steel']
+    sentences = [' '.join(random.choices(vocabulary + titanic, k=20)).capitalize() + '.'
+                 for _ in range(args.sentences)]
+
+    def tag_by_search(keyword_list: list[str]) -> int:
+        # the tagging of create_database before: one lowercased copy and one search per keyword
+        return sum(len([keyword for keyword in keyword_list if keyword.lower() in sentence.lower()])
+                   for sentence in sentences)
+
+    print('keywords\tmethod\t\ttags\tseconds\tsentences/s\tcompile (s)')
+    for size in args.keywords:
+        keyword_list = titanic + random.sample(vocabulary, max(0, size - len(titanic)))
+        start = time.perf_counter()
+        tags = tag_by_search(keyword_list)
+        seconds = time.perf_counter() - start
+        print('{0}\t\tsearch  \t{1}\t{2:.3f}\t{3:.0f}'.format(size, tags, seconds, len(sentences) / seconds))
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keyword_list)
+        compile_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        tags = sum(len(matcher.find(sentence)) for sentence in sentences)
+        seconds = time.perf_counter() - start
+        print('{0}\t\tmatcher \t{1}\t{2:.3f}\t{3:.0f}\t\t{4:.3f}'.format(
+            size, tags, seconds, len(sentences) / seconds, compile_seconds))
@@ -0,0 +1,231 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Pipeline
+This program crawls, cleans and indexes pages as one chain of generators, without the intermediate raw_text_N.txt and
+sentences_N.txt files of scrape_and_clean: each page flows from the crawl engine through sentence splitting, term
+counting and keyword tagging into the database as soon as it is downloaded, while later pages are still downloading.
+
+    stream_site         downloads pages breadth first and yields the paragraph text of each
+    split_sentences     yields the sentences of each page
+    count_terms         counts the words of the sentences (for most_frequent_terms' report) and passes them on
+    tag_sentences       yields the sentences of each page that contain keywords, with their keywords
+    index_facts         writes the tagged sentences to the facts and tags tables, one transaction per page
+
+Only one page (plus the few the crawl engine holds while the pipeline is busy) is in memory at a time. Writing the
+stages' text to files is optional (write_debug_files), for debugging.
+
+Run on its own, the program compares the file-based functions of web_crawler.py with the pipeline on a local test
+server, or with --url crawls a website into database.db.
+"""
+
+from web_crawler import fetch_html, extract_raw_text, extract_links, clean_sentences, make_frontier, \
+    get_robots_policy, page_is_cached, MAX_DEPTH, MAX_PAGES
+from fact_loader import open_database, insert_facts, tag_sentences, DATABASE_FILE
+from crawl_engine import iter_crawl, MAX_CONCURRENCY, PER_HOST_CONCURRENCY
+from bs4 import BeautifulSoup
+from collections import Counter
+from nltk import word_tokenize
+import web_crawler
+import argparse
+import sqlite3
+import time
+import nltk
+import os
+
+
+def stream_site(start_url: str, keyword_list: list[str], filters: list[str], max_depth: int = MAX_DEPTH,
+                max_pages: int = MAX_PAGES, max_concurrency: int = MAX_CONCURRENCY,
+                per_host: int = PER_HOST_CONCURRENCY):
+    """
+    Downloads the pages reachable from a starting page, breadth first, and yields their text as they arrive
+    :param start_url: The URL of the starting page
+    :param keyword_list: A list of words that make a URL more relevant
+    :param filters: A list of words that relevant URLs should not have
+    :param max_depth: The largest number of links between the starting page and a scraped page
+    :param max_pages: The largest number of pages scraped
+    :param max_concurrency: The largest number of pages downloaded at a time
+    :param per_host: The largest number of pages downloaded at a time from one host
+    :return: A generator of (url, raw text) pairs
+    """
+    frontier = make_frontier(start_url, keyword_list, filters, max_depth, max_pages)
+    policy = get_robots_policy() if web_crawler.CHECK_ROBOT else None
+
+    level = frontier.next_level()
+    while level:
+        depth = level[0][1]
+
+        # parse each page once, in the crawl engine's threads; the links of the deepest pages are not needed
+        def parse_page(url: str, html: str) -> (str, list[str]):
+            soup = BeautifulSoup(html, features='html.parser')
+            links = extract_links(soup, url) if depth < max_depth else []
+            return extract_raw_text(soup), links
+
+        summary = {}
+        for url, (raw_text, links) in iter_crawl([url for url, _ in level], fetch_html, parse_page, max_concurrency,
+                                                 per_host, policy, summary, page_is_cached):
+            for link in links:
+                frontier.add(link, depth + 1)
+            yield url, raw_text
+
+        for url, error in summary['errors'].items():
+            print('Error requesting {0}: {1}'.format(url, error))
+        for url in summary['disallowed']:
+            print("FILE rejected by robots.txt for {}.".format(url))
+        print('Depth {0}: {pages} pages in {seconds:.2f} s ({pages_per_second:.1f} pages/s), {1} URLs waiting'.format(
+            depth, len(frontier), **summary))
+        level = frontier.next_level()
+
+    frontier.close()
+
+
+def split_sentences(pages):
+    """
+    Splits the text of each page into sentences
+    :param pages: An iterable of (url, raw text) pairs
+    :return: A generator of (url, list of sentences) pairs
+    """
+    for url, raw_text in pages:
+        yield url, clean_sentences(raw_text)
+
+
+def write_debug_files(documents, directory: str, prefix: str):
+    """
+    Writes each document to a numbered file, with its URL as the first line, and passes it on unchanged
+    :param documents: An iterable of (url, text or list of lines) pairs
+    :param directory: The directory to write the files to
+    :param prefix: The start of the file names ('raw_text' writes raw_text_0.txt, raw_text_1.txt, ...)
+    :return: A generator of the same (url, text) pairs
+    """
+    os.makedirs(directory, exist_ok=True)
+    for i, (url, text) in enumerate(documents):
+        with open(os.path.join(directory, prefix + '_' + str(i) + '.txt'), 'w', encoding='utf-8') as f:
+            f.write(url + '\n')
+            f.write(text if isinstance(text, str) else ''.join(line + '\n' for line in text))
+        yield url, text
+
+
+def count_terms(documents, counts: Counter, stopwords: set[str]):
+    """
+    Counts the lowercase alphabetic words of each page's sentences that are not stopwords, and passes the pages on
+    :param documents: An iterable of (url, list of sentences) pairs
+    :param counts: The counter to add the words to
+    :param stopwords: The words not counted
+    :return: A generator of the same (url, list of sentences) pairs
+    """
+    for url, sentences in documents:
+        tokens = word_tokenize(' '.join(sentences).lower())
+        counts.update(t for t in tokens if t.isalpha() and t not in stopwords)
+        yield url, sentences
+
+
+def index_facts(documents, db_name: str) -> dict[str, int]:
+    """
+    Writes tagged sentences to new facts and tags tables, committing once per page
+    :param documents: An iterable of (url, list of (sentence, list of keywords)) pairs
+    :param db_name: Name of the database file
+    :return: A dictionary of the number of pages, facts and tags written
+    """
+    counts = {'pages': 0, 'facts': 0, 'tags': 0}
+    connection = open_database(db_name)
+    ids = {}
+    for document in documents:
+        facts, tags = insert_facts(connection, [document], ids)
+        counts['facts'] += facts
+        counts['tags'] += tags
+        counts['pages'] += 1
+    connection.close()
+    return counts
+
+
+def run_pipeline(start_url: str, filter_pos: list[str], filter_neg: list[str], keyword_list: list[str], db_name: str,
+                 max_depth: int = MAX_DEPTH, max_pages: int = MAX_PAGES, debug_directory: str = None,
+                 stopwords: set[str] = None) -> dict:
+    """
+    Crawls a site and indexes the sentences of its pages that contain keywords, streaming every page through all stages
+    :param start_url: The URL of the starting page
+    :param filter_pos: A list of words that make a URL more relevant
+    :param filter_neg: A list of words that relevant URLs should not have
+    :param keyword_list: List of keywords that identify relevant sentences
+    :param db_name: Name of the database file
+    :param max_depth: The largest number of links between the starting page and a scraped page
+    :param max_pages: The largest number of pages scraped
+    :param debug_directory: A directory to write the raw text and sentences of every page to (default: no files)
+    :param stopwords: The words not counted (default: nltk's English stopwords)
+    :return: A dictionary of the number of pages, facts and tags written, the counts of the words of every page, and
+    the time taken
+    """
+    if stopwords is None:
+        stopwords = set(nltk.corpus.stopwords.words('english'))
+    term_counts = Counter()
+    start = time.perf_counter()
+
+    pages = stream_site(start_url, filter_pos, filter_neg, max_depth, max_pages)
+    if debug_directory is not None:
+        pages = write_debug_files(pages, debug_directory, 'raw_text')
+    documents = split_sentences(pages)
+    if debug_directory is not None:
+        documents = write_debug_files(documents, debug_directory, 'sentences')
+    documents = count_terms(documents, term_counts, stopwords)
+    counts = index_facts(tag_sentences(documents, keyword_list), db_name)
+
+    return {**counts, 'term_counts': term_counts, 'seconds': time.perf_counter() - start}
+
+
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl, clean and index pages as a stream.')
+    parser.add_argument('--url', default=None, help='starting URL to crawl into database.db (default: compare the file '
+                                                    'functions and the pipeline on a local test server)')
+    parser.add_argument('--depth', type=int, default=MAX_DEPTH, help='largest link depth crawled')
+    parser.add_argument('--pages', type=int, default=MAX_PAGES, help='largest number of pages crawled')
+    parser.add_argument('--debug-directory', default=None, help='directory to write the text of every stage to')
+    args = parser.parse_args()
+
+    keywords = ['titanic', 'ship', 'maritime', 'salvage', 'wreck', 'bodies', 'dead', 'iceberg', 'sea', 'steel']
+
+    if args.url is not None:
+        result = run_pipeline(args.url, [], ['wikimedia', 'wikipedia'], keywords, DATABASE_FILE, args.depth, args.pages,
+                              args.debug_directory)
+        print('{pages} pages, {facts} facts, {tags} tags in {seconds:.2f} s'.format(**result))
+        print('Most frequent words by count')
+        for i, word in enumerate(result['term_counts'].most_common(25)):
+            print(str(i + 1) + ': ' + str(word))
+    else:
+        from crawl_engine import start_local_server
+        from web_crawler import crawl_site, create_database
+        import tempfile
+
+        # the local server has no robots.txt and the cache would hide the downloads
+        web_crawler.CHECK_ROBOT = False
+        web_crawler.USE_CACHE = False
+        local_server, base_url = start_local_server(0.01)
+        start_page = base_url + '/page/0'
+        depth = max(args.depth, 8)
+
+        # the file-based functions write to the working directory, which is restored even if they fail
+        caller_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                # the file-based functions: scrape to files, then read the sentence files back to index them
+                start_time = time.perf_counter()
+                files = crawl_site(start_page, [], [], depth, args.pages)
+                create_database('files.db', [files[url][1] for url in files], keywords)
+                file_seconds = time.perf_counter() - start_time
+                file_count = len(os.listdir(directory))
+
+                result = run_pipeline(start_page, [], [], keywords, 'stream.db', depth, args.pages, stopwords=set())
+                with sqlite3.connect('files.db') as files_db, sqlite3.connect('stream.db') as stream_db:
+                    query = "SELECT sentence, source, tag FROM facts JOIN tags ON fact_id = id"
+                    same = sorted(files_db.execute(query)) == sorted(stream_db.execute(query))
+            finally:
+                os.chdir(caller_directory)
+
+        print('method\t\tpages\tseconds\tfiles written')
+        print('files\t\t{0}\t{1:.2f}\t{2}'.format(len(files), file_seconds, file_count - 1))
+        print('pipeline\t{pages}\t{seconds:.2f}\t0'.format(**result))
+        print('same tags:', same)
+        local_server.shutdown()
@@ -0,0 +1,206 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Response Cache
+This program keeps the pages the crawler downloads in an SQLite file, keyed by normalized URL, with their ETag and
+Last-Modified headers, so a later run does not download them again:
+    fresh       a page younger than its max-age (from Cache-Control, or max_age) is read from the cache
+    stale       an older page is revalidated with a conditional GET (If-None-Match / If-Modified-Since); a 304 (not
+                modified) answer renews the cached page without downloading it, any other answer replaces it
+    offline     only the cache is read, stale or not, and a page that is not cached raises CacheMiss (a RequestError)
+Rebuilding the database from pages already crawled therefore costs no network requests in offline mode.
+
+Run on its own, the program crawls pages of a local test server four times: with an empty cache, with every page
+fresh, with every page stale, and offline, and prints the requests sent and the time of each.
+"""
+
+from http_client import fetch, response_text, normalize_url, RequestError
+import threading
+import argparse
+import sqlite3
+import time
+import re
+
+# cache file used by the crawler
+CACHE_FILE = 'response_cache.db'
+# seconds a page without a Cache-Control max-age stays fresh
+MAX_AGE = 24 * 60 * 60
+
+
+class CacheMiss(RequestError):
+    """
+    A page requested in offline mode that is not in the cache.
+    """
+
+    def __init__(self, url: str):
+        super().__init__(url, 'not in the cache (offline mode)')
+
+
+def response_max_age(headers):
+    """
+    Returns how long a response may be used without revalidation, from its Cache-Control header
+    :param headers: The headers of the response.
+    :return: The number of seconds the response stays fresh, or None if the response does not say
+    """
+    cache_control = headers.get('Cache-Control', '').lower()
+    # no-cache and no-store pages are kept but always revalidated
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0
+    match = re.search(r'max-age\s*=\s*(\d+)', cache_control)
+    return int(match.group(1)) if match else None
+
+
+class ResponseCache:
+    """
+    Pages downloaded by the crawler, stored in an SQLite file and revalidated with conditional requests.
+    """
+
+    def __init__(self, filepath: str = CACHE_FILE, max_age: float = MAX_AGE, offline: bool = False):
+        """
+        Opens (or creates) a cache file.
+        :param filepath: The path of the cache file.
+        :param max_age: The seconds a page without a Cache-Control max-age stays fresh.
+        :param offline: Whether to read only from the cache and never send a request.
+        """
+        self.filepath = filepath
+        self.max_age = max_age
+        self.offline = offline
+        # the crawl engine fetches from several threads, which share one connection in turns
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                "url TEXT NOT NULL, "
+                                "body TEXT NOT NULL, "
+                                "etag TEXT, "
+                                "last_modified TEXT, "
+                                "fetched REAL NOT NULL, "
+                                "max_age REAL, "
+                                "PRIMARY KEY (url))")
+        self.connection.commit()
+        # number of pages read from the cache, renewed by a 304 answer, and downloaded
+        self.stats = {'hits': 0, 'revalidated': 0, 'downloads': 0}
+
+    def lookup(self, url: str):
+        """
+        Reads the cached copy of a page.
+        :param url: The URL of the page.
+        :return: A tuple (body, etag, last_modified, fetched, max_age), or None if the page is not cached
+        """
+        with self.lock:
+            return self.connection.execute("SELECT body, etag, last_modified, fetched, max_age FROM responses "
+                                           "WHERE url=?", (normalize_url(url),)).fetchone()
+
+    def is_fresh(self, cached) -> bool:
+        """
+        Returns whether a cached page may be used without revalidation.
+        :param cached: The tuple returned by lookup.
+        :return: True if the page is younger than its max-age (or the cache's max_age if it has none)
+        """
+        max_age = cached[4] if cached[4] is not None else self.max_age
+        return time.time() < cached[3] + max_age
+
+    def can_serve(self, url: str) -> bool:
+        """
+        Returns whether fetch_text answers a URL without sending a request.
+        :param url: The URL of the page.
+        :return: True in offline mode, or if the page is cached and fresh
+        """
+        if self.offline:
+            return True
+        cached = self.lookup(url)
+        return cached is not None and self.is_fresh(cached)
+
+    def store(self, url: str, body: str, headers):
+        """
+        Saves a downloaded page with its validators.
+        :param url: The URL of the page.
+        :param body: The text of the page.
+        :param headers: The headers of the response.
+        """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                    (normalize_url(url), body, headers.get('ETag'), headers.get('Last-Modified'),
+                                     time.time(), response_max_age(headers)))
+            self.connection.commit()
+
+    def renew(self, url: str, headers):
+        """
+        Marks a cached page as fresh again after a 304 answer.
+        :param url: The URL of the page.
+        :param headers: The headers of the 304 response.
+        """
+        with self.lock:
+            self.connection.execute("UPDATE responses SET fetched=?, max_age=? WHERE url=?",
+                                    (time.time(), response_max_age(headers), normalize_url(url)))
+            self.connection.commit()
+
+    def fetch_text(self, url: str) -> str:
+        """
+        Returns the text of a page, from the cache if it is fresh (or in offline mode), otherwise from the network with
+        a conditional request if a stale copy is cached.
+        :param url: The URL of the page.
+        :return: The text of the page
+        """
+        cached = self.lookup(url)
+        if cached is not None and (self.offline or self.is_fresh(cached)):
+            with self.lock:
+                self.stats['hits'] += 1
+            return cached[0]
+        if self.offline:
+            raise CacheMiss(url)
+
+        # ask the server to answer 304 if the cached copy is still valid
+        headers = {}
+        if cached is not None:
+            if cached[1] is not None:
+                headers['If-None-Match'] = cached[1]
+            if cached[2] is not None:
+                headers['If-Modified-Since'] = cached[2]
+        response = fetch(url, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            self.renew(url, response.headers)
+            with self.lock:
+                self.stats['revalidated'] += 1
+            return cached[0]
+        body = response_text(response)
+        self.store(url, body, response.headers)
+        with self.lock:
+            self.stats['downloads'] += 1
+        return body
+
+    def close(self):
+        """
+        Closes the cache file.
+        """
+        with self.lock:
+            self.connection.close()
+
+
+# Main execution
+if __name__ == '__main__':
+    from crawl_engine import crawl, start_local_server
+    import tempfile
+    import os
+
+    parser = argparse.ArgumentParser(description='Crawl a local test server through the response cache.')
+    parser.add_argument('--pages', type=int, default=200, help='number of pages to crawl (default: 200)')
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds before the server sends each page')
+    args = parser.parse_args()
+
+    local_server, base_url = start_local_server(args.delay)
+    page_urls = [base_url + '/page/' + str(i) for i in range(args.pages)]
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, CACHE_FILE)
+        print('run\t\t\tdownloads\trevalidated\thits\tseconds')
+        # an empty cache, then every page fresh, every page stale (max_age 0), and offline
+        for run, max_age, offline in [('empty cache', MAX_AGE, False), ('all pages fresh', MAX_AGE, False),
+                                      ('all pages stale', 0, False), ('offline', MAX_AGE, True)]:
+            cache = ResponseCache(cache_path, max_age, offline)
+            crawled = crawl(page_urls, cache.fetch_text)
+            print('{0:<16}\t{downloads}\t\t{revalidated}\t\t{hits}\t{1:.2f}'.format(run, crawled['seconds'],
+                                                                                **cache.stats))
+            cache.close()
+    local_server.shutdown()
@@ -0,0 +1,173 @@
+"""
+Web Crawler
+Jordan Frimpter
+Henry Kim
+
+Robots Policy
+This program decides without asking the user whether the crawler may download a page, from the robots.txt file of
+the page's host, and how long it must wait between requests to that host.
+
+The robots.txt file of a host is downloaded the first time one of its pages is checked and parsed with
+urllib.robotparser for the crawler's user agent (USER_AGENT of http_client.py); the parsed rules are kept for ttl seconds
+and then downloaded again. The download goes through the policy's fetch_text, such as fetch_html of web_crawler.py,
+which reads it from the response cache when it is cached. A host without a robots.txt file (404 and other 4xx answers)
+allows every page; a host that answers 401 or 403, a server error, or cannot be reached allows none until its rules
+expire. The wait between requests to a host is its Crawl-delay (or Request-rate), or default_delay if it gives neither.
+
+In offline mode no request reaches any host: there is no wait between pages, and a host whose robots.txt is not in the
+cache allows every page (its cached pages were allowed when they were downloaded).
+
+The crawl engine uses a policy to skip disallowed pages and to space the requests to each host, while the pages of
+other hosts keep downloading.
+
+Run on its own, the program crawls several local test servers with different robots.txt rules and reports the pages
+per second and the shortest interval between the requests to each server.
+"""
+
+from http_client import fetch, RequestError, USER_AGENT
+from response_cache import CacheMiss
+from crawl_engine import host_of
+from urllib.robotparser import RobotFileParser
+from urllib.parse import urlsplit
+import threading
+import argparse
+import time
+
+# seconds the rules of a host are kept before its robots.txt is downloaded again
+ROBOTS_TTL = 60 * 60
+# seconds between requests to a host whose robots.txt gives no Crawl-delay
+DEFAULT_CRAWL_DELAY = 0.5
+
+
+class RobotsPolicy:
+    """
+    The robots.txt rules of every host seen, cached for a time, answering whether a page may be crawled and how long to
+    wait between requests to its host.
+    """
+
+    def __init__(self, user_agent: str = USER_AGENT, ttl: float = ROBOTS_TTL, default_delay: float = DEFAULT_CRAWL_DELAY,
+                 fetch_text=None, offline: bool = False):
+        """
+        Creates a policy with no rules yet.
+        :param user_agent: The user agent the rules are read for.
+        :param ttl: The seconds the rules of a host are kept.
+        :param default_delay: The seconds between requests to a host whose rules give no delay.
+        :param fetch_text: A blocking function returning the text of a URL and raising RequestError if it fails
+        (default: a request with fetch of http_client.py).
+        :param offline: Whether pages are only read from the cache, so that no wait between requests is needed.
+        """
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.default_delay = default_delay
+        self.fetch_text = fetch_text if fetch_text is not None else lambda url: fetch(url).text
+        self.offline = offline
+        # (parser, expiry time) keyed by host
+        self.rules = {}
+        # one lock per host, so that its robots.txt is downloaded once however many threads ask
+        self.locks = {}
+        self.lock = threading.Lock()
+        # time (time.monotonic) of the next request each host may receive, kept by the crawl engine across crawls
+        self.host_turns = {}
+
+    def download_rules(self, url: str) -> RobotFileParser:
+        """
+        Downloads and parses the robots.txt file of a URL's host.
+        :param url: A URL of the host.
+        :return: The parsed rules
+        """
+        parts = urlsplit(url)
+        robots_url = parts.scheme + '://' + parts.netloc + '/robots.txt'
+        parser = RobotFileParser(robots_url)
+        try:
+            parser.parse(self.fetch_text(robots_url).splitlines())
+        except CacheMiss:
+            # offline, nothing is requested from the host
+            parser.allow_all = True
+        except RequestError as error:
+            response = getattr(error.cause, 'response', None)
+            status = response.status_code if response is not None else None
+            # no robots.txt file means no rules; forbidden or failing robots.txt files mean no access
+            if status is not None and 400 <= status < 500 and status not in (401, 403):
+                parser.allow_all = True
+            else:
+                parser.disallow_all = True
+        return parser
+
+    def rules_for(self, url: str) -> RobotFileParser:
+        """
+        Returns the rules of a URL's host, downloading them if they are not cached or have expired.
+        :param url: A URL of the host.
+        :return: The parsed rules
+        """
+        host = host_of(url)
+        with self.lock:
+            host_lock = self.locks.setdefault(host, threading.Lock())
+        with host_lock:
+            cached = self.rules.get(host)
+            if cached is None or cached[1] <= time.monotonic():
+                cached = (self.download_rules(url), time.monotonic() + self.ttl)
+                self.rules[host] = cached
+        return cached[0]
+
+    def allowed(self, url: str) -> bool:
+        """
+        Returns whether a page may be crawled.
+        :param url: The URL of the page.
+        :return: True if the robots.txt rules of its host allow the crawler's user agent to fetch it
+        """
+        return self.rules_for(url).can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url: str) -> float:
+        """
+        Returns the seconds to wait between requests to a URL's host.
+        :param url: A URL of the host.
+        :return: The host's Crawl-delay, or the interval of its Request-rate, or the default delay (0 in offline mode)
+        """
+        if self.offline:
+            return 0
+        rules = self.rules_for(url)
+        delay = rules.crawl_delay(self.user_agent)
+        rate = rules.request_rate(self.user_agent)
+        if rate is not None and rate.requests > 0:
+            delay = max(delay or 0, rate.seconds / rate.requests)
+        return float(delay) if delay is not None else self.default_delay
+
+    def check(self, url: str) -> (bool, float):
+        """
+        Returns whether a page may be crawled and the seconds to wait between requests to its host; used by the crawl
+        engine.
+        :param url: The URL of the page.
+        :return: A tuple (allowed, delay)
+        """
+        return self.allowed(url), self.crawl_delay(url)
+
+
+# Main execution
+if __name__ == '__main__':
+    from crawl_engine import crawl, start_local_server
+
+    parser = argparse.ArgumentParser(description='Crawl local test servers that have different robots.txt rules.')
+    parser.add_argument('--pages', type=int, default=10, help='pages crawled from each server (default: 10)')
+    parser.add_argument('--default-delay', type=float, default=DEFAULT_CRAWL_DELAY,
+                        help='seconds between requests to a server without a Crawl-delay (default: {0})'.format(
+                            DEFAULT_CRAWL_DELAY))
+    args = parser.parse_args()
+
+    # each server stands in for a different site
+    sites = [('Crawl-delay: 1', 'User-agent: *\nCrawl-delay: 1\n'),
+             ('Disallow: /page/1', 'User-agent: *\nDisallow: /page/1\n'),
+             ('Disallow: / for us', 'User-agent: ' + USER_AGENT.split('/')[0] + '\nDisallow: /\n'),
+             ('no robots.txt', None)]
+    servers = [start_local_server(0.01, robots=robots) for _, robots in sites]
+    urls = [base_url + '/page/' + str(i) for i in range(args.pages) for _, base_url in servers]
+
+    policy = RobotsPolicy(default_delay=args.default_delay)
+    crawled = crawl(urls, fetch, lambda url, response: response.status_code, policy=policy)
+    print('{pages} pages in {seconds:.2f} s ({pages_per_second:.1f} pages/s), {0} disallowed'.format(
+        len(crawled['disallowed']), **crawled))
+    print('site\t\t\tpages\tshortest interval (s)')
+    for (site, _), (server, _) in zip(sites, servers):
+        times = server.RequestHandlerClass.request_times
+        intervals = [later - earlier for earlier, later in zip(times, times[1:])]
+        print('{0:<20}\t{1}\t{2}'.format(site, len(times), '{0:.3f}'.format(min(intervals)) if intervals else '-'))
+        server.shutdown()
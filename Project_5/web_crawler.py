@@ -8,14 +8,19 @@ This web crawler collects and saves information from webpages about the Titanic
 """
 
 import pickle
-import sqlite3
 from bs4 import BeautifulSoup
 import re
-import requests
-from urllib import request
 import nltk
 from nltk import sent_tokenize
 from nltk import word_tokenize
+from crawl_engine import crawl, MAX_CONCURRENCY, PER_HOST_CONCURRENCY
+from http_client import fetch_text, RequestError
+from response_cache import ResponseCache, CACHE_FILE
+from frontier import Frontier, resolve_link, MAX_DEPTH, MAX_PAGES
+from robots_policy import RobotsPolicy
+from fact_loader import load_database
+from keyword_matcher import get_matcher
+import threading
 
 # dictionary for robot files
 ROBOTS_FILES = {}
@@ -23,8 +28,21 @@ ROBOTS_FILES = {}
 BANNED_BASE_URL = ['facebook.com']
 # dictionary file
 DICT_FILE = "filemap.pickle"
-# query robots.txt
-CHECK_ROBOT = False
+# obey robots.txt automatically (disallowed pages are skipped and each site's crawl delay is kept)
+CHECK_ROBOT = True
+# also present robots.txt files for manual approval
+APPROVE_ROBOT = False
+# keep downloaded pages in the response cache file (CACHE_FILE), and only read pages from it
+USE_CACHE = True
+OFFLINE = False
+# directory the crawler writes the raw text and sentences of every page to, for debugging (None: no files)
+DEBUG_DIRECTORY = None
+
+# the response cache, opened by fetch_html on first use
+_response_cache = None
+_response_cache_lock = threading.Lock()
+# the robots.txt rules of the sites crawled, made by get_robots_policy
+_robots_policy = None
 
 
 # function to check if a keyword exists in a string
@@ -40,16 +58,29 @@ def contains_keywords(text: str, keyword_set: list[str]) -> bool:
         print("WARNING: invalid datatype given to function contains_keywords")
         return False
 
-    # investigate for keywords
-    for key in keyword_set:
-        # reject invalid keyword type
-        if not isinstance(key, str):
-            print("WARNING: invalid datatype in list parameter given to function contains_keywords")
-            return False
-        # perform check for keyword in string
-        if text and key in text.lower():
-            return True
-    return False
+    # reject invalid keyword type
+    try:
+        matcher = get_matcher(tuple(keyword_set))
+    except TypeError:
+        print("WARNING: invalid datatype in list parameter given to function contains_keywords")
+        return False
+
+    # investigate for keywords, all at once
+    return matcher.contains(text)
+
+
+# function for the robots.txt rules of the crawled sites
+def get_robots_policy() -> RobotsPolicy:
+    """
+    Returns the robots.txt policy shared by the crawler, creating it on first use
+    :return: The policy, which caches the rules of each site
+    """
+    global _robots_policy
+    if _robots_policy is None:
+        # robots.txt files are downloaded like pages, through the response cache
+        _robots_policy = RobotsPolicy(fetch_text=fetch_html)
+    _robots_policy.offline = OFFLINE
+    return _robots_policy
 
 
 # function for human approval of robots.txt
@@ -82,8 +113,12 @@ def approve_scrape(url: str) -> bool:
 
     # if robots.txt file not in collection, go collect it
     if url_base not in ROBOTS_FILES:
-        r = requests.get(url_base + "/robots.txt")
-        ROBOTS_FILES[url_base] = r.text
+        try:
+            ROBOTS_FILES[url_base] = fetch_html(url_base + "/robots.txt")
+        except RequestError as error:
+            # a site without a robots.txt file has no rules
+            print(error)
+            ROBOTS_FILES[url_base] = ""
     else:
         print("robots.txt file retrieved from search history collection.")
 
@@ -144,6 +179,19 @@ def is_not_banned_url(url: str, silent: bool = False) -> bool:
     return True
 
 
+# collect the links of a webpage
+def extract_links(page, page_url: str) -> list[str]:
+    """
+    Collects the http(s) links of a webpage, resolved against its URL and normalized, without duplicates
+    :param page: The HTML of the page, or a BeautifulSoup object of it
+    :param page_url: The URL of the page
+    :return: A list of the unique URLs the page links to, in the order they appear
+    """
+    soup = page if isinstance(page, BeautifulSoup) else BeautifulSoup(page, features='html.parser')
+    links = (resolve_link(page_url, link.get('href')) for link in soup.find_all('a'))
+    return list(dict.fromkeys(link for link in links if link is not None))
+
+
 # scrape a webpage for urls
 def gather_urls(starting_url: str, keyword_list: list[str], filters: list[str], validate: bool = True) -> list[str]:
     """
@@ -183,29 +231,28 @@ def gather_urls(starting_url: str, keyword_list: list[str], filters: list[str],
     # function ===================
 
     # Request the page and store it as a soup object
-    r = requests.get(starting_url)
-    data = r.text
+    try:
+        data = fetch_html(starting_url)
+    except RequestError as error:
+        print(error)
+        return []
     soup = BeautifulSoup(data, features='html.parser')
 
-    # Collect URLs and write to a file
-    url_list = []
-    for link in soup.find_all('a'):
-        url = link.get('href')
-        url_list.append(url)
-
-    # Get the unique URLs
-    url_list = list(set(url_list))
+    # Collect the unique URLs, resolved against the page and normalized
+    url_list = extract_links(soup, starting_url)
 
     # Only save urls that have one of the keywords
     if len(keyword_list) > 0:
-        url_list = [url for url in url_list if contains_keywords(url, keyword_list)]
+        keyword_matcher = get_matcher(tuple(keyword_list))
+        url_list = [url for url in url_list if keyword_matcher.contains(url)]
 
     # filter out banned base urls
     url_list = [url for url in url_list if is_not_banned_url(url, False)]
 
     # Remove urls that have filtered words
     if len(filters) > 0:
-        url_list = [url for url in url_list if not contains_keywords(url, filters)]
+        filter_matcher = get_matcher(tuple(filters))
+        url_list = [url for url in url_list if not filter_matcher.contains(url)]
 
     # Write the urls to file and print them
     print('URLs gathered')
@@ -218,6 +265,78 @@ def gather_urls(starting_url: str, keyword_list: list[str], filters: list[str],
     return url_list
 
 
+# function for the response cache of the crawler
+def get_response_cache() -> ResponseCache:
+    """
+    Returns the response cache shared by the crawler, opening it on first use
+    :return: The cache of the pages downloaded
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(CACHE_FILE, offline=OFFLINE)
+    return _response_cache
+
+
+# fetch the html of a webpage
+def fetch_html(target_url: str) -> str:
+    """
+    Downloads a webpage with the shared HTTP session (pooled connections, timeouts and retries), through the response
+    cache if USE_CACHE is set; with OFFLINE set, pages are only read from the cache
+    :param target_url: The URL to fetch
+    :return: The HTML of the page
+    """
+    if not USE_CACHE and not OFFLINE:
+        return fetch_text(target_url)
+    return get_response_cache().fetch_text(target_url)
+
+
+# check whether fetch_html can answer without the network
+def page_is_cached(target_url: str) -> bool:
+    """
+    Returns whether fetch_html answers a URL without sending a request (offline, or from a fresh cached copy), so the
+    crawl engine need not wait for a turn of its host
+    :param target_url: The URL to fetch
+    :return: A boolean representing whether no request is needed (true) or one is (false)
+    """
+    if not USE_CACHE and not OFFLINE:
+        return False
+    return get_response_cache().can_serve(target_url)
+
+
+# extract the paragraph text of a webpage
+def extract_raw_text(page) -> str:
+    """
+    Extracts the paragraph text of a webpage, without its scripts and styles
+    :param page: The HTML of the page, or a BeautifulSoup object of it (whose scripts and styles are removed)
+    :return: The text of the paragraphs of the page, one per line
+    """
+    soup = page if isinstance(page, BeautifulSoup) else BeautifulSoup(page, features='html.parser')
+
+    # Rip out all script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()
+
+    paragraphs = soup.select('p')
+    p_text = [p.text for p in paragraphs]
+    return '\n'.join(p_text)
+
+
+# write scraped text to a file
+def write_raw_text(target_url: str, raw_text: str, out_filename: str):
+    """
+    Writes the raw text of a webpage to a file, with the URL as the first line
+    :param target_url: The URL the text was scraped from
+    :param raw_text: The raw text scraped
+    :param out_filename: The file to save the raw text to
+    """
+    with open(out_filename, 'w', encoding='utf-8') as f:
+        # Write the URL as the first line
+        f.write(target_url + '\n')
+        # Write the rest of the text
+        f.write(raw_text)
+
+
 # scrape a webpage for text
 def scrape_raw_text(target_url: str, out_filename: str) -> str:
     """
@@ -232,38 +351,41 @@ def scrape_raw_text(target_url: str, out_filename: str) -> str:
         print("WARNING: Invalid arguments to scrape_raw_text")
         return "NONE"
 
-    # if 'consult robots.txt' is enabled and the webpage was not approved, reject
-    if CHECK_ROBOT:
-        if not approve_scrape(target_url):
-            return "NONE"
+    # if 'consult robots.txt' is enabled and the webpage is disallowed or was not approved, reject
+    if CHECK_ROBOT and not get_robots_policy().allowed(target_url):
+        return "NONE"
+    if APPROVE_ROBOT and not approve_scrape(target_url):
+        return "NONE"
 
     # fetch page information
     try:
-        html = request.urlopen(target_url).read().decode('utf8')
-    except:
-        print('Error requesting ' + target_url)
-        raise Exception('Request error')
+        html = fetch_html(target_url)
+    except RequestError as error:
+        print(error)
+        raise
 
-    soup = BeautifulSoup(html, features='html.parser')
-
-    # Rip out all script and style elements
-    for script in soup(["script", "style"]):
-        script.extract()
-
-    paragraphs = soup.select('p')
-    p_text = [p.text for p in paragraphs]
-    raw_text = '\n'.join(p_text)
+    raw_text = extract_raw_text(html)
 
     # Write the raw text to a file
-    with open(out_filename, 'w', encoding='utf-8') as f:
-        # Write the URL as the first line
-        f.write(target_url + '\n')
-        # Write the rest of the text
-        f.write(raw_text)
+    write_raw_text(target_url, raw_text, out_filename)
 
     return raw_text
 
 
+# split scraped text into sentences
+def clean_sentences(raw_text: str) -> list[str]:
+    """
+    Joins the non-blank lines of scraped text and splits the result into sentences
+    :param raw_text: The raw text scraped from a page
+    :return: A list of the sentences of the text
+    """
+    # Filter out lines that are just white space
+    raw_lines = [line.strip() for line in raw_text.splitlines() if not re.match(r'^\s*$', line)]
+
+    cleaned_text = ' '.join(raw_lines)
+    return sent_tokenize(cleaned_text)
+
+
 # scrub a text file
 def clean_text(in_filename: str, out_filename: str):
     """
@@ -286,11 +408,7 @@ def clean_text(in_filename: str, out_filename: str):
         # Read the rest of the lines
         raw_lines = f.readlines()
 
-    # Filter out lines that are just white space
-    raw_lines = [line.strip() for line in raw_lines if not re.match(r'^\s*$', line)]
-
-    cleaned_text = ' '.join(raw_lines)
-    sentences = sent_tokenize(cleaned_text)
+    sentences = clean_sentences(''.join(raw_lines))
 
     # write to file
     with open(out_filename, 'w', encoding='utf-8') as f:
@@ -303,10 +421,16 @@ def clean_text(in_filename: str, out_filename: str):
 
 
 # function for gathering info from websites
-def scrape_and_clean(url_list: list[str]) -> dict[str, (str, str)]:
+def scrape_and_clean(url_list: list[str], max_concurrency: int = MAX_CONCURRENCY, per_host: int = PER_HOST_CONCURRENCY,
+                     first_index: int = 0, links: dict[str, list[str]] = None) -> dict[str, (str, str)]:
     """
-    Scrapes raw text from the url_list and cleans it into sentences
+    Scrapes raw text from the url_list and cleans it into sentences, downloading several pages at a time
     :param url_list: A list of URLs to scrape
+    :param max_concurrency: The largest number of pages downloaded at a time
+    :param per_host: The largest number of pages downloaded at a time from one host
+    :param first_index: The number of the first URL's files
+    :param links: A dictionary to store the links of each scraped page in, keyed by its URL (default: links are not
+    collected)
     :return: A dictionary of filenames keyed by their source URL
     """
     # Key: a URL string
@@ -318,29 +442,119 @@ def scrape_and_clean(url_list: list[str]) -> dict[str, (str, str)]:
         print("WARNING: invalid parameter to scrape_and_clean")
         return file_dict
 
-    # Scrape the data and tokenize into sentences
-    i = 0
+    # collect the URLs to scrape, without duplicates
+    targets = []
     for url in url_list:
         if not isinstance(url, str):
             print("WARNING: invalid URL found in URL list; skipped")
             continue
+        if url in targets:
+            continue
+        # if manual approval is enabled, ask before any page is downloaded
+        if APPROVE_ROBOT and not approve_scrape(url):
+            print("FILE rejected for {}.".format(url))
+            continue
+        targets.append(url)
+
+    # files are numbered by the position of their URL, so the names do not depend on download order
+    filenames = {url: ('raw_text_' + str(i) + '.txt', 'sentences_' + str(i) + '.txt')
+                 for i, url in enumerate(targets, first_index)}
+
+    # parse and clean a downloaded page; run by the crawl engine outside of its event loop
+    def save_page(url: str, html: str) -> (str, str):
+        raw_filename, clean_filename = filenames[url]
+        write_raw_text(url, extract_raw_text(html), raw_filename)
+        clean_text(raw_filename, clean_filename)
+        if links is not None:
+            links[url] = extract_links(html, url)
+        return filenames[url]
+
+    # Scrape the data and tokenize into sentences, skipping pages robots.txt disallows
+    crawled = crawl(targets, fetch_html, save_page, max_concurrency, per_host,
+                    get_robots_policy() if CHECK_ROBOT else None, page_is_cached)
+    for url in crawled['disallowed']:
+        print("FILE rejected by robots.txt for {}.".format(url))
+
+    # Skip adding to dictionary if there was an error
+    for url, error in crawled['errors'].items():
+        print(error if isinstance(error, RequestError) else 'Error requesting {0}: {1}'.format(url, error))
+    print('Scraped {pages} pages in {seconds:.2f} s ({pages_per_second:.1f} pages/s)'.format(**crawled))
+
+    # keep the order of the URL list
+    for url in targets:
+        if url in crawled['results']:
+            file_dict[url] = crawled['results'][url]
 
-        raw_filename = 'raw_text_' + str(i) + '.txt'
-        clean_filename = 'sentences_' + str(i) + '.txt'
+    return file_dict
 
-        # Skip adding to dictionary if there was an error
-        try:
-            # if the file was rejected for scraping, don't iterate i or save the file to the collection
-            if scrape_raw_text(url, raw_filename) == "NONE":
-                print("FILE rejected for {}.".format(url))
-                continue
-            clean_text(raw_filename, clean_filename)
-        except:
-            continue
 
-        file_dict[url] = (raw_filename, clean_filename)
-        i += 1
+# set up the frontier of a crawl
+def make_frontier(start_url: str, keyword_list: list[str], filters: list[str], max_depth: int = MAX_DEPTH,
+                  max_pages: int = MAX_PAGES) -> Frontier:
+    """
+    Creates the frontier of a crawl from a starting page, which ranks URLs by their keywords and rejects banned and
+    filtered URLs
+    :param start_url: The URL of the starting page
+    :param keyword_list: A list of words that make a URL more relevant
+    :param filters: A list of words that relevant URLs should not have
+    :param max_depth: The largest number of links between the starting page and a scraped page
+    :param max_pages: The largest number of pages scraped
+    :return: The frontier, holding the starting page
+    """
+    keyword_matcher = get_matcher(tuple(keyword_list))
+    filter_matcher = get_matcher(tuple(filters))
+
+    # a URL's relevance is the number of keywords it contains
+    def relevance(url: str) -> int:
+        return keyword_matcher.count(url)
+
+    # URLs of banned sites or with filtered words are never visited
+    def accept(url: str) -> bool:
+        return is_not_banned_url(url, True) and not filter_matcher.contains(url)
+
+    frontier = Frontier(max_depth, max_pages, relevance, accept)
+    frontier.add(start_url, 0)
+    return frontier
 
+
+# crawl outward from a page, breadth first
+def crawl_site(start_url: str, keyword_list: list[str], filters: list[str], max_depth: int = MAX_DEPTH,
+               max_pages: int = MAX_PAGES, max_concurrency: int = MAX_CONCURRENCY,
+               per_host: int = PER_HOST_CONCURRENCY) -> dict[str, (str, str)]:
+    """
+    Scrapes and cleans the pages reachable from a starting page, breadth first, visiting the URLs with the most keywords
+    first within each depth
+    :param start_url: The URL of the starting page
+    :param keyword_list: A list of words that make a URL more relevant
+    :param filters: A list of words that relevant URLs should not have
+    :param max_depth: The largest number of links between the starting page and a scraped page
+    :param max_pages: The largest number of pages scraped
+    :param max_concurrency: The largest number of pages downloaded at a time
+    :param per_host: The largest number of pages downloaded at a time from one host
+    :return: A dictionary of filenames keyed by their source URL
+    """
+    file_dict = {}
+    frontier = make_frontier(start_url, keyword_list, filters, max_depth, max_pages)
+
+    # number of the first files of the next depth; a depth numbers every one of its URLs, even those that fail or
+    # are disallowed, so it can not be the number of pages scraped
+    first_index = 0
+
+    # scrape one depth at a time, queueing the links of its pages for the next
+    level = frontier.next_level()
+    while level:
+        depth = level[0][1]
+        links = {}
+        file_dict.update(scrape_and_clean([url for url, _ in level], max_concurrency, per_host, first_index, links))
+        first_index += len(level)
+        for page_links in links.values():
+            for link in page_links:
+                frontier.add(link, depth + 1)
+        print('Depth {0}: {1} pages scraped, {2} URLs seen, {3} waiting'.format(
+            depth, len(file_dict), len(frontier.seen), len(frontier)))
+        level = frontier.next_level()
+
+    frontier.close()
     return file_dict
 
 
@@ -427,12 +641,15 @@ def tf_ids(filename_list: list[str]) -> list:
     return [occurrence[0] for occurrence in occurrences]
 
 
-def scrape(url: str, filter_pos: list[str], filter_neg: list[str]):
+def scrape(url: str, filter_pos: list[str], filter_neg: list[str], max_depth: int = MAX_DEPTH,
+           max_pages: int = MAX_PAGES):
     """
-    Scrapes one page deep for all URLs in a given starting position
+    Scrapes max_depth pages deep (default one) for all URLs in a given starting position
     :param url: string representing starting URL
-    :param filter_pos: list of strings representing words a URL must possess
+    :param filter_pos: list of strings representing words that make a URL more relevant (visited first)
     :param filter_neg: list of strings representing words a URL may not possess
+    :param max_depth: largest number of links between the starting URL and a scraped page
+    :param max_pages: largest number of pages scraped
     :return: a dictionary mapping urls to raw text files (raw text, clean text)
     file_clean is a dictionary mapping urls to cleaned text files
     """
@@ -459,14 +676,8 @@ def scrape(url: str, filter_pos: list[str], filter_neg: list[str]):
             return file_dict
 
     # function begin======================
-    # Scrape a list of URLs from the starting URL
-    urls = gather_urls(start_url, filter_pos, filter_neg)
-
-    # Put the starting URL into the list of pages to scrape for content
-    urls.append(start_url)
-
-    # scrape web content
-    file_dict = scrape_and_clean(urls)
+    # scrape web content outward from the starting URL
+    file_dict = crawl_site(url, filter_pos, filter_neg, max_depth, max_pages)
 
     # For testing without doing all scraping
     # filenames = ['sentences_' + str(i) + '.txt' for i in range(0,5)]
@@ -514,65 +725,22 @@ def most_frequent_terms(files: list[str]) -> list:
 
 def create_database(db_name: str, files: list[str], keyword_list: list[str]):
     """
-    Creates an SQLite database of sentences and
+    Creates an SQLite database of sentences and their keywords, loaded in bulk (see fact_loader.py)
     :param db_name: Name of the database file
     :param files: List of files to search for relevant sentences
     :param keyword_list: List of keywords that identify relevant sentences
     :return:
     """
-    # Open the database
-    connection = sqlite3.connect(db_name)
-    cursor = connection.cursor()
-    # Enable foreign keys for the tags table
-    connection.execute("PRAGMA foreign_keys = 1")
-
-    # Delete old entries
-    cursor.execute("DROP TABLE IF EXISTS tags")
-    cursor.execute("DROP TABLE IF EXISTS facts")
-    connection.commit()
-
-    # Initialize the tables
-    cursor.execute("CREATE TABLE IF NOT EXISTS facts ( "
-                   "sentence TEXT NOT NULL, "
-                   "source TEXT, "
-                   "PRIMARY KEY (sentence))")
-    cursor.execute("CREATE TABLE IF NOT EXISTS tags ("
-                   "sentence TEXT NOT NULL, "
-                   "tag TEXT NOT NULL, "
-                   "FOREIGN KEY (sentence) REFERENCES facts(sentence) ON DELETE CASCADE)")
-    connection.commit()
-
-    # Iterate over files
-    for file_from_set in files:
-        f = open(file_from_set, 'r', encoding='utf-8')
-        # The first line is the URL
-        url = f.readline()
-        # Read the rest of the lines
-        lines = f.readlines()
-        f.close()
-
-        # Each line has the potential to go into the database, but not all will
-        for line in lines:
-            # Each keyword in the sentence will be used as a tag in the database
-            for keyword in keyword_list:
-                if keyword.lower() in line.lower():
-                    # Check if this fact is already in database
-                    query = cursor.execute("SELECT * FROM facts WHERE sentence=?", (line,)).fetchall()
-                    # If fact not in database, add it
-                    if not query:
-                        cursor.execute("INSERT INTO facts VALUES (?, ?)", (line, url,))
-                        connection.commit()
-                    # Add the tag
-                    cursor.execute("INSERT INTO tags VALUES (?, ?)", (line, keyword))
-                    connection.commit()
-
-    # Close the database connection
-    cursor.close()
-    connection.close()
+    counts = load_database(db_name, files, keyword_list)
+    print('Stored {facts} facts with {tags} tags in {0}'.format(db_name, **counts))
 
 
 # Main execution
 if __name__ == '__main__':
+    # the pipeline imports this module, so it is only imported when the crawler runs
+    from pipeline import run_pipeline
+    from fact_loader import DATABASE_FILE
+
     print('Web crawler')
 
     # Starting URL
@@ -580,22 +748,7 @@ if __name__ == '__main__':
     filter_words_positive = []
     filter_words_negative = ['wikimedia', 'wikipedia']
 
-    # generate file scraped dictionaries
-    # recommended to use this as few times as possible to avoid upsetting website hosts
-    files_dict = scrape(start_url, filter_words_positive, filter_words_negative)
-
-    # intermediate code: uncomment to load pickle when redesigning database from existing files
-    # with open(DICT_FILE, 'rb') as file:
-    #    files_dict = pickle.load(file)
-
-    # generate file list
-    file_list = [files_dict[file][1] for file in files_dict]
-
-    # process files
-    sorted_words = most_frequent_terms(file_list)
-
-    # Top 10 terms picked from most frequent terms
-    # keywords = sorted_words[:10]
+    # Keywords that tag the sentences stored in the database
     keywords = ['titanic',
                 'ship',
                 'maritime',
@@ -607,5 +760,14 @@ if __name__ == '__main__':
                 'sea',
                 'steel']
 
-    # Create database
-    create_database('database.db', file_list, keywords)
+    # crawl, clean and store every page as it arrives, without raw_text_N.txt and sentences_N.txt files; set
+    # DEBUG_DIRECTORY to write them there as well
+    # pages are kept in the response cache, so later runs only revalidate them; set OFFLINE to rebuild from the cache
+    result = run_pipeline(start_url, filter_words_positive, filter_words_negative, keywords, DATABASE_FILE,
+                          debug_directory=DEBUG_DIRECTORY)
+    print('Stored {facts} facts with {tags} tags from {pages} pages in {seconds:.2f} s'.format(**result))
+
+    # the most frequent terms, to pick keywords from
+    print('Most frequent words by count')
+    for i, word in enumerate(result['term_counts'].most_common(25)):
+        print(str(i + 1) + ': ' + str(word))